@@ -4,6 +4,8 @@
 ##### Date Created: Dec 14th 2024
 
 import os
+import json
+import functools
 from os.path import join as pjoin
 import pathlib
 from datetime import date
@@ -11,19 +13,27 @@ import pandas as pd
 pd.options.mode.chained_assignment = None #suppress chained assignment 
 
 import numpy as np
+import flask
 import dash
 from dash import dcc
 from dash import html 
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import plotly.graph_objs as go
+import plotly.offline
 from plotly.subplots import make_subplots
 import plotly.express as px
 from plotly.express.colors import sample_colorscale
-from apputils import (load_albion, load_bon, load_wash,
-                      calendar_template, create_lagged, 
-                      acartia_map_preproc, twm_map_preproc, 
-                      peak_srkw,
-                      apeak_df, srkw_peak_df)
+from apputils import (create_lagged, SightingGrid, sightings_map_rows, sightings_map_preproc,
+                      sightings_year_chunk, POD_BITS)
+from tracks import LOCATION_CLASSES
+from regions import load_regions
+from datastore import regions_file
+from figpack import pack_figure
+from httpcache import conditional_responses
+import dataplane
+from dataplane import DataPlane, load_snapshot
+import metrics
+from metrics import span
 
 #--------------------------Load And Process Data----------------------------#
 APP_PATH = str(pathlib.Path(__file__).parent.resolve())
@@ -42,50 +52,46 @@ twoyr=curyr-2
 ayl=[y for y in range(1980, curyr+1)] #year list for Albion
 byl=[y for y in range(1939, curyr+1)] #year list for Bonneville Dam
 twmyl=[y for y in range(1976, 2022)] #year list for TWM data
-#Define data path
-fos_path=pjoin(APP_PATH,'data/foschinook/')
-bon_path=pjoin(APP_PATH,'data/bonchinook/')
-lakewash_path=pjoin(APP_PATH,'data/lakewash/')
-acartia_path=pjoin(APP_PATH, 'data/acartia/')
-twm_path=pjoin(APP_PATH, 'data/twm/')
-srkw_path=pjoin(APP_PATH, 'data/')
-  
-#Load Bonneville data
-bonnev=load_bon(bon_path)
+#Define data path (DATA_PATH points the app at another data folder, e.g. synthetic data for benchmark.py)
+srkw_path=os.environ.get('DATA_PATH', pjoin(APP_PATH, 'data/'))
+fos_path=pjoin(srkw_path,'foschinook/')
+bon_path=pjoin(srkw_path,'bonchinook/')
+lakewash_path=pjoin(srkw_path,'lakewash/')
+acartia_path=pjoin(srkw_path, 'acartia/')
+twm_path=pjoin(srkw_path, 'twm/')
+store_path=pjoin(srkw_path, 'appstore')
 
-# Create calendar dataframes 
-cal=calendar_template(bonnev)
-calleap=calendar_template(bonnev, leap=True)
+# Load the prebuilt data store (see make_app_data.py), or build the same frames from csv files
+# Start up phases are timed with span() and reported on /metrics (see metrics.py)
+# The frames live in a snapshot of one data version (see dataplane.py): a running worker loads a new
+# store version in the background and swaps it in, so callbacks take d=plane.snapshot(version) and
+# read the frames from it instead of module globals
+reload_interval=int(os.environ.get('DATA_RELOAD_INTERVAL', 60)) # seconds between looks at the store, 0 for never
+plane=DataPlane(lambda phase: load_snapshot(srkw_path, store_path, curyr, APP_PATH, todaystr, phase),
+                store_path, curyr, interval=reload_interval)
 
-#Load Albion data
-albion, albsum=load_albion(fos_path)
-albion=calleap.merge(albion, how='left', on=['m','day'])
-# Create a combined data of Albion and Bonneville and create a lag 
-lagged=create_lagged(curyr, albion, bonnev, 10, 10)
+# Orca map figure cache, 4 pods x about 36 years fits in the default size
+map_cache_size=int(os.environ.get('MAP_CACHE_SIZE', 160))
+warm_map_cache=os.environ.get('WARM_MAP_CACHE', '0')=='1'
+# Send calendar x axes as day steps instead of 'Jan-1' labels (see figpack.py)
+compact_figures=os.environ.get('COMPACT_FIGURES', '1')=='1'
+# Also send numeric arrays as typed arrays, smaller json but larger once compressed (needs the newer plotly.js below)
+typed_arrays=os.environ.get('TYPED_ARRAYS', '0')=='1'
+# Maps with more sightings than this in view are drawn as clusters of the zoom level
+map_max_points=int(os.environ.get('MAP_MAX_POINTS', 1000))
+# Switch pods and years in the browser from sightings fetched once per year (see assets/orcamap.js),
+# the server only draws maps with more than map_max_points sightings
+client_maps=os.environ.get('CLIENT_MAPS', '0')=='1'
+# Fixes drawn per satellite tag track at most, longer tracks are thinned (see tracks.py)
+track_max_points=int(os.environ.get('TRACK_MAX_POINTS', 200))
 
-# Load Lake Washington data
-wash=load_wash(lakewash_path)
-
-twm_map_data=twm_map_preproc(2017, twm_path, "All pods")
-acartia_map_data=acartia_map_preproc(2023, acartia_path)
-
-# Calculating peak values of Chinook at Albion
-apeak, apeak95=apeak_df(curyr, fos_path, bon_path)
-# Calculating peak values of Orca sightings 
-srkw_cs_peak, srkw_cs_peak95=srkw_peak_df(curyr, twm_path, acartia_path)
-
-srkw_cs_pv, srkw_cs_pdt, srkw_cs_pdy, srkw_cs_df=peak_srkw(curyr, twm_path, acartia_path, src="both", loc="central salish")
-
-# Load The SRKW Population Data
-srkwdata=pd.read_csv(pjoin(APP_PATH, "data/SRKW.csv"))
-srkwdata_all=srkwdata[['year','JKL']]
-srkwdata_all=srkwdata_all.rename(columns={"JKL":"SRKW"})
-srkwdata_j=srkwdata[['year','J']]
-srkwdata_j=srkwdata_j.rename(columns={"J":"SRKW"})
-srkwdata_k=srkwdata[['year','K']]
-srkwdata_k=srkwdata_k.rename(columns={"K":"SRKW"})
-srkwdata_l=srkwdata[['year','L']]
-srkwdata_l=srkwdata_l.rename(columns={"L":"SRKW"})
+# Series the lag explorer compares, label: (first, second) as named in apputils.LagCorr
+lag_pairs={"Albion v Bonneville":("albion","bonneville"),
+           "Albion v Orca sightings":("albion","srkw"),
+           "Bonneville v Orca sightings":("bonneville","srkw")}
+lag_names={"albion":"Albion CPUE","bonneville":"Bonneville count","srkw":"Orca sightings"}
+# Sea regions the orca sightings can be narrowed to besides the legacy split (see data/regions.json)
+lag_regions=load_regions(regions_file(srkw_path))['salish_sea'].names
 
 # Define path to salmon map image
 salmon_map_path = 'assets/diagram_of_locations_v2.png'
@@ -108,6 +114,10 @@ plotly_fonts=["Arial, sans-serif", "Balto, sans-serif", "Courier New, monospace"
             "Times New Roman, Times, serif"]
 plotfont=plotly_fonts[10]
 
+# plotly.js bundled with the plotly package (dcc.Graph uses it instead of its own older copy)
+PLOTLYJS_VERSION=plotly.offline.get_plotlyjs_version()
+PLOTLYJS_URL='/_plotlyjs/plotly-'+PLOTLYJS_VERSION+'.min.js'
+
 # Initialize app
 app = dash.Dash(
     __name__,
@@ -116,12 +126,42 @@ app = dash.Dash(
         {"name": "description", "content": "Chinook Salmon Dashboard"}, 
         {"name": "news_keywords", "content": "Chinook, Salmon, Orca, Killer Whales, Puget Sound"}
         ],
+    external_scripts=[PLOTLYJS_URL] if typed_arrays else [],
+    compress=True, # gzip or brotli, whichever the browser accepts
     )
 server=app.server
+# Callback latency and size histograms, cache and memory gauges on /metrics
+# /metrics asks for the DATA_RELOAD_TOKEN bearer token when one is set
+metrics.install(server, lambda: plane.current.app_version, prefix=app.config.routes_pathname_prefix,
+                callbacks=lambda: app.callback_map, token=os.environ.get('DATA_RELOAD_TOKEN'))
+# ETag/Cache-Control on the layout and dependencies, 304 for repeat requests (max age from HTTP_MAX_AGE)
+conditional_responses(server, lambda: plane.current.app_version, prefix=app.config.routes_pathname_prefix)
+# Data version of this worker on /_data/version, reloads on POST /_data/reload with DATA_RELOAD_TOKEN
+dataplane.install(server, plane, token=os.environ.get('DATA_RELOAD_TOKEN'),
+                  prefix=app.config.routes_pathname_prefix+'_data/')
+
+@server.route(PLOTLYJS_URL)
+def plotlyjs():
+    return server.response_class(plotly.offline.get_plotlyjs(), mimetype='application/javascript',
+                                 headers={'Cache-Control':'public, max-age=31536000, immutable'})
+def figure_json(fig):
+    """
+    Figure as plain json types, packed for the browser when compact_figures is on
+    """
+    fig=json.loads(fig.to_json())
+    return pack_figure(fig, typed_arrays=typed_arrays) if compact_figures else fig
+
 #----------------------------------App Title------------------------------------#
 app.title='Chinook Salmon Dash Board'
 #----------------------------------App Layout-----------------------------------#
-app.layout = html.Div(
+# Sightings by year and orca line figures by pod for the browser to draw maps itself
+# (the orca-map-config store is added by serve_layout, per page load)
+orca_stores=[
+    dcc.Store(id="sightings-store", storage_type="memory"),
+    dcc.Store(id="orca-lines-store", storage_type="memory"),
+    dcc.Store(id="map-request", storage_type="memory"),
+] if client_maps else []
+page_layout = html.Div(
     id="root",
     children=[
             #Header,
@@ -328,6 +368,17 @@ app.layout = html.Div(
                                                                 },
                                                             ],
                                                         ),                                                        
+                                                    dcc.Checklist(
+                                                            value=[],
+                                                            className="track-toggle",
+                                                            id="track-toggle",
+                                                            options=[
+                                                                {
+                                                                    "label":" Satellite tag tracks",
+                                                                    "value":"tracks",
+                                                                },
+                                                            ],
+                                                        ),
                                                     ],
                                                 ),
                                                 dcc.Graph(
@@ -335,6 +386,7 @@ app.layout = html.Div(
                                                     id="orca-map",
                                                     animate=False,
                                                 ),
+                                                *orca_stores,
                                     ],
                                 ),
                                 #Right column
@@ -381,6 +433,65 @@ app.layout = html.Div(
                         ),
                     ],
                 ), 
+                #----------------------------Tab 3: Lag Explorer-----------------------------------#
+                dcc.Tab(
+                    label='Lag Explorer', 
+                    className='custom-tab',
+                    selected_className='custom-tab--selected',
+                    children=[
+                        #app
+                        html.Div(
+                            className="app-container", 
+                            children=[
+                                #Left Column
+                                html.Div(
+                                    className="left-column",
+                                    id="lag-container",
+                                    children=[
+                                        html.H6("Compare"),
+                                        dcc.Dropdown(
+                                            value="Albion v Orca sightings",
+                                            className="lag-dropdown",
+                                            id="lag-pair-dropdown",
+                                            options=[{"label":pair,"value":pair} for pair in lag_pairs],
+                                            clearable=False,
+                                        ),
+                                        html.H6("Orca sightings of"),
+                                        dcc.Dropdown(
+                                            value="All pods",
+                                            className="lag-dropdown",
+                                            id="lag-pod-dropdown",
+                                            options=[{"label":pod,"value":pod} for pod in ["All pods","J pod","K pod","L pod"]],
+                                            clearable=False,
+                                        ),
+                                        dcc.Dropdown(
+                                            value="",
+                                            className="lag-dropdown",
+                                            id="lag-region-dropdown",
+                                            options=[
+                                                {"label":"Central Salish Sea and Puget Sound","value":""},
+                                                {"label":"Central Salish Sea","value":"central salish"},
+                                                {"label":"Puget Sound","value":"puget sound"},
+                                            ]+[{"label":"Region: "+name,"value":name} for name in lag_regions],
+                                            clearable=False,
+                                        ),
+                                        html.P("Each row is one year: the correlation of the first series on a day with the second series the given number of days later. A positive lag means the second series follows the first. The line below pools all years, its highest point is the lag that lines the two up best."),
+                                    ],
+                                ),
+                                #Right Column
+                                html.Div(
+                                    className="right-column", 
+                                    children=[
+                                        dcc.Graph(
+                                            className="lag-corr",
+                                            id="lag-corr",
+                                        ),
+                                    ],
+                                ),
+                            ],
+                        ),
+                    ],
+                ),
             ],
         ),       
     ],
@@ -397,6 +508,17 @@ app.layout = html.Div(
     ],
 )
 def update_salmon_timeseries(location_dropdown):
+    return salmon_timeseries_figure(location_dropdown, plane.current.version)
+
+@functools.lru_cache(maxsize=16)
+def salmon_timeseries_figure(location_dropdown, version):
+    """
+    Build the salmon time series of one location
+    The salmon frames only change with the data version, so each figure is built once per
+    version (at start up and before a reload goes live, see below) and kept as plain json types
+    """
+    d=plane.snapshot(version)
+    bonnev, albion, wash, lagidx=d.bonnev, d.albion, d.wash, d.lagidx
     if location_dropdown=="Bonneville Dam":
         # Define salmon time seires
         title='Bonneville Dam Adult Chinook Catch Count 3 recent years vs History'
@@ -719,11 +841,11 @@ def update_salmon_timeseries(location_dropdown):
     elif location_dropdown=="Albion v Bonneville":
         # Define salmon time seires
         if today.month<=4:
-            albbon=create_lagged(curyr, albion, bonnev, 0, 0)
-            albbon_ly=create_lagged(lastyr, albion, bonnev, 0, 0)
+            albbon=create_lagged(curyr, albion, bonnev, 0, 0, index=lagidx)
+            albbon_ly=create_lagged(lastyr, albion, bonnev, 0, 0, index=lagidx)
             albbon=albbon.merge(albbon_ly[['m','day','chin'+str(lastyr),'cpue'+str(lastyr)]], how='left',on=['m','day'])
         else:
-            albbon=create_lagged(curyr, albion, bonnev, 0, 0)
+            albbon=create_lagged(curyr, albion, bonnev, 0, 0, index=lagidx)
         title='Albion Chinook vs Bonneville Dam'
         ylab='CPUE'
         xlab='Date'
@@ -880,27 +1002,120 @@ def update_salmon_timeseries(location_dropdown):
                                     ),
             )
         fig_salmon.update_traces(connectgaps=True)
-    return fig_salmon
+    return figure_json(fig_salmon)
 
 #~~~~~~~~~~~~~~~~~~~~~Orca Map~~~~~~~~~~~~~~~~~~~~#
-@app.callback(
-    Output("orca-map", "figure"),
-    [
-        Input("pod-dropdown", "value"),
-        Input("year-dropdown","value")
-    ],
-)
+def update_orca_map(pod,year,relayout,tracks=None):
+    d=plane.current
+    mask=sightings_map_rows(d.sightings, year, pod)
+    triggered=[t['prop_id'] for t in dash.callback_context.triggered]
+    if mask.sum()<=map_max_points:
+        # small map: every sighting is already on it, zooming and panning change nothing
+        if triggered==['orca-map.relayoutData']:
+            return dash.no_update
+        return add_tracks(orca_map_figure(pod, year, d.version), pod, year, d.version, tracks)
+    return large_orca_map(pod, year, relayout, mask, d, tracks)
+
+def update_orca_map_request(request):
+    """
+    Server side map of a selection the browser sent back as too large to draw (client_maps mode),
+    from the data version of the page that sent it
+    """
+    d=plane.snapshot(request.get('version'))
+    return large_orca_map(request['pod'], request['year'], request['relayout'],
+                          sightings_map_rows(d.sightings, request['year'], request['pod']), d, request.get('tracks'))
+
+if client_maps:
+    app.clientside_callback(
+        ClientsideFunction(namespace="orcamap", function_name="update_map"),
+        [
+            Output("orca-map", "figure"),
+            Output("sightings-store", "data"),
+            Output("map-request", "data"),
+        ],
+        [
+            Input("pod-dropdown", "value"),
+            Input("year-dropdown","value"),
+            Input("orca-map","relayoutData"),
+            Input("track-toggle","value"),
+        ],
+        [
+            State("sightings-store", "data"),
+            State("orca-map-config", "data"),
+        ],
+    )
+    app.callback(
+        Output("orca-map", "figure", allow_duplicate=True),
+        Input("map-request", "data"),
+        prevent_initial_call=True,
+    )(update_orca_map_request)
+else:
+    app.callback(
+        Output("orca-map", "figure"),
+        [
+            Input("pod-dropdown", "value"),
+            Input("year-dropdown","value"),
+            Input("orca-map","relayoutData"),
+            Input("track-toggle","value"),
+        ],
+    )(update_orca_map)
+
+def large_orca_map(pod, year, relayout, mask, d, tracks=None):
+    """
+    Map of a selection with more than map_max_points sightings: the sightings in view,
+    clustered by zoom level when there are still too many
+    d: the data snapshot mask was taken from
+    """
+    zoom, bounds=map_view(relayout)
+    level, box=SightingGrid.view(zoom, bounds)
+    if d.map_grid.in_box(mask, box).sum()<=map_max_points:
+        level=None
+    return add_tracks(orca_map_figure(pod, year, d.version, level, box), pod, year, d.version, tracks)
+
+def map_view(relayout):
+    """
+    Zoom and bounds (west, south, east, north) of the map from its relayoutData
+    Before the first zoom or pan: the starting zoom and no bounds
+    """
+    zoom, bounds=6, None
+    if relayout:
+        zoom=relayout.get('mapbox.zoom', zoom)
+        corners=(relayout.get('mapbox._derived') or {}).get('coordinates')
+        if corners:
+            lons=[c[0] for c in corners]
+            lats=[c[1] for c in corners]
+            bounds=(min(lons), min(lats), max(lons), max(lats))
+    return zoom, bounds
+
 #%%
-def update_orca_map(pod,year):
-    if year>2021:      
-        srkw_dat=acartia_map_preproc(year, acartia_path, pod)
-    elif year>2017:
-        srkw_dat0=acartia_map_preproc(year, acartia_path, pod)
-        srkw_dat1=twm_map_preproc(year, twm_path, pod)
-        srkw_dat=pd.concat([srkw_dat0, srkw_dat1])
+@functools.lru_cache(maxsize=map_cache_size)
+def orca_map_figure(pod, year, version, level=None, box=None):
+    """
+    Build the orca map of one pod and year
+    Cached per (pod, year, data version) as plain json types, so a cache hit skips
+    building and validating the plotly figure; a new data version never hits old entries
+    level: grid level to cluster the sightings at (None for every sighting as its own marker)
+    box: only the sightings in these bounds (west, south, east, north)
+    """
+    d=plane.snapshot(version)
+    sightings, map_grid=d.sightings, d.map_grid
+    if level is None:
+        srkw_dat=sightings_map_preproc(sightings, year, pod)
+        if box is not None:
+            srkw_dat=srkw_dat[srkw_dat['longitude'].between(box[0], box[2]) & srkw_dat['latitude'].between(box[1], box[3])]
+        marker_size=7
     else:
-        srkw_dat=twm_map_preproc(year, twm_path, pod)
-    
+        srkw_dat=map_grid.clusters(sightings_map_rows(sightings, year, pod), zoom=level-3, box=box)
+        srkw_dat['year']=year
+        srkw_dat['mon_frac']=clr12pt[srkw_dat['m'].to_numpy(dtype=int)-1]
+        srkw_dat['size']=7+3*np.log2(srkw_dat['count'])
+        marker_size=None
+    return figure_json(orca_map_plot(srkw_dat, year, marker_size))
+
+def orca_map_plot(srkw_dat, year, marker_size):
+    """
+    Orca map of the sightings in srkw_dat (one marker per row, colored by month)
+    """
     # create an empty dataset with all months of the year
     empty_srkw_dat=pd.DataFrame()
     empty_srkw_dat['m']=list(range(1,13))
@@ -909,7 +1124,7 @@ def update_orca_map(pod,year):
 
     # find the current months if year = curyear
     if year==curyr:
-        max_m=max(srkw_dat.m)
+        max_m=srkw_dat.m.max() if len(srkw_dat)>0 else 0
         append_dat=empty_srkw_dat[empty_srkw_dat['m']>max_m]
         srkw_dat=pd.concat([srkw_dat, append_dat])
     else:
@@ -921,7 +1136,7 @@ def update_orca_map(pod,year):
             mode='markers',
             marker=go.scattermapbox.Marker(
                 color=srkw_dat.mon_frac,
-                size=7,
+                size=marker_size or srkw_dat['size'].fillna(7),
                 colorscale=viri12cl,
                 opacity=0.75,
                 showscale=True,
@@ -958,27 +1173,58 @@ def update_orca_map(pod,year):
         ),
     )
     return fig_orcamap
+
+def add_tracks(fig, pod, year, version, tracks):
+    """
+    Orca map figure with the satellite tag tracks of the pod and year on top, when the track layer is on
+    """
+    if not tracks:
+        return fig
+    return dict(fig, data=fig['data']+track_traces(pod, year, plane.snapshot(version).app_version))
+
+@functools.lru_cache(maxsize=map_cache_size)
+def track_traces(pod, year, version):
+    """
+    Satellite tag tracks of a pod in a year as map traces, one line per tagged animal
+    Every track is thinned to track_max_points fixes, so a long tag costs the map no more than a short one
+    version: an app version the plane has (snapshot(v).app_version), so every cache entry is real data
+    """
+    d=plane.snapshot(version)
+    tracks=d.tracks
+    start, end=str(year), str(year+1)
+    fig=go.Figure()
+    for a in tracks.in_window(start, end, None if pod=="All pods" else pod[0]):
+        fixes=tracks.frame.iloc[tracks.track(a, start, end, track_max_points)]
+        name=tracks.animals[a]+" ("+tracks.popid[a]+")"
+        color=plotlycl[a%len(plotlycl)]
+        fig.add_trace(go.Scattermapbox(
+            lat=fixes['latitude'],
+            lon=fixes['longitude'],
+            mode='lines+markers',
+            line=dict(width=2, color=color),
+            marker=dict(size=4, color=color),
+            name=name,
+            text=name+"<br>"+fixes['time'].dt.strftime('%Y-%m-%d %H:%M')+" "+
+                 fixes['lc'].map(dict(enumerate(LOCATION_CLASSES))),
+            hoverinfo='text',
+        ))
+    return figure_json(fig)['data']
+
 #%%
 #~~~~~~~~~~~~~~~~~~~~~Orca Time series~~~~~~~~~~~~~~~~~~~~#
-@app.callback(
-    Output("salmon-orca-timeseries", "figure"),
-    [
-        Input("pod-dropdown", "value"),
-    ],
-)
-def update_orca_lines(pod):
+def update_orca_lines(pod, version=None):
+    d=plane.snapshot(version)
+    apeak, apeak95, albsum=d.apeak, d.apeak95, d.albsum
+    srkw_cs_peak, srkw_cs_peak95=d.srkw_cs_peak, d.srkw_cs_peak95
+    srkw=d.srkwdata[pod]
     if pod=="All pods":
         pod_tag=""
-        srkw=srkwdata_all
     elif pod=="J pod":
         pod_tag="[J]"
-        srkw=srkwdata_j
     elif pod=="K pod":
         pod_tag="[K]"
-        srkw=srkwdata_k
     elif pod=="L pod":
         pod_tag="[L]"
-        srkw=srkwdata_l 
 
     fig_peak = make_subplots(rows=2,cols=1,
                          subplot_titles=['','Orca Population'],
@@ -1124,7 +1370,191 @@ def update_orca_lines(pod):
                                             )
                                 ),
         )
-    return fig_peak
+    return figure_json(fig_peak)
+
+if client_maps:
+    app.clientside_callback(
+        ClientsideFunction(namespace="orcamap", function_name="update_lines"),
+        [
+            Output("salmon-orca-timeseries", "figure"),
+            Output("orca-lines-store", "data"),
+        ],
+        Input("pod-dropdown", "value"),
+        [
+            State("orca-lines-store", "data"),
+            State("orca-map-config", "data"),
+        ],
+    )
+else:
+    app.callback(
+        Output("salmon-orca-timeseries", "figure"),
+        [
+            Input("pod-dropdown", "value"),
+        ],
+    )(update_orca_lines)
+
+#~~~~~~~~~~~~~~~~~~~~~Lag Explorer~~~~~~~~~~~~~~~~~~~~#
+@app.callback(
+    Output("lag-corr", "figure"),
+    [
+        Input("lag-pair-dropdown", "value"),
+        Input("lag-pod-dropdown", "value"),
+        Input("lag-region-dropdown", "value"),
+    ],
+)
+def update_lag_corr(pair, pod, region):
+    return lag_corr_figure(pair, pod, region, plane.current.version)
+
+@functools.lru_cache(maxsize=32)
+def lag_corr_figure(pair, pod, region, version):
+    """
+    Correlation of two daily series by year and lag (-60 to 60 days), and of all years pooled
+    Every year and lag comes out of one LagCorr.corr call (a few FFTs), cached per data version
+    """
+    a, b=lag_pairs[pair]
+    if "srkw" not in (a, b):
+        pod, region="All pods", ""
+    r, days, pooled=plane.snapshot(version).lagcorr.corr(a, b, pod=pod, region=region)
+    first, second=lag_names[a], lag_names[b]
+    if "srkw" in (a, b):
+        second=second+(" ["+pod[0]+"]" if pod!="All pods" else "")
+    fig_lag=make_subplots(rows=2, cols=1, row_heights=[0.7,0.3], shared_xaxes=True, vertical_spacing=0.04)
+    fig_lag.add_trace(
+        go.Heatmap(
+            x=r.columns,
+            y=r.index,
+            z=r.round(3).to_numpy(),
+            customdata=days.to_numpy(),
+            zmin=-1, zmax=1, zmid=0,
+            colorscale='RdBu_r',
+            colorbar=dict(title='r', len=0.7, y=1, yanchor='top'),
+            hovertemplate='%{y}, lag %{x} days: r=%{z} (%{customdata} days)<extra></extra>',
+        ), row=1, col=1,
+    )
+    best=pooled.idxmax() if pooled.notnull().any() else None
+    fig_lag.add_trace(
+        go.Scatter(
+            x=pooled.index,
+            y=pooled.round(3),
+            name='All years',
+            mode='lines',
+            hovertemplate='lag %{x} days: r=%{y}<extra></extra>',
+            line=go.scatter.Line(color=plotlycl[0]),
+            showlegend=False,
+        ), row=2, col=1,
+    )
+    if best is not None:
+        fig_lag.add_trace(
+            go.Scatter(
+                x=[best],
+                y=[round(pooled[best], 3)],
+                mode='markers+text',
+                text=['best lag '+str(best)+' days'],
+                textposition='top center',
+                hoverinfo='skip',
+                marker=go.scatter.Marker(color=markercl, size=9),
+                showlegend=False,
+            ), row=2, col=1,
+        )
+    fig_lag.update_yaxes(title_text="Year", autorange="reversed", row=1, col=1)
+    fig_lag.update_yaxes(title_text="r, all years", zeroline=True, row=2, col=1)
+    fig_lag.update_xaxes(title_text="Lag (days), "+second+" after "+first, row=2, col=1)
+    fig_lag.update_layout(
+            paper_bgcolor=bgcl, 
+            plot_bgcolor=bgcl,
+            margin=dict(l=0, t=30, b=0, r=0, pad=0),
+            font=dict(
+                family=plotfont, 
+                size=11, 
+                color=framecl,
+            ),
+            title=dict(text = first+" v "+second+": correlation by lag",
+                                x = 0.02,
+                                y = 1,
+                                xanchor = 'left',
+                                yanchor = 'top',
+                                font = dict(
+                                            family='Arial, sans-serif',
+                                            size = 16,
+                                            )
+                                ),
+        )
+    return figure_json(fig_lag)
+
+#~~~~~~~~~~~~~~~~~~~~~Data for the browser (client_maps)~~~~~~~~~~~~~~~~~~~~#
+# URLs carry the app version, so a response can be cached for good; a page of a version the
+# worker no longer has (two reloads ago) gets current data, not cached
+# Years of the map year dropdown, any other year in a URL is a 404
+map_years=range(1990, curyr+1)
+
+def versioned(version, response):
+    fixed=plane.snapshot(version).app_version==version
+    response.headers['Cache-Control']='public, max-age=31536000, immutable' if fixed else 'no-cache'
+    return response
+
+@functools.lru_cache(maxsize=2)
+def orca_map_config(version):
+    """
+    What assets/orcamap.js needs to draw maps: data URLs, an empty map to fill in, month colors,
+    pod bits and the point limit
+    """
+    d=plane.snapshot(version)
+    empty=sightings_map_preproc(d.sightings.iloc[:0], 0)
+    return {
+        'url':app.get_relative_path('/_orcamap/'+d.app_version+'/'),
+        'version':d.app_version,
+        'template':json.loads(orca_map_plot(empty, 0, 7).to_json()),
+        'month_colors':list(clr12pt),
+        'pod_bits':POD_BITS,
+        'max_points':map_max_points,
+        'curyr':curyr,
+    }
+
+@server.route('/_orcamap/<version>/sightings/<int:year>.json')
+def orca_map_sightings(version, year):
+    if year not in map_years:
+        flask.abort(404)
+    return versioned(version, flask.jsonify(sightings_year_chunk(plane.snapshot(version).sightings, year)))
+
+@server.route('/_orcamap/<version>/tracks/<pod>/<int:year>.json')
+def orca_map_tracks(version, pod, year):
+    if pod not in POD_BITS or year not in map_years:
+        flask.abort(404)
+    # cached under the version the plane resolves it to, not whatever the URL says
+    return versioned(version, flask.jsonify(track_traces(pod, year, plane.snapshot(version).app_version)))
+
+@server.route('/_orcamap/<version>/lines/<pod>.json')
+def orca_lines_figure(version, pod):
+    if pod not in POD_BITS:
+        flask.abort(404)
+    return versioned(version, flask.jsonify(update_orca_lines(pod, plane.snapshot(version).app_version)))
+
+# The map config needs the figure code above, so the layout is set here; with client_maps every
+# page load gets the config of the data version served at that moment, in a root of its own so
+# concurrent page loads never share (or overwrite) the config store
+def serve_layout():
+    config=dcc.Store(id="orca-map-config", storage_type="memory", data=orca_map_config(plane.current.app_version))
+    return html.Div(id="root", children=page_layout.children+[config])
+app.layout=serve_layout if client_maps else page_layout
+
+# Build the salmon figures of a data version before it is served: at start up, and on every
+# reload before the swap (plane.on_swap), so the first page after a reload is as fast as before
+salmon_locations=["Albion v Bonneville","Albion","Bonneville Dam","Lake Washington"]
+def warm_figures(d, phase=''):
+    with span(phase+'warm_salmon_figures'):
+        for location in salmon_locations:
+            salmon_timeseries_figure(location, d.version)
+    # Build every map figure now instead of on first click
+    if warm_map_cache:
+        with span(phase+'warm_map_cache'):
+            for pod in ["L pod","K pod","J pod","All pods"]:
+                for year in range(1990, curyr+1):
+                    orca_map_figure(pod, year, d.version)
+warm_figures(plane.current)
+plane.on_swap=lambda d: warm_figures(d, 'reload.')
+metrics.watch_cache('salmon_timeseries', salmon_timeseries_figure)
+metrics.watch_cache('orca_map', orca_map_figure)
+metrics.watch_cache('track_traces', track_traces)
 
 if __name__ == '__main__':
     app.run_server(debug=True)
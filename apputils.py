@@ -9,6 +9,7 @@ import pandas as pd
 pd.options.mode.chained_assignment = None #suppress chained assignment 
 import numpy as np
 from utils import str2mon, conv_npdt64, conv_to_date
+from regions import load_regions, OTHER
 import dash
 from dash import dcc
 from dash import html 
@@ -19,47 +20,58 @@ import plotly.express as px
 from plotly.express.colors import sample_colorscale
 
 ## ----------------Functions to process salmon data ---------------------##
+def read_years(path, prefix, years, usecols):
+    """
+    Read per-year csv files (e.g. fos1980.csv, fos1981.csv...) into one long data frame with a year column
+    Numbers may have thousands separators ("15,400" in older FOS files)
+    """
+    frames=[]
+    for y in years:
+        d=pd.read_csv(path+prefix+str(y)+'.csv', usecols=usecols, thousands=',')
+        d['year']=y
+        frames.append(d)
+    return pd.concat(frames, ignore_index=True)
+
+def pivot_years(long, value, prefix, years):
+    """
+    Pivot a long data frame (year, m, day, value) to one column per year, newest year first
+    Example data frame
+    day m chin2025 chin2024 ...
+    1   1 NaN      NaN
+    """
+    wide=long.set_index(['m','day','year'])[value].unstack('year')
+    wide=wide.reindex(columns=sorted(years, reverse=True))
+    wide.columns=[prefix+str(y) for y in wide.columns]
+    wide=wide.sort_index().reset_index()
+    return wide[['day','m']+[prefix+str(y) for y in sorted(years, reverse=True)]]
+
 def load_albion(fos_path):
     curyr=date.today().year
     ayl=[y for y in range(1980, curyr+1)] #year list for Albion
-    albion=pd.DataFrame(columns=['day','m'])
-    albion_cpue=[] # Albion cpue sum
-    for i in reversed(range(len(ayl))):
-        d=pd.read_csv(fos_path+'fos'+str(ayl[i])+'.csv',\
-            usecols=['day','mon','cpue1'])
-        s=sum(d['cpue1'])
-        albion_cpue.append(s)
-        d['m']=d['mon'].apply(lambda x: dt.strptime(x, '%b').month)
-        d=d.drop(columns='mon')
-        d=d.rename(columns={'cpue1':'cpue'+str(ayl[i])})
-        albion=pd.merge(left=albion, right=d, how='outer', on=['m','day'], sort=True)
-    del(d,i,s)
+    d=read_years(fos_path, 'fos', ayl, usecols=['day','mon','cpue1'])
+    d['m']=d['mon'].map(str2mon)
+    albion=pivot_years(d, 'cpue1', 'cpue', ayl)
     albion['cpue_hist']=albion.iloc[:,5:].mean(axis=1, skipna=True).round(decimals=2) #History up to 3 years ago
     albion['cpue_hist2']=albion.iloc[:,3:].mean(axis=1, skipna=True).round(decimals=2) #History up to last year
-    albion['month']=albion['m'].apply(lambda x: dt.strptime(str(x), '%m').strftime('%b'))
+    albion['month']=albion['m'].map(lambda x: calendar.month_abbr[x])
     #albion['date']=albion[['month','day']].apply(lambda x: '-'.join(x.values.astype(str)), axis="columns")
-    albionpd=pd.DataFrame({'year':ayl[:-1], 'alb_cpue':albion_cpue[:-1]}, columns=['year','alb_cpue'])
+    albion_cpue=d.groupby('year')['cpue1'].sum() # Albion cpue sum
+    albionpd=pd.DataFrame({'year':ayl[:-1], 'alb_cpue':albion_cpue.loc[ayl[:-1]].values}, columns=['year','alb_cpue'])
     return albion, albionpd
 
 def load_bon(bon_path):    
     curyr=date.today().year
     byl=[y for y in range(1939, curyr+1)] #year list for Bonneville Dam
-    bonnev=pd.DataFrame(columns=['day','m'])
-    for i in reversed(range(len(byl))):
-        d=pd.read_csv(bon_path+'bon'+str(byl[i])+'.csv',\
-            usecols=['Project','Date','Chin'])
-        d=d[d['Project']=='Bonneville']
-        d['Chin2']=d['Chin'].apply(lambda x: 0 if x<0 else x)
-        d['m']=pd.DatetimeIndex(d['Date']).month
-        d['day']=pd.DatetimeIndex(d['Date']).day
-        d=d.rename(columns={'Chin2':'chin'+str(byl[i])})
-        d=d.drop(columns=['Project','Date','Chin'])
-        bonnev=pd.merge(left=bonnev, right=d, how='outer', on=['m','day'], sort=True)
-    del(d,i)
+    d=read_years(bon_path, 'bon', byl, usecols=['Project','Date','Chin'])
+    d=d[d['Project']=='Bonneville']
+    d['Chin2']=d['Chin'].clip(lower=0)
+    d['m']=pd.DatetimeIndex(d['Date']).month
+    d['day']=pd.DatetimeIndex(d['Date']).day
+    bonnev=pivot_years(d, 'Chin2', 'chin', byl)
     bonnev['chin_hist']=bonnev.iloc[:,5:].mean(axis=1, skipna=True).round(decimals=1)#History up to 3 years ago
     bonnev['chin_hist2']=bonnev.iloc[:,3:].mean(axis=1, skipna=True).round(decimals=1)#History up to last year
-    bonnev['month']=bonnev['m'].apply(lambda x: dt.strptime(str(x), '%m').strftime('%b'))
-    bonnev['date']=bonnev[['month','day']].apply(lambda x: '-'.join(x.values.astype(str)), axis="columns")
+    bonnev['month']=bonnev['m'].map(lambda x: calendar.month_abbr[x])
+    bonnev['date']=bonnev['month']+'-'+bonnev['day'].astype(str)
     return bonnev
 
 def load_wash(path):    
@@ -104,518 +116,636 @@ def calendar_template(bonnev, leap=False):
         cal=cal.drop(columns=['date1'])
     return cal
 
+def day_of_year_index(m, day, leap=False):
+    """
+    Days since Jan 1 (Jan 1 is 0) of month/day arrays in a leap or non-leap year, -1 for Feb-29 of a non-leap year
+    """
+    m=np.asarray(m, dtype=int)
+    day=np.asarray(day, dtype=int)
+    mdays=np.array([calendar.monthrange(2020 if leap else 2021, i)[1] for i in range(1, 13)])
+    start=np.concatenate([[0], np.cumsum(mdays)[:-1]])
+    doy=start[m-1]+day-1
+    return np.where(day<=mdays[m-1], doy, -1)
+
+def by_day_of_year(doy, n):
+    """
+    Row position of every day of the year (-1 where a day has no row)
+    """
+    pos=np.full(n, -1)
+    ok=doy>=0
+    pos[doy[ok]]=np.arange(len(doy))[ok]
+    return pos
+
+def take(values, pos):
+    """
+    values[pos] with NaN where pos is -1
+    """
+    out=np.asarray(values, dtype=float)[np.where(pos<0, 0, pos)]
+    out[pos<0]=np.nan
+    return out
+
+class LagIndex:
+    """
+    Day of year index of the Albion and Bonneville wide data, built once and reused by create_lagged()
+    Albion is lagged around a non-leap calendar (days shifted past Jan 1 wrap to Dec 31, Feb-29 is dropped),
+    Bonneville is lagged within its own year (days shifted out of the year are dropped)
+    """
+    def __init__(self, albion, bonnev):
+        self.albion=albion
+        self.bonnev=bonnev
+        self.cal={False:calendar_template(bonnev).reset_index(drop=True),
+                  True:calendar_template(bonnev, leap=True).reset_index(drop=True)}
+        # target rows: day of year in the year's own calendar and in the non-leap calendar albion is lagged in
+        self.cal_doy={leap:day_of_year_index(c['m'], c['day'], leap) for leap, c in self.cal.items()}
+        self.cal_doy365={leap:day_of_year_index(c['m'], c['day']) for leap, c in self.cal.items()}
+        # source rows: albion and bonneville row of every day of the year
+        self.alb_pos=by_day_of_year(day_of_year_index(albion['m'], albion['day']), 365)
+        self.bon_pos={leap:by_day_of_year(day_of_year_index(bonnev['m'], bonnev['day'], leap), 366 if leap else 365)
+                      for leap in (False, True)}
+
+    def shift(self, year, lag1, lag2):
+        """
+        Lagged values for one or many lags at once (lag1 and lag2 scalars or arrays of the same length)
+        Returns chin, chin_hist, cpue, cpue_hist, each an array of shape (number of lags, days in year)
+        """
+        leap=calendar.isleap(year)
+        ndays=366 if leap else 365
+        lag1=np.atleast_1d(np.asarray(lag1, dtype=int))[:, None]
+        lag2=np.atleast_1d(np.asarray(lag2, dtype=int))[:, None]
+        # Bonneville: day d of the lagged year is day d+lag2 of the same year
+        src=self.cal_doy[leap][None, :]+lag2
+        pos=np.where((src>=0) & (src<ndays), self.bon_pos[leap][np.clip(src, 0, ndays-1)], -1)
+        chin=take(self.bonnev['chin'+str(year)], pos)
+        chin_hist=take(self.bonnev['chin_hist'], pos)
+        # Albion: day d of the lagged year is day d+lag1 of the non-leap calendar (no value on Feb-29)
+        doy=self.cal_doy365[leap][None, :]
+        pos=np.where(doy>=0, self.alb_pos[(doy+lag1)%365], -1)
+        cpue=take(self.albion['cpue'+str(year)], pos)
+        cpue_hist=take(self.albion['cpue_hist'], pos)
+        return chin, chin_hist, cpue, cpue_hist
+
+    def frames(self, year, lags):
+        """
+        One create_lagged() data frame per (lag1, lag2) pair, computed in one batch
+        """
+        lags=list(lags)
+        if len(lags)==0:
+            return {}
+        lag1, lag2=zip(*lags)
+        chin, chin_hist, cpue, cpue_hist=self.shift(year, lag1, lag2)
+        cal=self.cal[calendar.isleap(year)]
+        cols={c:cal[c].to_numpy() for c in cal.columns}
+        return {lag:pd.DataFrame({**cols, 'chin'+str(year):chin[i], 'chin_hist':chin_hist[i],
+                                  'cpue'+str(year):cpue[i], 'cpue_hist':cpue_hist[i]}, copy=False)
+                for i, lag in enumerate(lags)}
+
 def create_lagged(year, 
     albion, #albion data in wide format
     bonnev, #bonneville data in wide format     
     lag1, # Albion lag
-    lag2  # Bonneville lag
+    lag2, # Bonneville lag
+    index=None # LagIndex(albion, bonnev), built on the fly if not given
     ):
-    # Create calendar dataframes 
-    cal=calendar_template(bonnev)
-    cal_leap=calendar_template(bonnev, leap=True)
-    # Create Albion lag dataset
-    albion_lagged=albion[['date','cpue'+str(year),'cpue_hist']]
-    if calendar.isleap(year)==False:
-        albion_lagged=albion_lagged[albion_lagged['date']!='Feb-29']
-    albion_lagged['date1']=pd.to_datetime(albion_lagged['date'], errors='coerce', format='%b-%d')
-    albion_lagged['date2']=albion_lagged['date1'] - pd.Timedelta(days=lag1)
-    albion_lagged['m']=pd.DatetimeIndex(albion_lagged['date2']).month
-    albion_lagged['day']=pd.DatetimeIndex(albion_lagged['date2']).day
-    albion_lagged=albion_lagged.drop(columns=['date','date1','date2'])
-    # Create Bonneville Dam lagged dataset
-    bonnev_lagged=bonnev[['date','chin'+str(year),'chin_hist']]
-    if calendar.isleap(year)==False:
-        bonnev_lagged=bonnev_lagged[bonnev_lagged['date']!='Feb-29']
-    bonnev_lagged['date1']=pd.to_datetime(bonnev_lagged['date'].apply(lambda x: str(year)+'-'+x), errors='coerce',format='%Y-%b-%d')
-    bonnev_lagged['date2']=bonnev_lagged['date1'] - pd.Timedelta(days=lag2)
-    bonnev_lagged['year2']=pd.DatetimeIndex(bonnev_lagged['date2']).year
-    bonnev_lagged['m']=pd.DatetimeIndex(bonnev_lagged['date2']).month
-    bonnev_lagged['day']=pd.DatetimeIndex(bonnev_lagged['date2']).day
-    bonnev_lagged=bonnev_lagged[bonnev_lagged['year2']==year]
-    bonnev_lagged=bonnev_lagged.drop(columns=['date','date1','date2','year2'])
-    #Combine Albion and Bonneville lagged data
-    if calendar.isleap(year)==False:
-        lagged=cal.merge(bonnev_lagged, how='left', on=['m','day'])
-    else:
-        lagged=cal_leap.merge(bonnev_lagged, how='left', on=['m','day'])
-    lagged=lagged.merge(albion_lagged, on=['m','day'], how='left')
-    return lagged
+    if index is None:
+        index=LagIndex(albion, bonnev)
+    return index.frames(year, [(lag1, lag2)])[(lag1, lag2)]
 
-## ----------------Functions to make data for SRKW map ---------------------##
-def acartia_map_preproc(year, acartia_path, pod="All pods"):
+def create_lagged_many(year, albion, bonnev, lags, index=None):
     """
-    Function to process arcartia srkw data for maps
-    1) make make day of year and mon_frac for colorbar scaling 
-    2) make tag and source variable 
-    3) if a pod is specified, filter out other pod data 
+    create_lagged() for many (lag1, lag2) pairs in one call, returns {(lag1, lag2): data frame}
     """
-    clr12pt=np.linspace(0.083,1,12)
-    srkwc=pd.read_csv(acartia_path+"srkw_"+str(year)+".csv")
-    srkwc=srkwc[~srkwc.date.isnull()]
-    srkwc['date2']=pd.to_datetime(srkwc['date_ymd'],format='%Y-%m-%d', errors='coerce')
-    srkwc['mon']=srkwc['date2'].apply(lambda x: x.month)
-    srkwc['mon_frac']=srkwc['mon'].apply(lambda x: clr12pt[int(x)-1])
-    srkwc['day_of_year']=srkwc['date_ymd'].apply(lambda x: pd.Period(x, freq='D').day_of_year)
-    srkwc['tag']="[Acartia]"+srkwc['created']
-    srkwc['source']='arcartia'
-    srkwc_k=srkwc[srkwc.K==1].reset_index()
-    srkwc_l=srkwc[srkwc.L==1].reset_index()
-    srkwc_j=srkwc[srkwc.J==1].reset_index()
-    if pod=="L pod":
-        srkw_dat=srkwc_l
-    elif pod=="K pod":
-        srkw_dat=srkwc_k
-    elif pod=="J pod":
-        srkw_dat=srkwc_j
-    elif pod=="All pods":
-        srkw_dat=srkwc[srkwc.srkw==1]
-    return srkw_dat
+    if index is None:
+        index=LagIndex(albion, bonnev)
+    return index.frames(year, lags)
 
-def twm_map_preproc(year, twm_path, pod="All pods"):
+## ----------------Functions to make data for SRKW map ---------------------##
+def load_sightings(acartia_path, twm_path, regions=None):
     """
-    Function to process twm srkw data for maps
-    1) make make day of year and mon_frac for colorbar scaling 
-    2) make tag and source variable 
-    3) if a pod is specified, filter out other pod data 
+    Function to stack arcartia and twm srkw data of all years into one long data frame for maps
+    Acartia rows come before TWM rows within a year, same as the map used to concat them
+    Every sighting gets its region once here, as categorical columns (see regions.py):
+    region is the salish_sea region set, legacy_region the old split ("central salish" north of
+    48.19437, "puget sound" south of it; TWM rows keep the central_salish/puget_sound flags of their files)
+    regions: load_regions() output, data/regions.json if not given
+    Example data frame
+    source   year m day_of_year created             latitude longitude J K L srkw tag                          region                           legacy_region
+    arcartia 2024 1 3           2024-01-03 21:44:00 48.54    -123.19   0 0 0 1    [Acartia]2024-01-03 21:44:00 Haro Strait and San Juan Islands central salish
     """
-    clr12pt=np.linspace(0.083,1,12)
-    srkwc=pd.read_csv(twm_path+"twm"+str(year)+".csv")
-    srkwc['mon_frac']=srkwc['Month'].apply(lambda x: clr12pt[int(x)-1])
-    srkwc['day_of_year']=srkwc['SightDate'].apply(lambda x: pd.Period(x, freq='D').day_of_year)
-    srkwc['created']=srkwc['SightDate']+" "+srkwc['Time1']
-    srkwc['tag']="[TWM]"+srkwc['created']
-    srkwc['source']='twm'
-    srkwc_k=srkwc[srkwc.k==1].reset_index()
-    srkwc_l=srkwc[srkwc.l==1].reset_index()
-    srkwc_j=srkwc[srkwc.j==1].reset_index()
-    if pod=="L pod":
-        srkw_dat=srkwc_l
-    elif pod=="K pod":
-        srkw_dat=srkwc_k
-    elif pod=="J pod":
-        srkw_dat=srkwc_j
-    elif pod=="All pods":
-        srkw_dat=srkwc
-    return srkw_dat[['created','mon_frac','latitude','longitude','tag','source']]
+    cols=['source','year','m','day_of_year','created','latitude','longitude','J','K','L','srkw',
+          'central_salish','puget_sound','tag']
+    acartia_files=sorted(pathlib.Path(acartia_path).glob('srkw_*.csv')) if acartia_path else []
+    twm_files=sorted(pathlib.Path(twm_path).glob('twm*.csv')) if twm_path else []
+    sightings=[]
+    for f in acartia_files:
+        srkwc=pd.read_csv(f)
+        srkwc=srkwc[~srkwc.date.isnull()]
+        srkwc['date2']=pd.to_datetime(srkwc['date_ymd'],format='%Y-%m-%d', errors='coerce')
+        srkwc['year']=int(f.stem.split('_')[1])
+        srkwc['m']=srkwc['date2'].dt.month
+        srkwc['day_of_year']=srkwc['date2'].dt.dayofyear
+        srkwc['tag']="[Acartia]"+srkwc['created']
+        srkwc['source']='arcartia'
+        srkwc['central_salish'], srkwc['puget_sound']=np.nan, np.nan # from the legacy region set below
+        sightings.append(srkwc[cols])
+    for f in twm_files:
+        srkwc=pd.read_csv(f)
+        srkwc['date2']=pd.to_datetime(srkwc['SightDate'],format='%Y-%m-%d')
+        srkwc['year']=int(f.stem[3:])
+        srkwc['m']=srkwc['Month']
+        srkwc['day_of_year']=srkwc['date2'].dt.dayofyear
+        srkwc['created']=srkwc['SightDate']+" "+srkwc['Time1']
+        srkwc['tag']="[TWM]"+srkwc['created']
+        srkwc['source']='twm'
+        srkwc=srkwc.rename(columns={'j':'J','k':'K','l':'L'})
+        srkwc['srkw']=1
+        sightings.append(srkwc[cols])
+    if len(sightings)==0:
+        sightings=pd.DataFrame(columns=cols)
+    else:
+        sightings=pd.concat(sightings)
+        sightings=sightings.sort_values(by='year', kind='stable').reset_index(drop=True)
+    return add_regions(sightings, regions)
 
-## ----------------Functions to make data for SRKW Lineplot ---------------------##
-def srkw_count(dat, count_orca=False):
+def add_regions(sightings, regions=None):
     """
-    Function to count srkw reports or counts by day 
-    Called in acartia_count_year() and twm_count_year()
+    Replace the central_salish/puget_sound flags with the region and legacy_region categorical columns
     """
-    if count_orca:
-        #print('Creating a daily average of number of orcas...')
-        dat=dat.loc[:, ['no_sighted', 'date_ymd']]
-        srkw_avg=dat.groupby(dat.date_ymd).mean().reset_index()
-        srkw_avg=srkw_avg.rename(columns={'date_ymd':'date','no_sighted':'count'})
-    else:
-        #print('Creating a daily count of reports...')
-        dat=dat.loc[:, ['date_ymd']]
-        srkw_avg=dat['date_ymd'].value_counts().reset_index()
-        srkw_avg=srkw_avg.rename(columns={'date_ymd':'count','index':'date'})
-        srkw_avg=srkw_avg.sort_values(by=['date'])
-    srkw_avg['day']=srkw_avg['date'].apply(lambda x: int(x.split('-')[2]))
-    srkw_avg['m']=srkw_avg['date'].apply(lambda x: int(x.split('-')[1]))
-    srkw_avg=srkw_avg.sort_values(by=['m','day'])
-    return srkw_avg
-
-def acartia_count_year(year, acartia_path, pod="All pods"):
+    regions=regions or load_regions()
+    lon, lat=sightings['longitude'].to_numpy(dtype=float), sightings['latitude'].to_numpy(dtype=float)
+    sightings['region']=regions['salish_sea'].classify(lon, lat)
+    legacy=regions['legacy']
+    code=legacy.codes_of(lon, lat)
+    twm=(sightings['source']=='twm').to_numpy()
+    flag=np.where(sightings['puget_sound']==1, legacy.names.index('puget sound'),
+                  np.where(sightings['central_salish']==1, legacy.names.index('central salish'), len(legacy.names)))
+    code[twm]=flag[twm]
+    sightings['legacy_region']=pd.Categorical.from_codes(code, categories=legacy.categories)
+    return sightings.drop(columns=['central_salish','puget_sound'])
+
+LEGACY_REGIONS=["central salish", "puget sound"] # region names of the legacy set in data/regions.json
+
+def region_mask(sightings, region):
     """
-    Function to make orca count data of a certain year and merge with salmon data
+    Mask of the sightings in a region: "central salish" or "puget sound" of the legacy split,
+    or a region of data/regions.json such as "Haro Strait and San Juan Islands" or "Puget Sound"
     """
-    srkwc=pd.read_csv(acartia_path+"srkw_"+str(year)+".csv")
-    srkwc['date2']=pd.to_datetime(srkwc['date_ymd'],format='%Y-%m-%d', errors='coerce')
-    entry_lat=48.19437 # Define the north and south puget sound latitude
-    srkwc['north_puget_sound']=srkwc['latitude'].apply(lambda x: 1 if x>entry_lat else 0)
-    srkwc_k=srkwc[srkwc.K==1].reset_index()
-    srkwc_l=srkwc[srkwc.L==1].reset_index()
-    srkwc_j=srkwc[srkwc.J==1].reset_index()
+    if region in LEGACY_REGIONS:
+        return (sightings['legacy_region']==region).to_numpy()
+    return (sightings['region']==region).to_numpy()
 
+def sightings_map_rows(sightings, year, pod="All pods"):
+    """
+    Mask of the sightings of a year and pod shown on the map
+    """
+    mask=(sightings['year']==year).to_numpy()
     if pod=="L pod":
-        srkw_dat=srkwc_l
+        mask&=(sightings['L']==1).to_numpy()
     elif pod=="K pod":
-        srkw_dat=srkwc_k
+        mask&=(sightings['K']==1).to_numpy()
     elif pod=="J pod":
-        srkw_dat=srkwc_j
+        mask&=(sightings['J']==1).to_numpy()
     elif pod=="All pods":
-        srkw_dat=srkwc[srkwc.srkw==1]
-    srkwc_north=srkw_dat[srkw_dat['north_puget_sound']==1]
-    srkwc_north_avg=srkw_count(srkwc_north, count_orca=False)
-    srkwc_north_avg.columns=['date','count_north','day','m']
-
-    srkwc_south=srkw_dat[srkw_dat['north_puget_sound']==0]
-    srkwc_south_avg=srkw_count(srkwc_south, count_orca=False)
-    srkwc_south_avg.columns=['date','count_south','day','m']
-
-    srkw_yrcount=srkw_count(srkwc, count_orca=False)
-    
-    # Add salmon data
-    salmon=create_lagged(year, 4, 10)
-    srkw_yrcount=srkw_yrcount.merge(salmon, left_on=['m','day'], right_on=['m','day'], how='right')
-    srkw_yrcount=srkw_yrcount.drop(columns=['date_x'])
-    srkw_yrcount=srkw_yrcount.rename(columns={'date_y':'date'})
-
-    # Add srkw count north of puget sound
-    srkw_yrcount=srkw_yrcount.merge(srkwc_north_avg, left_on=['m','day'], right_on=['m','day'], how='left')
-    srkw_yrcount=srkw_yrcount.drop(columns=['date_y'])
-    srkw_yrcount=srkw_yrcount.rename(columns={'date_x':'date'})
-
-    # Add srkw count in puget sound
-    srkw_yrcount=srkw_yrcount.merge(srkwc_south_avg, left_on=['m','day'], right_on=['m','day'], how='left')
-    srkw_yrcount=srkw_yrcount.drop(columns=['date_y'])
-    srkw_yrcount=srkw_yrcount.rename(columns={'date_x':'date'})
-
-    # Keep a subset of variables 
-    srkw_yrcount=srkw_yrcount[['date', 'm','day','count','count_north','count_south','chin'+str(year),'chin_hist','cpue'+str(year),'cpue_hist']]
-    srkw_yrcount.columns=['date','m','day','srkw','srkw_north','srkw_south','bon'+str(year),'bon_hist','alb'+str(year),'alb_hist']
-    return srkw_yrcount
+        mask&=(sightings['srkw']==1).to_numpy()
+    return mask
 
-# Load The Whale Museum Data 
-def twm_count_year(year, twm_path, pod="All pods"):
+def sightings_map_preproc(sightings, year, pod="All pods"):
+    """
+    Function to pick the srkw sightings of a year out of load_sightings() output for maps
+    The rows are those of sightings_map_rows(), with mon_frac added for the month colour scale
+    """
     clr12pt=np.linspace(0.083,1,12)
-    srkwc=pd.read_csv(twm_path+"twm"+str(year)+".csv")
-    # Define the north and south puget sound latitude
-    entry_lat=48.19437
-    srkwc['north_puget_sound']=srkwc['latitude'].apply(lambda x: 1 if x>entry_lat else 0)
-    srkwc['mon_frac']=srkwc['Month'].apply(lambda x: clr12pt[int(x)-1])
-    srkwc['day_of_year']=srkwc['SightDate'].apply(lambda x: pd.Period(x, freq='D').day_of_year)
-    srkwc['date_ymd']=srkwc['SightDate']
-    srkwc['created']=srkwc['SightDate']+" "+srkwc['Time1']
-    srkwc_k=srkwc[srkwc.k==1].reset_index()
-    srkwc_l=srkwc[srkwc.l==1].reset_index()
-    srkwc_j=srkwc[srkwc.j==1].reset_index()
-    if pod=="L pod":
-        srkw_dat=srkwc_l
-    elif pod=="K pod":
-        srkw_dat=srkwc_k
-    elif pod=="J pod":
-        srkw_dat=srkwc_j
-    elif pod=="All pods":
-        srkw_dat=srkwc
-
-    srkwc_north=srkw_dat[srkw_dat['north_puget_sound']==1]
-    srkwc_north_avg=srkw_count(srkwc_north, count_orca=False)
-    srkwc_north_avg.columns=['date','count_north','day','m']
-
-    srkwc_south=srkw_dat[srkw_dat['north_puget_sound']==0]
-    srkwc_south_avg=srkw_count(srkwc_south, count_orca=False)
-    srkwc_south_avg.columns=['date','count_south','day','m']
-
-    srkw_yrcount=srkw_count(srkwc, count_orca=False)
-    
-    # Add salmon data
-    salmon=create_lagged(year, 4, 10)
-    srkw_yrcount=srkw_yrcount.merge(salmon, left_on=['m','day'], right_on=['m','day'], how='right')
-    srkw_yrcount=srkw_yrcount.drop(columns=['date_x'])
-    srkw_yrcount=srkw_yrcount.rename(columns={'date_y':'date'})
-
-    # Add srkw count north of puget sound
-    srkw_yrcount=srkw_yrcount.merge(srkwc_north_avg, left_on=['m','day'], right_on=['m','day'], how='left')
-    srkw_yrcount=srkw_yrcount.drop(columns=['date_y'])
-    srkw_yrcount=srkw_yrcount.rename(columns={'date_x':'date'})
-
-    # Add srkw count in puget sound
-    srkw_yrcount=srkw_yrcount.merge(srkwc_south_avg, left_on=['m','day'], right_on=['m','day'], how='left')
-    srkw_yrcount=srkw_yrcount.drop(columns=['date_y'])
-    srkw_yrcount=srkw_yrcount.rename(columns={'date_x':'date'})
-
-    # Keep a subset of variables 
-    srkw_yrcount=srkw_yrcount[['date', 'm','day','count','count_north','count_south','chin'+str(year),'chin_hist','cpue'+str(year),'cpue_hist']]
-    srkw_yrcount.columns=['date','m','day','srkw','srkw_north','srkw_south','bon'+str(year),'bon_hist','alb'+str(year),'alb_hist']
+    srkw_dat=sightings[sightings_map_rows(sightings, year, pod)]
+    srkw_dat=srkw_dat.reset_index(drop=True)
+    srkw_dat['mon_frac']=clr12pt[srkw_dat['m'].to_numpy(dtype=int)-1]
+    return srkw_dat
 
-    return srkw_yrcount
+# Bit of each map pod selection in sightings_year_chunk()['pods'] (same rows as sightings_map_rows)
+POD_BITS={"J pod":1, "K pod":2, "L pod":4, "All pods":8}
 
+def sightings_year_chunk(sightings, year):
+    """
+    Compact columnar copy of the map sightings of one year for the browser (see assets/orcamap.js)
+    Rows of any pod, in sightings order, with the pods of each row as a bit mask of POD_BITS
+    """
+    d=sightings[sightings['year']==year]
+    pods=(d['J']==1)*POD_BITS["J pod"]+(d['K']==1)*POD_BITS["K pod"]+\
+         (d['L']==1)*POD_BITS["L pod"]+(d['srkw']==1)*POD_BITS["All pods"]
+    d, pods=d[pods>0], pods[pods>0]
+    return {
+        'year':int(year),
+        'lat':[None if np.isnan(v) else v for v in d['latitude'].astype(float).round(6)],
+        'lon':[None if np.isnan(v) else v for v in d['longitude'].astype(float).round(6)],
+        'm':d['m'].astype(int).tolist(),
+        'pods':pods.astype(int).tolist(),
+        'tag':d['tag'].tolist(),
+    }
+
+class SightingGrid:
+    """
+    Multi-resolution lat/lon grid over the sightings for clustering the map by zoom level
+    Grid level L has cells of 360/2**L degrees, about 32 pixels wide at map zoom L-3
+    Cell ids of every level are computed once; a query is a mask, a bounds filter and one groupby
+    Example: SightingGrid(sightings).clusters(sightings_map_rows(sightings, 2024), zoom=6)
+    """
+    levels=range(3, 18)
+    tile=16 # view bounds are rounded out to 16 cells, so panning a little reuses the same query
+
+    def __init__(self, sightings):
+        self.sightings=sightings
+        self.lat=sightings['latitude'].to_numpy(dtype=float)
+        self.lon=sightings['longitude'].to_numpy(dtype=float)
+        ok=~(np.isnan(self.lat) | np.isnan(self.lon))
+        self.cells={}
+        for level in self.levels:
+            n=2**level
+            ix=np.clip(np.floor((np.nan_to_num(self.lon)+180)/360*n), 0, n-1).astype('int64')
+            iy=np.clip(np.floor((np.nan_to_num(self.lat)+90)/360*n), 0, n-1).astype('int64')
+            self.cells[level]=np.where(ok, iy*n+ix, -1)
+
+    @classmethod
+    def level(cls, zoom):
+        return int(np.clip(np.floor(zoom)+3, cls.levels[0], cls.levels[-1]))
+
+    @classmethod
+    def view(cls, zoom, bounds=None):
+        """
+        Grid level of a map zoom and the view bounds (west, south, east, north) rounded out to whole tiles
+        Used as the cache key of a clustered map
+        """
+        level=cls.level(zoom)
+        if bounds is None:
+            return level, None
+        size=360/2**level*cls.tile
+        west, south, east, north=bounds
+        box=(np.floor(west/size)*size, np.floor(south/size)*size, np.ceil(east/size)*size, np.ceil(north/size)*size)
+        return level, tuple(round(float(b), 6) for b in box)
+
+    def in_box(self, mask, box=None):
+        if box is None:
+            return mask
+        west, south, east, north=box
+        return mask & (self.lon>=west) & (self.lon<=east) & (self.lat>=south) & (self.lat<=north)
+
+    def clusters(self, mask, zoom=6, box=None):
+        """
+        One row per grid cell with sightings: centre (mean lat/lon), count, dominant month (m) and a tag
+        Cells with one sighting keep the sighting's own tag
+        """
+        mask=self.in_box(mask, box) & (self.cells[self.level(zoom)]>=0)
+        d=pd.DataFrame({'cell':self.cells[self.level(zoom)][mask], 'latitude':self.lat[mask],
+                        'longitude':self.lon[mask], 'm':self.sightings['m'].to_numpy()[mask],
+                        'tag':self.sightings['tag'].to_numpy()[mask]})
+        g=d.groupby('cell', sort=True)
+        cl=g.agg(latitude=('latitude','mean'), longitude=('longitude','mean'), count=('m','size'), tag=('tag','first'))
+        mon=d.groupby(['cell','m']).size().rename('n').reset_index()
+        mon=mon.sort_values(by=['cell','n','m'], ascending=[True, False, True]).drop_duplicates('cell')
+        cl['m']=mon.set_index('cell')['m']
+        many=cl['count']>1
+        cl.loc[many, 'tag']=cl.loc[many, 'count'].astype(str)+' reports, mostly in '+\
+            cl.loc[many, 'm'].map(lambda x: calendar.month_abbr[int(x)])
+        return cl.reset_index(drop=True)
 
-def srkw_count_year(type, year, d_path, pod="All pods"):
+## ----------------Functions to make data for SRKW Lineplot ---------------------##
+class CountCube:
+    """
+    Daily number of SRKW reports as a dense array indexed by [year, day of year, pod, region, source]
+    Built once from load_sightings() output, every daily count query is then a slice
+    pods: J, K, L and any SRKW; sources: acartia, twm
+    regions: the legacy split (central salish, puget sound) followed by the salish_sea regions of
+    data/regions.json; a sighting is counted once in each of the two, and no region means the legacy
+    area, central salish plus puget sound, as the line plots always showed it
+    Example: CountCube.build(sightings).daily(2024, "J pod", "central salish") -> 366 counts
+             CountCube.build(sightings).daily(2024, "J pod", "Haro Strait and San Juan Islands")
+    """
+    pods=["J pod", "K pod", "L pod", "All pods"]
+    legacy=LEGACY_REGIONS
+    sources=["acartia", "twm"]
+
+    def __init__(self, counts, years, regions=None):
+        """
+        regions: names of the region axis, the legacy split alone if not given
+        """
+        self.counts=counts
+        self.years=np.asarray(years, dtype=int)
+        self.year_zero=int(self.years[0]) if len(self.years)>0 else 0
+        self.regions=list(regions) if regions is not None else list(self.legacy)
+
+    @classmethod
+    def build(cls, sightings):
+        d=sightings[sightings['day_of_year'].notnull()]
+        sea=[r for r in d['region'].cat.categories if r!=OTHER]
+        regions=cls.legacy+sea
+        # one (row, region index) pair per region set a sighting falls in
+        legacy_code=d['legacy_region'].map({r:i for i, r in enumerate(cls.legacy)}).to_numpy(dtype=float)
+        sea_code=d['region'].map({r:len(cls.legacy)+i for i, r in enumerate(sea)}).to_numpy(dtype=float)
+        rows=np.concatenate([np.flatnonzero(~np.isnan(legacy_code)), np.flatnonzero(~np.isnan(sea_code))])
+        region=np.concatenate([legacy_code[~np.isnan(legacy_code)], sea_code[~np.isnan(sea_code)]]).astype(int)
+        if len(rows)==0:
+            return cls(np.zeros((0, 366, 4, len(regions), 2), dtype='int32'), [], regions)
+        year=d['year'].to_numpy(dtype=int)[rows]
+        years=np.arange(year.min(), year.max()+1)
+        shape=(len(years), 366, 1, len(regions), 2)
+        flat=np.ravel_multi_index((
+            year-years[0],
+            d['day_of_year'].to_numpy(dtype=int)[rows]-1,
+            np.zeros(len(rows), dtype=int),
+            region,
+            (d['source']=='twm').to_numpy(dtype=int)[rows]), shape)
+        counts=np.stack([np.bincount(flat[(d[col]==1).to_numpy()[rows]], minlength=np.prod(shape)).reshape(shape)[:, :, 0]
+                         for col in ['J','K','L','srkw']], axis=2)
+        return cls(counts.astype('int32'), years, regions)
+
+    def _axis(self, names, name, what):
+        if name in ("", None):
+            return slice(None)
+        for i, n in enumerate(names):
+            if n.lower()==name.lower() or n.lower().startswith(name.lower()+" "):
+                return i
+        raise ValueError(what+" other than "+", ".join(names))
+
+    def _region(self, c, region, axis):
+        """
+        Counts of one region along axis, or of the legacy area (central salish plus puget sound) for ""
+        A name is matched exactly first, so "Puget Sound" of regions.json is not the legacy "puget sound"
+        """
+        if not region:
+            return c.take(range(len(self.legacy)), axis=axis).sum(axis=axis)
+        i=self.regions.index(region) if region in self.regions else self._axis(self.regions, region, "Region")
+        return c.take(i, axis=axis)
+
+    def daily(self, year, pod="All pods", region="", source=""):
+        """
+        Reports per day of year (Jan 1 first, 365 or 366 days) for one pod, summed over region and source unless given
+        region: one of regions, or "" for central salish and puget sound; source: "acartia", "twm" or "" for both
+        """
+        ndays=366 if calendar.isleap(year) else 365
+        if year<self.year_zero or year-self.year_zero>=len(self.years):
+            return np.zeros(ndays, dtype='int64')
+        c=self.counts[year-self.year_zero, :ndays, self._axis(self.pods, pod, "Pod")]
+        c=self._region(c, region, 1)
+        c=c[:, self._axis(self.sources, source, "Source")] if source else c.sum(axis=1)
+        return c.astype('int64')
+
+    def yearly(self, pod="All pods", region="", source=""):
+        """
+        Reports per year and day of year, shape (years, 366)
+        """
+        c=self.counts[:, :, self._axis(self.pods, pod, "Pod")]
+        c=self._region(c, region, 2)
+        c=c[:, :, self._axis(self.sources, source, "Source")] if source else c.sum(axis=2)
+        return c.astype('int64')
+
+def srkw_count_year(type, year, d_path, pod="All pods", cube=None, index=None, lag1=4, lag2=10):
     """
     Function to make orca count data of a certain year and merge with salmon data
+    type is "acartia" or "twm" (d_path is that data folder, only read when no cube is given)
+    Salmon columns (lagged by lag1 and lag2 days) are added when index=LagIndex(albion, bonnev) is given
+    Example data frame
+    date  m day srkw srkw_north srkw_south bon2024 bon_hist alb2024 alb_hist
+    Jan-1 1 1   2    2          0          NaN     NaN      NaN     NaN
     """
-    clr12pt=np.linspace(0.083,1,12)
-    srkwc=pd.read_csv(d_path+"srkw_"+str(year)+".csv")
-    srkwc['date2']=pd.to_datetime(srkwc['date_ymd'],format='%Y-%m-%d', errors='coerce')
-    entry_lat=48.19437 # Define the north and south puget sound latitude
-    srkwc['north_puget_sound']=srkwc['latitude'].apply(lambda x: 1 if x>entry_lat else 0)
-    if type=="twm": 
-        srkwc['mon_frac']=srkwc['Month'].apply(lambda x: clr12pt[int(x)-1])
-        srkwc['day_of_year']=srkwc['SightDate'].apply(lambda x: pd.Period(x, freq='D').day_of_year)
-        srkwc['date_ymd']=srkwc['SightDate']
-        srkwc['created']=srkwc['SightDate']+" "+srkwc['Time1']
-
-    srkwc_k=srkwc[srkwc.K==1].reset_index()
-    srkwc_l=srkwc[srkwc.L==1].reset_index()
-    srkwc_j=srkwc[srkwc.J==1].reset_index()
-
-    if pod=="L pod":
-        srkw_dat=srkwc_l
-    elif pod=="K pod":
-        srkw_dat=srkwc_k
-    elif pod=="J pod":
-        srkw_dat=srkwc_j
-    elif pod=="All pods":
+    if cube is None:
         if type=="twm":
-            srkw_dat=srkwc
+            cube=CountCube.build(load_sightings(None, d_path))
         else:
-            srkw_dat=srkwc[srkwc.srkw==1]
-    srkwc_north=srkw_dat[srkw_dat['north_puget_sound']==1]
-    srkwc_north_avg=srkw_count(srkwc_north, count_orca=False)
-    srkwc_north_avg.columns=['date','count_north','day','m']
-
-    srkwc_south=srkw_dat[srkw_dat['north_puget_sound']==0]
-    srkwc_south_avg=srkw_count(srkwc_south, count_orca=False)
-    srkwc_south_avg.columns=['date','count_south','day','m']
-
-    srkw_yrcount=srkw_count(srkwc, count_orca=False)
-    
-    # Add salmon data
-    salmon=create_lagged(year, 4, 10)
-    srkw_yrcount=srkw_yrcount.merge(salmon, left_on=['m','day'], right_on=['m','day'], how='right')
-    srkw_yrcount=srkw_yrcount.drop(columns=['date_x'])
-    srkw_yrcount=srkw_yrcount.rename(columns={'date_y':'date'})
-
-    # Add srkw count north of puget sound
-    srkw_yrcount=srkw_yrcount.merge(srkwc_north_avg, left_on=['m','day'], right_on=['m','day'], how='left')
-    srkw_yrcount=srkw_yrcount.drop(columns=['date_y'])
-    srkw_yrcount=srkw_yrcount.rename(columns={'date_x':'date'})
-
-    # Add srkw count in puget sound
-    srkw_yrcount=srkw_yrcount.merge(srkwc_south_avg, left_on=['m','day'], right_on=['m','day'], how='left')
-    srkw_yrcount=srkw_yrcount.drop(columns=['date_y'])
-    srkw_yrcount=srkw_yrcount.rename(columns={'date_x':'date'})
-
-    # Keep a subset of variables 
-    srkw_yrcount=srkw_yrcount[['date', 'm','day','count','count_north','count_south','chin'+str(year),'chin_hist','cpue'+str(year),'cpue_hist']]
-    srkw_yrcount.columns=['date','m','day','srkw','srkw_north','srkw_south','bon'+str(year),'bon_hist','alb'+str(year),'alb_hist']
+            cube=CountCube.build(load_sightings(d_path, None))
+    if index is not None:
+        srkw_yrcount=create_lagged(year, index.albion, index.bonnev, lag1, lag2, index=index)
+        srkw_yrcount=srkw_yrcount.rename(columns={'chin'+str(year):'bon'+str(year),'chin_hist':'bon_hist',
+                                                  'cpue'+str(year):'alb'+str(year),'cpue_hist':'alb_hist'})
+    else:
+        days=pd.date_range(date(year, 1, 1), date(year, 12, 31))
+        srkw_yrcount=pd.DataFrame({'date':days.strftime('%b')+'-'+days.day.astype(str), 'm':days.month, 'day':days.day})
+    srkw_yrcount.insert(3, 'srkw_north', cube.daily(year, pod, "central salish", type))
+    srkw_yrcount.insert(4, 'srkw_south', cube.daily(year, pod, "puget sound", type))
+    srkw_yrcount.insert(3, 'srkw', srkw_yrcount['srkw_north']+srkw_yrcount['srkw_south'])
     return srkw_yrcount
 
-def peak_chinook(curyr, fos_path, bon_path, loc="Albion", year_zero=1990):
-    ayl=[y for y in range(year_zero, curyr)] #year list for Albion up till last year
-    byl=[y for y in range(year_zero, curyr)] #year list for Bonneville Dam up till last year
-    peak_vals=[]
-    peak_dates=[]
-    peak_days=[]       
-    peak_p95_df=[]
+def acartia_count_year(year, acartia_path, pod="All pods", cube=None, index=None):
+    return srkw_count_year("acartia", year, acartia_path, pod, cube=cube, index=index)
+
+def twm_count_year(year, twm_path, pod="All pods", cube=None, index=None):
+    return srkw_count_year("twm", year, twm_path, pod, cube=cube, index=index)
+
+## ----------------Lagged cross-correlation ---------------------##
+LAGS=np.arange(-60, 61) # days
+
+def year_day_matrix(wide, prefix, years):
+    """
+    Daily values of the prefix<year> columns of a wide data frame (albion cpue, bonnev chin) as a
+    years x 365 array on the non-leap calendar (Feb-29 dropped), NaN on days without a value
+    """
+    pos=by_day_of_year(day_of_year_index(wide['m'], wide['day']), 365)
+    out=np.full((len(years), 365), np.nan)
+    for i, y in enumerate(years):
+        if prefix+str(y) in wide.columns:
+            out[i]=take(wide[prefix+str(y)], pos)
+    return out
+
+def cube_matrix(cube, years, pod="All pods", region="", today=None):
+    """
+    Daily SRKW reports of a CountCube as a years x 365 array on the non-leap calendar (Feb-29 dropped)
+    Years without any report and days after today are NaN, not 0
+    """
+    today=today or date.today()
+    out=np.full((len(years), 365), np.nan)
+    counts=cube.yearly(pod, region)
+    for i, y in enumerate(years):
+        j=y-cube.year_zero
+        if j<0 or j>=len(cube.years) or counts[j].sum()==0:
+            continue
+        c=counts[j].astype(float)
+        if y==today.year:
+            c[today.timetuple().tm_yday:]=np.nan
+        out[i]=np.delete(c, 59) if calendar.isleap(y) else c[:365]
+    return out
+
+def xcorr(a, b, lags, nfft):
+    """
+    Sum over days t of a[:, t]*b[:, t+lag] for every row and lag, with one FFT per array
+    nfft must be at least days + max(|lags|) so no lag wraps around
+    """
+    c=np.fft.irfft(np.conj(np.fft.rfft(a, nfft))*np.fft.rfft(b, nfft), nfft)
+    return c[:, lags%nfft]
+
+def pearson(sums, min_days):
+    """
+    Correlation from the sums (n, x, y, xy, xx, yy), NaN below min_days days or for a flat series
+    """
+    n, sx, sy, sxy, sxx, syy=sums
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vx=n*sxx-sx**2
+        vy=n*syy-sy**2
+        r=(n*sxy-sx*sy)/np.sqrt(vx*vy)
+    # vx and vy come out of FFTs, a flat series leaves rounding noise instead of 0
+    ok=(n>=min_days) & (vx>1e-9*n*sxx) & (vy>1e-9*n*syy)
+    return np.where(ok, np.clip(r, -1, 1), np.nan)
+
+def lag_corr(x, y, lags=LAGS, min_days=20):
+    """
+    Pearson correlation of x[:, t] and y[:, t+lag] for every row (year) and lag at once, on the days
+    where both have a value; a positive lag means y follows x
+    Returns r and days, arrays of shape (rows, lags), and the correlation of all rows pooled (lags,)
+    """
+    lags=np.asarray(lags)
+    mx=~np.isnan(x)
+    my=~np.isnan(y)
+    x0=np.where(mx, x, 0.)
+    y0=np.where(my, y, 0.)
+    nfft=1<<int(np.ceil(np.log2(x.shape[1]+np.abs(lags).max()+1)))
+    mx, my=mx.astype(float), my.astype(float)
+    n=np.rint(xcorr(mx, my, lags, nfft))
+    sums=np.stack([n, xcorr(x0, my, lags, nfft), xcorr(mx, y0, lags, nfft), xcorr(x0, y0, lags, nfft),
+                   xcorr(x0**2, my, lags, nfft), xcorr(mx, y0**2, lags, nfft)])
+    return pearson(sums, min_days), n, pearson(sums.sum(axis=1), min_days)
+
+class LagCorr:
+    """
+    Lagged cross-correlation of Albion CPUE, Bonneville counts and daily SRKW reports
+    The daily series are dense years x 365 arrays built once, every year and lag is then a few FFTs
+    Example: LagCorr(albion, bonnev, cube, range(1939, 2026)).corr("albion", "srkw", pod="J pod")
+    """
+    names=["albion", "bonneville", "srkw"]
+
+    def __init__(self, albion, bonnev, cube, years):
+        self.years=np.asarray(list(years), dtype=int)
+        self.cube=cube
+        self.series={'albion':year_day_matrix(albion, 'cpue', self.years),
+                     'bonneville':year_day_matrix(bonnev, 'chin', self.years)}
+
+    def matrix(self, name, pod="All pods", region=""):
+        if name=="srkw":
+            return cube_matrix(self.cube, self.years, pod, region)
+        return self.series[name]
+
+    def corr(self, a, b, lags=LAGS, pod="All pods", region="", min_days=20):
+        """
+        Correlation of a on day t with b on day t+lag (b follows a for a positive lag)
+        pod and region select the SRKW reports; years with no correlation at any lag are dropped
+        Returns a data frame of r (year x lag), the days behind each r, and the pooled r by lag
+        """
+        r, n, pooled=lag_corr(self.matrix(a, pod, region), self.matrix(b, pod, region), lags, min_days)
+        keep=~np.isnan(r).all(axis=1)
+        r=pd.DataFrame(r[keep], index=pd.Index(self.years[keep], name='year'), columns=pd.Index(lags, name='lag'))
+        n=pd.DataFrame(n[keep], index=r.index, columns=r.columns).astype(int)
+        return r, n, pd.Series(pooled, index=r.columns, name='r')
+
+## ----------------Functions to find yearly peaks ---------------------##
+def day_of_year0(dates):
+    """
+    Days since Jan 1 (Jan 1 is 0) of a column of dates
+    """
+    return (pd.to_datetime(dates).dt.dayofyear-1).astype(int)
+
+def find_peaks(daily, keys, value, date_col='date'):
+    """
+    Peak engine: yearly peaks of a long data frame in one groupby
+    daily has one row per day (python date in date_col) and the group keys, e.g. ['year']
+    Returns 
+      peaks: one row per group, keys + peakvals, peakdate, peakday (days since Jan 1)
+      peaks95: every row at or above the group's 95th percentile, keys + value + peakdate + peakday
+    Ties for the peak go to the earliest date
+    """
+    daily=daily[daily[value].notnull()]
+    daily=daily.sort_values(by=keys+[date_col], kind='stable').reset_index(drop=True)
+    g=daily.groupby(keys, sort=True)[value]
+    peaks=daily.loc[g.idxmax().values, keys+[value, date_col]].reset_index(drop=True)
+    peaks=peaks.rename(columns={value:'peakvals', date_col:'peakdate'})
+    peaks['peakday']=day_of_year0(peaks['peakdate'])
+    p95=g.transform('quantile', 0.95) # same as np.percentile(x, 95)
+    peaks95=daily.loc[daily[value]>=p95, keys+[value, date_col]].reset_index(drop=True)
+    peaks95=peaks95.rename(columns={date_col:'peakdate'})
+    peaks95['peakday']=day_of_year0(peaks95['peakdate'])
+    return peaks, peaks95
+
+def salmon_long(fos_path, bon_path, loc="Albion", years=None):
+    """
+    Daily Chinook of one location in long format (year, date, value)
+    """
     if loc=="Albion":
-        for i in range(len(ayl)):
-            d=pd.read_csv(fos_path+'fos'+str(ayl[i])+'.csv',usecols=['day','mon','cpue1'])
-            yr=ayl[i]
-            peak_val=max(d['cpue1'])
-            peak_row=d[d['cpue1']==peak_val]
-            peak_day=peak_row.day.values[0]
-            peak_mon=str2mon(peak_row.mon.values[0])
-            peak_date=date(yr, peak_mon, peak_day)
-            peak_day=peak_date-date(yr,1,1)
-            peak_vals.append(peak_val)
-            peak_dates.append(peak_date)
-            peak_days.append(peak_day.days) 
-            #95 percentile          
-            peak_p95=np.percentile(d['cpue1'], 95)
-            d_p95=d[d['cpue1']>=peak_p95]
-            d_p95['date']=d_p95.apply(lambda x: date(yr, str2mon(x['mon']), int(x['day'])) ,axis=1)
-            d_p95['peak_day']=d_p95['date']-date(yr, 1, 1)
-            d_p95['peak_day']=d_p95['peak_day'].apply(lambda x: x.days)
-            peak_p95_df.append(d_p95)
+        d=read_years(fos_path, 'fos', years, usecols=['day','mon','cpue1'])
+        d['m']=d['mon'].map(str2mon)
+        d=d.rename(columns={'cpue1':'value'})
     elif loc=="Bonneville":
-        for i in range(len(byl)):
-            d=pd.read_csv(bon_path+'bon'+str(byl[i])+'.csv',\
-                    usecols=['Project','Date','Chin'])
-            yr=byl[i]
-            peak_val=max(d['Chin'].dropna())
-            peak_p95=np.percentile(d['Chin'].dropna(), 95)
-            peak_row=d[d['Chin']==peak_val]
-            peak_date=dt.strptime(peak_row.Date.values[0], '%Y-%m-%d').date()
-            peak_day=peak_date-date(yr,1,1)
-            peak_vals.append(peak_val)
-            peak_dates.append(peak_date)
-            peak_days.append(peak_day.days)  
-            #95 percentile          
-            peak_p95=np.percentile(d['Chin'].dropna(), 95)
-            d_p95=d[d['Chin']>=peak_p95]
-            d_p95['peak_day']=d_p95['Date']-date(yr, 1, 1)
-            d_p95['peak_day']=d_p95['peak_day'].apply(lambda x: x.days)
-            peak_p95_df.append(d_p95)              
+        d=read_years(bon_path, 'bon', years, usecols=['Project','Date','Chin'])
+        d['m']=pd.DatetimeIndex(d['Date']).month
+        d['day']=pd.DatetimeIndex(d['Date']).day
+        d=d.rename(columns={'Chin':'value'})
     else:
         raise ValueError("Location other than 'Albion' and 'Bonneville'")
-    return peak_vals, peak_dates, peak_days, peak_p95_df
-
-def peak_srkw(curyr, twm_path, acartia_path, src="twm", pod="", loc="", year_zero=1990):
-    tyl=[y for y in range(year_zero, 2022)] #year list for data from The Whale Museum
-    ayl=[y for y in range(2018, curyr)] #year list for data from Acartia
-    byl=[y for y in range(year_zero, curyr)] #year list for data from both The Whale Museum plus Acartia
-    peak_vals=[]
-    peak_dates=[]
-    peak_days=[]  
-    peak_p95_df=[]    
-    # Read TWM data 
-    twm_data=[]
-    for i in range(len(tyl)):
-        d1=pd.read_csv(os.path.join(twm_path,'twm'+str(tyl[i])+'.csv'))
-        if pod=="":
-            pass
-        elif pod.lower()=="j":
-            d1=d1[d1['j']==1]
-        elif pod.lower()=="k":
-            d1=d1[d1['k']==1]
-        elif pod.lower()=="l":
-            d1=d1[d1['l']==1]
-        elif pod.lower()=="j or k or l":
-            d1=d1[(d1['j']==1) | (d1['k']==1) | (d1['l']==1)]
-        if loc=="":
-            pass 
-        elif loc.lower()=="puget sound":
-            d1=d1[d1['puget_sound']==1]
-        elif loc.lower()=="central salish":
-            d1=d1[d1['central_salish']==1]
-        d1=d1[['SightDate']]
-        d1['SightDate']=d1['SightDate'].apply(lambda x: dt.strptime(x, '%Y-%m-%d').date())
-        twm_data.append(d1)
-    # Read Acartia Data 
-    acartia_data=[]
-    for i in range(len(ayl)):
-        d2=pd.read_csv(os.path.join(acartia_path,'srkw_'+str(ayl[i])+'.csv'))
-        d2['date2']=pd.to_datetime(d2['date_ymd'],format='%Y-%m-%d', errors='coerce')
-        entry_lat=48.19437
-        d2['central_salish']=d2['latitude'].apply(lambda x: 1 if x>entry_lat else 0)
-        d2['puget_sound']=d2['latitude'].apply(lambda x: 1 if x<=entry_lat else 0)            
-        if pod=="":
-            pass
-        elif pod.lower()=="j":
-            d2=d2[d2['J']==1]
-        elif pod.lower()=="k":
-            d2=d2[d2['K']==1]
-        elif pod.lower()=="l":
-            d2=d2[d2['L']==1]
-        elif pod.lower()=="j or k or l":
-            d2=d2[(d2['J']==1) | (d2['K']==1) | (d2['L']==1)]
-        if loc=="":
-            pass 
-        elif loc.lower()=="puget sound":
-            d2=d2[d2['puget_sound']==1]
-        elif loc.lower()=="central salish":
-            d2=d2[d2['central_salish']==1]
-        d2=d2[['date2']]
-        # d2['date2']=d2['date2'].apply(lambda x: conv_npdt64(x) if isinstance(x, np.datetime64) else x )
-        d2=d2.rename(columns={"date2":"SightDate"})
-        acartia_data.append(d2)
-        # print(acartia_data)
+    d['date']=pd.to_datetime(pd.DataFrame({'year':d['year'],'month':d['m'],'day':d['day']})).dt.date
+    return d
+
+def peak_chinook(curyr, fos_path, bon_path, loc="Albion", year_zero=1990):
+    yl=[y for y in range(year_zero, curyr)] #year list up till last year
+    d=salmon_long(fos_path, bon_path, loc, yl)
+    peaks, peaks95=find_peaks(d, ['year'], 'value')
+    peaks95=peaks95.rename(columns={'peakdate':'date', 'peakday':'peak_day'})
+    peak_p95_df=[p.reset_index(drop=True) for _, p in peaks95.groupby('year')]
+    return list(peaks['peakvals']), list(peaks['peakdate']), list(peaks['peakday']), peak_p95_df
+
+def _srkw_mask(sightings, pod="", loc="", src="both", curyr=None, year_zero=1990):
+    """
+    Rows of the sightings table in one (pod, region, source) selection
+    TWM covers year_zero-2021 and Acartia 2018 up till last year, same as the per-year files
+    """
+    is_twm=sightings['source']=='twm'
+    mask=(is_twm & (sightings['year']>=year_zero) & (sightings['year']<2022)) | \
+         (~is_twm & (sightings['year']>=2018) & (sightings['year']<curyr))
     if src=="twm":
-        for i in range(len(tyl)):
-            d=twm_data[i]
-            yr=tyl[i]
-            d=d['SightDate'].value_counts().reset_index()
-            d=d.rename(columns={'index':'Date', 'SightDate':'count'})
-            peak_val=max(d['count'])
-            peak_row=d[d['count']==peak_val]
-            peak_date=peak_row['Date'].values[0]
-            peak_day=peak_date-date(yr,1,1)
-            peak_vals.append(peak_val)
-            peak_dates.append(peak_date)
-            peak_days.append(peak_day.days)    
-            #95 percentile          
-            peak_p95=np.percentile(d['count'], 95)
-            d_p95=d[d['count']>=peak_p95]
-            d_p95['peak_day']=d_p95['Date']-date(yr, 1, 1)
-            d_p95['peak_day']=d_p95['peak_day'].apply(lambda x: x.days)
-            peak_p95_df.append(d_p95)                    
+        mask&=is_twm
     elif src=="acartia":
-        for i in range(len(ayl)):
-            yr=ayl[i]
-            d=acartia_data[i]
-            d=d['SightDate'].value_counts().reset_index()
-            d=d.rename(columns={'index':'Date', 'SightDate':'count'})   
-            peak_val=max(d['count'])
-            peak_row=d[d['count']==peak_val]
-            peak_date=peak_row['Date'].values[0]
-            peak_day=peak_date-date(yr,1,1)
-            peak_vals.append(peak_val)
-            peak_dates.append(peak_date)
-            peak_days.append(peak_day.days)
-            #95 percentile          
-            peak_p95=np.percentile(d['count'], 95)
-            d_p95=d[d['count']>=peak_p95]
-            d_p95['peak_day']=d_p95['Date']-date(yr, 1, 1)
-            d_p95['peak_day']=d_p95['peak_day'].apply(lambda x: x.days)
-            peak_p95_df.append(d_p95)         
-    elif src=="both":
-        for i in range(len(byl)):
-            yr=byl[i]
-            if byl[i]<2018:
-                j=tyl.index(byl[i])
-                d=twm_data[j]
-            elif (byl[i]>=2018) & (byl[i]<2022):
-                j=tyl.index(byl[i])
-                d1=twm_data[j]
-                k=ayl.index(byl[i])
-                d2=acartia_data[k]   
-                d=pd.concat([d1, d2])              
-            else:
-                k=ayl.index(byl[i])
-                d=acartia_data[k]
-            d=d['SightDate'].value_counts().reset_index()
-            d=d.rename(columns={'SightDate':'Date',})   
-            peak_val=max(d['count'])
-            peak_row=d[d['count']==peak_val]
-            peak_date=peak_row['Date'].values[0]
-            if isinstance(peak_date, np.datetime64):
-                peak_date=pd.to_datetime(peak_date).date()
-            peak_day=peak_date-date(yr,1,1)
-            peak_vals.append(peak_val)
-            peak_dates.append(peak_date)
-            peak_days.append(peak_day.days)   
-            #95 percentile          
-            peak_p95=np.percentile(d['count'], 95)
-            d_p95=d[d['count']>=peak_p95]
-            d_p95['Date']=d_p95["Date"].apply(lambda x: pd.to_datetime(x).date() if isinstance(peak_date, np.datetime64) else x)
-            d_p95['peak_day']=d_p95['Date'].apply(lambda x: x.date()-date(yr, 1, 1) if isinstance(x, pd._libs.tslibs.timestamps.Timestamp) else x-date(yr, 1, 1))
-            peak_p95_df.append(d_p95)
-    else:
-        raise ValueError("Source other than 'twm' and 'acartia'")
-    return peak_vals, peak_dates, peak_days, peak_p95_df
+        mask&=~is_twm
+    elif src!="both":
+        raise ValueError("Source other than 'twm', 'acartia' and 'both'")
+    if pod.lower() in ("j","k","l"):
+        mask&=sightings[pod.upper()]==1
+    elif pod.lower()=="j or k or l":
+        mask&=(sightings['J']==1) | (sightings['K']==1) | (sightings['L']==1)
+    mask=mask.to_numpy()
+    if loc:
+        mask&=region_mask(sightings, loc)
+    return mask
+
+def srkw_peaks(sightings, combos, curyr, year_zero=1990):
+    """
+    Yearly peaks of daily SRKW reports for many (pod, loc, src) combinations in one scan
+    e.g. combos=[("", "central salish", "both"), ("j", "", "twm")]
+    Days reported by both TWM and Acartia (2018-2021) are counted per source, as peak_srkw always did
+    Returns (peaks, peaks95) of find_peaks() with pod, loc, src key columns
+    """
+    daily=[]
+    for pod, loc, src in combos:
+        d=sightings.loc[_srkw_mask(sightings, pod, loc, src, curyr, year_zero), ['year','source','day_of_year']]
+        d['pod'], d['loc'], d['src']=pod, loc, src
+        daily.append(d)
+    daily=pd.concat(daily, ignore_index=True)
+    keys=['pod','loc','src','year']
+    daily=daily.groupby(keys+['source','day_of_year'], sort=False).size().rename('count').reset_index()
+    daily['date']=(pd.to_datetime(daily['year'].astype(str), format='%Y')+pd.to_timedelta(daily['day_of_year']-1, unit='D')).dt.date
+    return find_peaks(daily, keys, 'count')
+
+def peak_srkw(curyr, twm_path, acartia_path, src="twm", pod="", loc="", year_zero=1990, sightings=None):
+    if sightings is None:
+        sightings=load_sightings(acartia_path, twm_path)
+    peaks, peaks95=srkw_peaks(sightings, [(pod, loc, src)], curyr, year_zero)
+    peaks95=peaks95.rename(columns={'peakdate':'Date', 'peakday':'peak_day'})
+    peak_p95_df=[p[['Date','count','peak_day']].reset_index(drop=True) for _, p in peaks95.groupby('year')]
+    return list(peaks['peakvals']), list(peaks['peakdate']), list(peaks['peakday']), peak_p95_df
 
 def apeak_df(curyr, fos_path, bon_path):
     year_zero=1990
-    albion_yl4peak=[y for y in range(year_zero, curyr+1)]
-    apeak=pd.DataFrame()
-    apeak95=pd.DataFrame()
-    apv, apdt, apdy, apdf=peak_chinook(curyr, fos_path, bon_path, loc="Albion", year_zero=year_zero)
-    apeak['year']=albion_yl4peak[:-1]
-    apeak['peakvals']=apv 
-    apeak['peakdate']=apdt 
-    apeak['peakday']=apdy
-
-    peakdays95=[]
-    peakyr95=[]
-    for i in range(len(albion_yl4peak)-1):
-        yr=albion_yl4peak[i]
-        adf95=apdf[i]
-        adf95_len=adf95.shape[0]
-        peakdays95+=list(adf95['peak_day'])
-        peakyr95+=[yr]*adf95_len
-    apeak95['year']=peakyr95
-    apeak95['peakday']=peakdays95
-
+    d=salmon_long(fos_path, bon_path, "Albion", range(year_zero, curyr))
+    peaks, peaks95=find_peaks(d, ['year'], 'value')
+    apeak=peaks[['year','peakvals','peakdate','peakday']]
+    apeak95=peaks95[['year','peakday']]
     return apeak, apeak95 
 
-def srkw_peak_df(curyr, twm_path, acartia_path):
+def srkw_peak_df(curyr, twm_path, acartia_path, sightings=None):
     year_zero=1990
-    srkw_cs_pv, srkw_cs_pdt, srkw_cs_pdy, srkw_cs_df=peak_srkw(curyr, twm_path, acartia_path, src="both", loc="central salish")
-    srkw_cs_peak=pd.DataFrame()
-    srkw_cs_peak['year']=[y for y in range(year_zero, curyr)]
-    srkw_cs_peak['peakvals']=srkw_cs_pv 
-    srkw_cs_peak['peakdate']=srkw_cs_pdt
-    srkw_cs_peak['peakday']=srkw_cs_pdy
-
-    srkw_cs_peak95=pd.DataFrame()
-    peakdays95=[]
-    peakyr95=[]
-    srkw_yrs=[y for y in range(year_zero, curyr)]
-    for i in range(len(srkw_yrs)-1):
-        yr=srkw_yrs[i]
-        srkw_cs_df95=srkw_cs_df[i]
-        srkw_cs_df95_len=srkw_cs_df95.shape[0]
-        peakdays95+=list(srkw_cs_df95['peak_day'])
-        peakyr95+=[yr]*srkw_cs_df95_len
-    srkw_cs_peak95['year']=peakyr95
-    srkw_cs_peak95['peakday']=peakdays95
-
-    return srkw_cs_peak, srkw_cs_peak95
\ No newline at end of file
+    if sightings is None:
+        sightings=load_sightings(acartia_path, twm_path)
+    peaks, peaks95=srkw_peaks(sightings, [("", "central salish", "both")], curyr, year_zero)
+    srkw_cs_peak=peaks[['year','peakvals','peakdate','peakday']]
+    srkw_cs_peak95=peaks95.loc[peaks95['year']<curyr-1, ['year','peakday']].reset_index(drop=True) #up till the year before last
+    return srkw_cs_peak, srkw_cs_peak95
@@ -0,0 +1,90 @@
+// Project Name: Orcasound Salmon
+// Program Name: orcamap.js
+// Purpose: Clientside callbacks to switch the orca map and orca lines between pods and years in the browser
+// Date Created: Oct 18th 2026
+//
+// Only used when the app runs with CLIENT_MAPS=1 (see app.py). Sightings come once per year from
+// /_orcamap/<version>/sightings/<year>.json and are kept in the sightings-store; orca line figures
+// come once per pod. Selections with more than config.max_points sightings are sent back to the
+// server through map-request, which draws them clustered by zoom level. With the track layer on,
+// the satellite tag tracks of a pod and year come from /_orcamap/<version>/tracks/<pod>/<year>.json
+// (already thinned by the server) and are kept in the same store.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    orcamap: {
+        update_map: function(pod, year, relayout, tracks, store, config) {
+            const dc = window.dash_clientside;
+            const triggered = dc.callback_context.triggered.map(t => t.prop_id);
+            const showTracks = !!(tracks && tracks.length);
+            const trackKey = 'tracks/' + pod + '/' + year;
+            const cached = store && store[year];
+            const cachedTracks = !showTracks || (store && store[trackKey]);
+            const chunk = cached ? Promise.resolve(cached) : getJSON(config.url + 'sightings/' + year + '.json');
+            const trackChunk = cachedTracks ? Promise.resolve(showTracks ? store[trackKey] : [])
+                : getJSON(config.url + 'tracks/' + encodeURIComponent(pod) + '/' + year + '.json');
+            return Promise.all([chunk, trackChunk]).then(function([c, t]) {
+                const added = {};
+                if (!cached) added[year] = c;
+                if (!cachedTracks) added[trackKey] = t;
+                const newStore = Object.keys(added).length ? Object.assign({}, store, added) : dc.no_update;
+                const bit = config.pod_bits[pod];
+                const rows = [];
+                for (let i = 0; i < c.pods.length; i++) {
+                    if (c.pods[i] & bit) rows.push(i);
+                }
+                if (rows.length > config.max_points) {
+                    // too many markers for one map, the server clusters them by zoom level
+                    return [dc.no_update, newStore, {pod: pod, year: year, relayout: relayout, tracks: tracks,
+                                                     version: config.version, t: Date.now()}];
+                }
+                if (triggered.length === 1 && triggered[0] === 'orca-map.relayoutData') {
+                    // every sighting is already on the map, zooming and panning change nothing
+                    return [dc.no_update, newStore, dc.no_update];
+                }
+                const fig = mapFigure(c, rows, year, config);
+                fig.data = fig.data.concat(t);
+                return [fig, newStore, dc.no_update];
+            }).catch(function() {
+                return [dc.no_update, dc.no_update, {pod: pod, year: year, relayout: relayout, tracks: tracks,
+                                                     version: config.version, t: Date.now()}];
+            });
+        },
+
+        update_lines: function(pod, store, config) {
+            const dc = window.dash_clientside;
+            if (store && store[pod]) {
+                return [store[pod], dc.no_update];
+            }
+            return getJSON(config.url + 'lines/' + encodeURIComponent(pod) + '.json').then(function(fig) {
+                return [fig, Object.assign({}, store, {[pod]: fig})];
+            });
+        },
+    },
+});
+
+function getJSON(url) {
+    return fetch(url).then(function(r) {
+        if (!r.ok) throw new Error(url + ': ' + r.status);
+        return r.json();
+    });
+}
+
+// Same figure as orca_map_figure() in app.py: one marker per sighting colored by month, plus an
+// empty point for every month (only the months still to come in the current year) so the color
+// bar always spans the whole year
+function mapFigure(c, rows, year, config) {
+    const fig = JSON.parse(JSON.stringify(config.template));
+    const trace = fig.data[0];
+    let months = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12];
+    if (year === config.curyr) {
+        const maxM = rows.reduce((m, i) => Math.max(m, c.m[i]), 0);
+        months = months.filter(m => m > maxM);
+    }
+    const pad = months.map(() => null);
+    trace.lat = rows.map(i => c.lat[i]).concat(pad);
+    trace.lon = rows.map(i => c.lon[i]).concat(pad);
+    trace.text = rows.map(i => c.tag[i]).concat(pad);
+    trace.marker.color = rows.map(i => config.month_colors[c.m[i] - 1])
+        .concat(months.map(m => config.month_colors[m - 1]));
+    return fig;
+}
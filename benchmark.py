@@ -0,0 +1,329 @@
+## Project Name: Orcasound Salmon
+### Program Name: benchmark.py
+### Purpose: To time the data loaders against the older implementations they replaced
+##### Date Created: Oct 18th 2026
+# Usage: python benchmark.py [repeats]
+#        python benchmark.py payload
+#        python benchmark.py suite [--data bundled|synthetic] [--years N] [--rows N] [--comment-length N]
+#                                  [--repeats N] [--out results.json]
+#        python benchmark.py compare old.json new.json
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import platform
+import argparse
+import statistics
+import tracemalloc
+from os.path import join as pjoin
+import pathlib
+from datetime import date
+from datetime import datetime as dt
+import numpy as np
+import pandas as pd
+pd.options.mode.chained_assignment = None #suppress chained assignment
+from apputils import (load_albion, load_bon, load_wash, calendar_template, create_lagged, create_lagged_many, LagIndex,
+                      peak_chinook, peak_srkw, load_sightings)
+from regions import load_regions
+import calendar
+
+APP_PATH = str(pathlib.Path(__file__).parent.resolve())
+fos_path=pjoin(APP_PATH,'data/foschinook/')
+bon_path=pjoin(APP_PATH,'data/bonchinook/')
+
+## ----------------Reference implementations ---------------------##
+# One outer merge per year, as load_albion/load_bon did before the single pivot
+# (alb_cpue is paired with its own year here, the old loader paired it with the reversed year list)
+def load_albion_merge(fos_path):
+    curyr=date.today().year
+    ayl=[y for y in range(1980, curyr+1)]
+    albion=pd.DataFrame(columns=['day','m'])
+    albion_cpue=[]
+    for i in reversed(range(len(ayl))):
+        d=pd.read_csv(fos_path+'fos'+str(ayl[i])+'.csv', usecols=['day','mon','cpue1'])
+        albion_cpue.append(sum(d['cpue1']))
+        d['m']=d['mon'].apply(lambda x: dt.strptime(x, '%b').month)
+        d=d.drop(columns='mon')
+        d=d.rename(columns={'cpue1':'cpue'+str(ayl[i])})
+        albion=pd.merge(left=albion, right=d, how='outer', on=['m','day'], sort=True)
+    albion['cpue_hist']=albion.iloc[:,5:].mean(axis=1, skipna=True).round(decimals=2)
+    albion['cpue_hist2']=albion.iloc[:,3:].mean(axis=1, skipna=True).round(decimals=2)
+    albion['month']=albion['m'].apply(lambda x: dt.strptime(str(x), '%m').strftime('%b'))
+    albionpd=pd.DataFrame({'year':ayl[:-1], 'alb_cpue':albion_cpue[::-1][:-1]}, columns=['year','alb_cpue'])
+    return albion, albionpd
+
+def load_bon_merge(bon_path):
+    curyr=date.today().year
+    byl=[y for y in range(1939, curyr+1)]
+    bonnev=pd.DataFrame(columns=['day','m'])
+    for i in reversed(range(len(byl))):
+        d=pd.read_csv(bon_path+'bon'+str(byl[i])+'.csv', usecols=['Project','Date','Chin'])
+        d=d[d['Project']=='Bonneville']
+        d['Chin2']=d['Chin'].apply(lambda x: 0 if x<0 else x)
+        d['m']=pd.DatetimeIndex(d['Date']).month
+        d['day']=pd.DatetimeIndex(d['Date']).day
+        d=d.rename(columns={'Chin2':'chin'+str(byl[i])})
+        d=d.drop(columns=['Project','Date','Chin'])
+        bonnev=pd.merge(left=bonnev, right=d, how='outer', on=['m','day'], sort=True)
+    bonnev['chin_hist']=bonnev.iloc[:,5:].mean(axis=1, skipna=True).round(decimals=1)
+    bonnev['chin_hist2']=bonnev.iloc[:,3:].mean(axis=1, skipna=True).round(decimals=1)
+    bonnev['month']=bonnev['m'].apply(lambda x: dt.strptime(str(x), '%m').strftime('%b'))
+    bonnev['date']=bonnev[['month','day']].apply(lambda x: '-'.join(x.values.astype(str)), axis="columns")
+    return bonnev
+
+# Date parsing and two merges per call, as create_lagged did before LagIndex
+def create_lagged_merge(year, albion, bonnev, lag1, lag2):
+    cal=calendar_template(bonnev)
+    cal_leap=calendar_template(bonnev, leap=True)
+    albion_lagged=albion[['date','cpue'+str(year),'cpue_hist']]
+    if calendar.isleap(year)==False:
+        albion_lagged=albion_lagged[albion_lagged['date']!='Feb-29']
+    albion_lagged['date1']=pd.to_datetime(albion_lagged['date'], errors='coerce', format='%b-%d')
+    albion_lagged['date2']=albion_lagged['date1'] - pd.Timedelta(days=lag1)
+    albion_lagged['m']=pd.DatetimeIndex(albion_lagged['date2']).month
+    albion_lagged['day']=pd.DatetimeIndex(albion_lagged['date2']).day
+    albion_lagged=albion_lagged.drop(columns=['date','date1','date2'])
+    bonnev_lagged=bonnev[['date','chin'+str(year),'chin_hist']]
+    if calendar.isleap(year)==False:
+        bonnev_lagged=bonnev_lagged[bonnev_lagged['date']!='Feb-29']
+    bonnev_lagged['date1']=pd.to_datetime(bonnev_lagged['date'].apply(lambda x: str(year)+'-'+x), errors='coerce',format='%Y-%b-%d')
+    bonnev_lagged['date2']=bonnev_lagged['date1'] - pd.Timedelta(days=lag2)
+    bonnev_lagged['year2']=pd.DatetimeIndex(bonnev_lagged['date2']).year
+    bonnev_lagged['m']=pd.DatetimeIndex(bonnev_lagged['date2']).month
+    bonnev_lagged['day']=pd.DatetimeIndex(bonnev_lagged['date2']).day
+    bonnev_lagged=bonnev_lagged[bonnev_lagged['year2']==year]
+    bonnev_lagged=bonnev_lagged.drop(columns=['date','date1','date2','year2'])
+    if calendar.isleap(year)==False:
+        lagged=cal.merge(bonnev_lagged, how='left', on=['m','day'])
+    else:
+        lagged=cal_leap.merge(bonnev_lagged, how='left', on=['m','day'])
+    lagged=lagged.merge(albion_lagged, on=['m','day'], how='left')
+    return lagged
+
+## ----------------Timing ---------------------##
+def timed(f, *args, repeats=3):
+    """
+    Best wall time in seconds over a few runs, and the result of the last run
+    """
+    best=float('inf')
+    for i in range(repeats):
+        t0=time.perf_counter()
+        res=f(*args)
+        best=min(best, time.perf_counter()-t0)
+    return best, res
+
+def compare(name, old, new, args, repeats=3):
+    t_old, res_old=timed(old, *args, repeats=repeats)
+    t_new, res_new=timed(new, *args, repeats=repeats)
+    if not isinstance(res_old, tuple):
+        res_old, res_new=(res_old,), (res_new,)
+    for a, b in zip(res_old, res_new):
+        pd.testing.assert_frame_equal(a, b, check_dtype=False)
+    print(f'{name:<12} old {t_old*1000:8.1f} ms  new {t_new*1000:8.1f} ms  x{t_old/t_new:5.1f}')
+
+## ----------------Callback payloads ---------------------##
+def payload_report():
+    """
+    Bytes each callback sends, as plain json, packed by figpack and packed with typed arrays,
+    before and after gzip/brotli
+    """
+    import copy
+    import gzip
+    import brotli
+    from plotly.io.json import to_json_plotly
+    from figpack import pack_figure
+    import app
+    app.compact_figures=False
+    yr=app.curyr-2
+    cases=[('update_salmon_timeseries', loc, lambda loc=loc: app.salmon_timeseries_figure.__wrapped__(loc, app.plane.current.version))
+           for loc in app.salmon_locations]
+    cases+=[('update_orca_map', pod+' '+str(yr), lambda pod=pod: app.orca_map_figure.__wrapped__(pod, yr, app.plane.current.version))
+            for pod in ['J pod','All pods']]
+    cases+=[('update_orca_lines', 'All pods', lambda: app.update_orca_lines('All pods'))]
+    print(f'{"callback":<26}{"input":<22}'+(f'{{:>9}}{{:>8}}{{:>8}}'*3).format('json','gzip','br','packed','gzip','br','typed','gzip','br'))
+    for name, arg, f in cases:
+        raw=f()
+        sizes=[]
+        for fig in (raw, pack_figure(copy.deepcopy(raw)), pack_figure(copy.deepcopy(raw), typed_arrays=True)):
+            b=to_json_plotly(fig).encode()
+            sizes+=[len(b), len(gzip.compress(b, 6)), len(brotli.compress(b, quality=4))]
+        print(f'{name:<26}{arg:<22}'+''.join(f'{n:>9}' if i%3==0 else f'{n:>8}' for i, n in enumerate(sizes)))
+
+## ----------------Suite ---------------------##
+# Every step the dashboard data goes through, timed on bundled or synthetic data (see synthdata.py)
+def measure(name, f, setup=None, repeats=3, **info):
+    """
+    Wall times of `repeats` runs and the peak memory of one more run under tracemalloc
+    setup runs untimed before every run (to clear caches or copy input files)
+    """
+    times=[]
+    for i in range(repeats):
+        if setup: setup()
+        t0=time.perf_counter()
+        f()
+        times.append(time.perf_counter()-t0)
+    if setup: setup()
+    tracemalloc.start()
+    f()
+    peak=tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    res={'name':name, 'best_s':min(times), 'median_s':statistics.median(times), 'repeats':repeats,
+         'peak_mb':round(peak/2**20, 3), **info}
+    print(f'{name:<46} best {res["best_s"]*1000:9.1f} ms  median {res["median_s"]*1000:9.1f} ms  peak {res["peak_mb"]:8.1f} MB')
+    return res
+
+def callback_body(output, inputs):
+    """
+    Request body the browser posts to _dash-update-component for a single output callback
+    """
+    oid, prop=output.split('.')
+    return {'output':output, 'outputs':{'id':oid, 'property':prop},
+            'inputs':[{'id':i.split('.')[0], 'property':i.split('.')[1], 'value':v} for i, v in inputs],
+            'changedPropIds':[inputs[0][0]]}
+
+def suite(argv):
+    p=argparse.ArgumentParser(prog='benchmark.py suite')
+    p.add_argument('--data', choices=['bundled','synthetic'], default='bundled',
+                   help='bundled: data/ plus synthetic files for what it lacks; synthetic: everything synthetic')
+    p.add_argument('--years', type=int, default=10, help='years of synthetic sightings')
+    p.add_argument('--rows', type=int, default=1500, help='synthetic sightings per year')
+    p.add_argument('--comment-length', type=int, default=20, help='words in a synthetic Acartia comment')
+    p.add_argument('--repeats', type=int, default=3)
+    p.add_argument('--out', default='benchmark.json')
+    p.add_argument('--keep', action='store_true', help='keep the generated data folder')
+    args=p.parse_args(argv)
+    import synthdata
+    from scrapefunc import proc_acartia
+
+    data_path=tempfile.mkdtemp(prefix='orcasalmon-bench-')+'/'
+    t0=time.perf_counter()
+    synthdata.make_data(data_path, years=args.years, rows=args.rows, comment_length=args.comment_length,
+                        base=pjoin(APP_PATH, 'data') if args.data=='bundled' else None)
+    print(f'data in {data_path} ({time.perf_counter()-t0:.1f} s to generate)')
+    fos, bon, wash=pjoin(data_path,'foschinook/'), pjoin(data_path,'bonchinook/'), pjoin(data_path,'lakewash/')
+    acartia, twm=pjoin(data_path,'acartia/'), pjoin(data_path,'twm/')
+    curyr=date.today().year
+    n=args.repeats
+    results=[]
+
+    # Loaders
+    results.append(measure('load_bon', lambda: load_bon(bon), repeats=n))
+    results.append(measure('load_albion', lambda: load_albion(fos), repeats=n))
+    results.append(measure('load_wash', lambda: load_wash(wash), repeats=n))
+    sightings=load_sightings(acartia, twm)
+    regions=load_regions()
+    lon, lat=sightings['longitude'].to_numpy(dtype=float), sightings['latitude'].to_numpy(dtype=float)
+    results.append(measure('classify regions', lambda: regions['salish_sea'].classify(lon, lat), repeats=n,
+                           records=len(sightings)))
+
+    # proc_acartia on a copy of the raw records, first run (every year rewritten)
+    scratch=tempfile.mkdtemp(prefix='orcasalmon-acartia-')+'/'
+    dump='acartia_'+str(date.today())+'.csv'
+    def fresh_acartia():
+        shutil.rmtree(scratch, ignore_errors=True)
+        os.makedirs(scratch)
+        shutil.copy(acartia+dump, scratch+dump)
+    records=len(pd.read_csv(acartia+dump, usecols=['created'])) if os.path.exists(acartia+dump) else 0
+    if records:
+        results.append(measure('proc_acartia', lambda: proc_acartia(scratch), setup=fresh_acartia, repeats=n,
+                               records=records))
+    shutil.rmtree(scratch, ignore_errors=True)
+
+    # Processing
+    for loc in ['Albion','Bonneville']:
+        results.append(measure('peak_chinook '+loc, lambda loc=loc: peak_chinook(curyr, fos, bon, loc), repeats=n))
+    for src, pod, loc in [('twm','',''), ('acartia','',''), ('twm','J','central salish'), ('acartia','','Haro Strait and San Juan Islands')]:
+        results.append(measure(f'peak_srkw {src} {pod or "all"} {loc or "all"}',
+                               lambda src=src, pod=pod, loc=loc: peak_srkw(curyr, twm, acartia, src, pod, loc), repeats=n))
+    bonnev=load_bon(bon)
+    albion=calendar_template(bonnev, leap=True).merge(load_albion(fos)[0], how='left', on=['m','day'])
+    index=LagIndex(albion, bonnev)
+    results.append(measure('create_lagged', lambda: create_lagged(curyr-1, albion, bonnev, 10, 10, index=index), repeats=n*10))
+    results.append(measure('create_lagged no index', lambda: create_lagged(curyr-1, albion, bonnev, 10, 10), repeats=n))
+
+    # The app, started on this data folder, and every callback through the Flask test client
+    os.environ['DATA_PATH']=data_path
+    t0=time.perf_counter()
+    tracemalloc.start()
+    import app
+    peak=tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    res={'name':'app start-up', 'best_s':time.perf_counter()-t0, 'repeats':1, 'peak_mb':round(peak/2**20, 3)}
+    res['median_s']=res['best_s']
+    print(f'{"app start-up (under tracemalloc)":<46} {res["best_s"]*1000:9.1f} ms  peak {res["peak_mb"]:8.1f} MB')
+    results.append(res)
+    client=app.server.test_client()
+    def clear_caches():
+        app.salmon_timeseries_figure.cache_clear()
+        app.orca_map_figure.cache_clear()
+    def post(body):
+        r=client.post('/_dash-update-component', json=body, headers={'Accept-Encoding':'gzip, deflate, br'})
+        if r.status_code not in (200, 204):
+            raise RuntimeError(body['output']+' '+str(body['inputs'])+': '+str(r.status_code))
+        return r
+    year=curyr-1
+    cases=[('update_salmon_timeseries '+loc, callback_body('salmon-timeseries.figure', [('location-dropdown.value', loc)]))
+           for loc in app.salmon_locations]
+    cases+=[(f'update_orca_map {pod} {year}', callback_body('orca-map.figure',
+            [('pod-dropdown.value', pod), ('year-dropdown.value', year), ('orca-map.relayoutData', None)]))
+            for pod in ['J pod','K pod','L pod','All pods']]
+    cases+=[('update_orca_lines '+pod, callback_body('salmon-orca-timeseries.figure', [('pod-dropdown.value', pod)]))
+            for pod in ['J pod','All pods']]
+    for name, body in cases:
+        results.append(measure(name, lambda body=body: post(body), setup=clear_caches, repeats=n,
+                               response_bytes=len(post(body).data)))
+
+    out={'meta':{'date':dt.now().isoformat(timespec='seconds'), 'data':args.data, 'years':args.years,
+                 'rows':args.rows, 'comment_length':args.comment_length, 'repeats':n,
+                 'python':platform.python_version(), 'pandas':pd.__version__, 'numpy':np.__version__,
+                 'machine':platform.machine(), 'processor':platform.processor() or platform.machine()},
+         'results':results}
+    with open(args.out, 'w') as f:
+        json.dump(out, f, indent=1)
+    print('results in '+args.out)
+    if args.keep:
+        print('data kept in '+data_path)
+    else:
+        shutil.rmtree(data_path, ignore_errors=True)
+
+def compare_runs(old_file, new_file):
+    """
+    Best times and peak memory of two suite runs side by side
+    """
+    old, new=(json.load(open(f))['results'] for f in (old_file, new_file))
+    old={r['name']:r for r in old}
+    print(f'{"":<46}{"old ms":>10}{"new ms":>10}{"ratio":>8}{"old MB":>9}{"new MB":>9}')
+    for r in new:
+        o=old.get(r['name'])
+        if o is None:
+            print(f'{r["name"]:<46}{"":>10}{r["best_s"]*1000:10.1f}')
+            continue
+        print(f'{r["name"]:<46}{o["best_s"]*1000:10.1f}{r["best_s"]*1000:10.1f}{r["best_s"]/o["best_s"]:8.2f}'
+              f'{o["peak_mb"]:9.1f}{r["peak_mb"]:9.1f}')
+
+if __name__ == '__main__':
+    if 'payload' in sys.argv:
+        payload_report()
+        sys.exit()
+    if len(sys.argv)>1 and sys.argv[1]=='suite':
+        suite(sys.argv[2:])
+        sys.exit()
+    if len(sys.argv)>1 and sys.argv[1]=='compare':
+        compare_runs(sys.argv[2], sys.argv[3])
+        sys.exit()
+    repeats=int(sys.argv[1]) if len(sys.argv)>1 else 3
+    compare('load_bon', load_bon_merge, load_bon, (bon_path,), repeats)
+    compare('load_albion', load_albion_merge, load_albion, (fos_path,), repeats)
+    bonnev=load_bon(bon_path)
+    albion=calendar_template(bonnev, leap=True).merge(load_albion(fos_path)[0], how='left', on=['m','day'])
+    index=LagIndex(albion, bonnev)
+    yr=date.today().year-1
+    compare('lagged', create_lagged_merge, lambda *a: create_lagged(*a, index=index),
+            (yr, albion, bonnev, 10, 10), repeats*10)
+    lags=[(l1, l2) for l1 in range(0, 31) for l2 in range(0, 31)]
+    t_old, res=timed(lambda: [create_lagged_merge(yr, albion, bonnev, l1, l2) for l1, l2 in lags[:20]], repeats=1)
+    t_new, res=timed(create_lagged_many, yr, albion, bonnev, lags, index, repeats=repeats)
+    print(f'{"lag sweep":<12} old {t_old/20*len(lags)*1000:8.1f} ms  new {t_new*1000:8.1f} ms  ({len(lags)} lag pairs, old extrapolated from 20)')
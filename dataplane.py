@@ -0,0 +1,229 @@
+## Project Name: Orcasound Salmon
+### Program Name: dataplane.py
+### Purpose: The data the dashboard callbacks read, reloaded in a running worker when a new data store appears
+##### Date Created: Oct 18th 2026
+
+"""
+A Snapshot holds every frame and index of one data version and is never changed after it is built.
+The DataPlane points at the current snapshot; callbacks take plane.snapshot(version) once and use it to
+the end, so a swap never changes the data under a request that is already running.
+
+    plane = DataPlane(lambda phase: load_snapshot(...), interval=60)
+    d = plane.snapshot()          # current data
+    plane.reload()                # new snapshot if the store on disk has another version
+    plane.watch()                 # poll the store manifest in a background thread
+
+A reload builds the next snapshot (and warms its figures, see on_swap) off the request path, then
+swaps one reference. The snapshot before it stays reachable through plane.snapshot(old_version), so a
+page loaded before the swap keeps working until its next reload. Every gunicorn worker has its own plane
+and watcher.
+"""
+
+import os
+import time
+import logging
+import threading
+from os.path import join as pjoin
+from datetime import datetime
+
+import pandas as pd
+from flask import request, jsonify, abort
+
+from apputils import create_lagged, LagIndex, CountCube, SightingGrid, LagCorr
+from datastore import STORE_FORMAT, load_store, build_frames, hash_sources, data_version, read_manifest
+from httpcache import app_version
+from metrics import span, authorized
+from tracks import Tracks
+
+log = logging.getLogger(__name__)
+POP_COLUMNS = {"All pods": "JKL", "J pod": "J", "K pod": "K", "L pod": "L"}
+
+
+class Snapshot:
+    """
+    Frames and indexes of one data version (see load_snapshot)
+    """
+
+    def __init__(self, frames, version, app_ver, srkwdata, curyr):
+        self.version = version
+        self.app_version = app_ver
+        self.loaded = datetime.now().isoformat(timespec="seconds")
+        self.frames = frames
+        # Bonneville data and calendar dataframes
+        self.bonnev = frames["bonnev"]
+        self.cal = frames["cal"]
+        self.calleap = frames["calleap"]
+        # Albion data, and a combined data of Albion and Bonneville with a lag
+        self.albion = frames["albion"]
+        self.albsum = frames["albsum"]
+        self.lagidx = LagIndex(self.albion, self.bonnev)  # day of year index reused by every create_lagged call
+        self.lagged = create_lagged(curyr, self.albion, self.bonnev, 10, 10, index=self.lagidx)
+        # Lake Washington data
+        self.wash = frames["wash"]
+        # Acartia and TWM orca sightings for the map
+        self.sightings = frames["sightings"]
+        self.map_grid = SightingGrid(self.sightings)  # grid cells for clustering busy maps
+        # Satellite tag fixes, indexed by animal and time for the track layer of the map
+        self.tracks = Tracks(frames["tracks"])
+        # Daily SRKW reports by year, day, pod, region and source (see srkw_count_year)
+        self.count_cube = CountCube(
+            frames["count_cube"], frames["count_cube_years"]["year"], frames["count_cube_regions"]["region"]
+        )
+        # Albion, Bonneville and SRKW daily series as year x day arrays for the lag explorer
+        self.lagcorr = LagCorr(self.albion, self.bonnev, self.count_cube, range(1939, curyr + 1))
+        # Peak values of Chinook at Albion and of Orca sightings
+        self.apeak, self.apeak95 = frames["apeak"], frames["apeak95"]
+        self.srkw_cs_peak, self.srkw_cs_peak95 = frames["srkw_cs_peak"], frames["srkw_cs_peak95"]
+        # SRKW population by pod, as year and SRKW columns
+        self.srkwdata = {
+            pod: srkwdata[["year", col]].rename(columns={col: "SRKW"}) for pod, col in POP_COLUMNS.items()
+        }
+
+
+def load_snapshot(data_path, store_path, curyr, app_path, day, phase=""):
+    """
+    Snapshot of the current data store, or of the csv files when there is no usable store
+    phase: prefix of the span names (start up phases on /metrics)
+    """
+    with span(phase + "load_store"):
+        store = load_store(store_path, curyr)
+    if store is not None:
+        frames, manifest = store
+        data_ver = manifest["version"]
+    else:
+        with span(phase + "build_frames"):
+            frames = build_frames(data_path, curyr)
+            data_ver = data_version(hash_sources(data_path))
+    # Version of every response (data, code and start day), used as ETag by httpcache.py
+    with span(phase + "app_version"):
+        app_ver = app_version(data_ver, app_path, data_path, day)
+    with span(phase + "srkw_population"):
+        srkwdata = pd.read_csv(pjoin(data_path, "SRKW.csv"))
+    with span(phase + "indexes"):
+        return Snapshot(frames, data_ver, app_ver, srkwdata, curyr)
+
+
+def store_version(store_path, curyr):
+    """
+    Version of the data store on disk, None when there is none the app could load
+    """
+    manifest = read_manifest(store_path)
+    if manifest is None or manifest.get("format") != STORE_FORMAT or manifest.get("curyr") != curyr:
+        return None
+    return manifest.get("version")
+
+
+class DataPlane:
+    def __init__(self, load, store_path, curyr, interval=60, on_swap=None):
+        """
+        load: function(phase) returning a new Snapshot
+        interval: seconds between two looks at the store manifest (0: no watcher)
+        on_swap: function(snapshot) run on the next snapshot before it goes live (to warm caches)
+        """
+        self.load = load
+        self.store_path = store_path
+        self.curyr = curyr
+        self.interval = interval
+        self.on_swap = on_swap
+        self.current = load("")
+        self.previous = None
+        self.next = None
+        self.reloads = 0
+        self._reload_lock = threading.Lock()
+        self._watcher_pid = None
+
+    def snapshot(self, version=None):
+        """
+        Snapshot of a data or app version (current, previous or being warmed), else the current one
+        """
+        current = self.current
+        if version is None:
+            return current
+        for s in (current, self.next, self.previous):
+            if s is not None and version in (s.version, s.app_version):
+                return s
+        return current
+
+    def stale(self):
+        version = store_version(self.store_path, self.curyr)
+        return version is not None and version != self.current.version
+
+    def reload(self, force=False):
+        """
+        Build a snapshot of the store on disk and swap it in if its version is new (or force)
+        Returns True when a new snapshot went live
+        """
+        with self._reload_lock:
+            if not force and not self.stale():
+                return False
+            t0 = time.perf_counter()
+            snap = self.load("reload.")
+            if not force and snap.version == self.current.version:
+                return False
+            self.next = snap
+            try:
+                if self.on_swap is not None:
+                    self.on_swap(snap)
+            finally:
+                self.next = None
+            # previous first: a reader that still sees the old current finds it either way
+            self.previous = self.current
+            self.current = snap
+            self.reloads += 1
+            log.info("data version %s live after %.1f s", snap.version, time.perf_counter() - t0)
+            return True
+
+    def watch(self):
+        """
+        Start the watcher thread of this process (again after a fork, e.g. gunicorn --preload)
+        """
+        if self.interval <= 0 or self._watcher_pid == os.getpid():
+            return
+        self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name="dataplane-watcher", daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reload()
+            except Exception:
+                log.exception("data reload failed, still serving %s", self.current.version)
+
+    def status(self):
+        return {
+            "pid": os.getpid(),
+            "data_version": self.current.version,
+            "app_version": self.current.app_version,
+            "loaded": self.current.loaded,
+            "previous_version": self.previous.version if self.previous else None,
+            "store_version": store_version(self.store_path, self.curyr),
+            "reloads": self.reloads,
+            "watch_interval": self.interval,
+        }
+
+
+def install(server, plane, token=None, prefix="/_data/"):
+    """
+    Start the watcher with the first request of every worker and serve
+        GET  <prefix>version   the data version this worker serves
+        POST <prefix>reload    reload now (Authorization: Bearer <token>; ?force=1 to rebuild the same version)
+    Without a token the reload endpoint is off
+    """
+
+    @server.before_request
+    def start_watcher():
+        plane.watch()
+
+    @server.route(prefix + "version")
+    def data_version_status():
+        return jsonify(plane.status())
+
+    @server.route(prefix + "reload", methods=["POST"])
+    def data_reload():
+        if not authorized(token):
+            abort(403)
+        reloaded = plane.reload(force=request.args.get("force") == "1")
+        return jsonify(dict(plane.status(), reloaded=reloaded))
+
+    return server
@@ -0,0 +1,279 @@
+## Project Name: Orcasound Salmon
+### Program Name: datastore.py
+### Purpose: Prebuilt columnar copy of the dashboard data so the app does not parse csv files at start up
+
+"""
+Layout of a store (one folder per data version, manifest.json points at the current one)
+
+    data/appstore/manifest.json
+    data/appstore/<version>/<frame>/frame.json
+    data/appstore/<version>/<frame>/c0000.npy ...
+
+Every data frame column is saved as its own .npy file so the app can memory-map them,
+plain arrays (the sighting count cube) are saved as one a.npy.
+Numeric columns stay memory-mapped (and shared between gunicorn workers through the
+page cache), text and date columns are turned back into python objects on load.
+Categorical columns (the sighting regions) are saved as their integer codes, with the
+categories in frame.json.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import pathlib
+from os.path import join as pjoin
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from apputils import (load_albion, load_bon, load_wash, calendar_template,
+                      load_sightings, apeak_df, srkw_peak_df, CountCube)
+from metrics import span
+from regions import load_regions, REGIONS_FILE
+from tracks import load_tracks
+
+STORE_FORMAT = 6  # bump when the layout or the set of frames changes
+SOURCE_DIRS = ["bonchinook", "foschinook", "acartia", "lakewash", "twm", "srkw_satellite_tagging"]
+SOURCE_PATTERNS = {"acartia": "srkw_*.csv"}  # the raw dumps (acartia_<date>.csv) are not read by the app
+
+
+def source_files(data_path):
+    """
+    List the csv files the dashboard data is built from, and the region polygons if the data folder has its own
+    """
+    files = []
+    for d in SOURCE_DIRS:
+        files += sorted(pathlib.Path(data_path, d).glob(SOURCE_PATTERNS.get(d, "*.csv")))
+    files += [p for p in [pathlib.Path(data_path, "regions.json")] if p.exists()]
+    return files
+
+
+def regions_file(data_path):
+    """
+    regions.json of a data folder, the one next to the code when the folder has none
+    """
+    path = pjoin(data_path, "regions.json")
+    return path if os.path.exists(path) else REGIONS_FILE
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_sources(data_path):
+    """
+    Content hash of every source file, keyed by path relative to data_path
+    """
+    return {
+        pathlib.Path(f).relative_to(data_path).as_posix(): file_hash(f)
+        for f in source_files(data_path)
+    }
+
+
+def data_version(hashes):
+    """
+    Short version id of a set of source file hashes
+    """
+    h = hashlib.sha256()
+    for k in sorted(hashes):
+        h.update((k + ":" + hashes[k] + "\n").encode())
+    return h.hexdigest()[:16]
+
+
+## ----------------Save and load single data frames ---------------------##
+def _to_array(s):
+    """
+    Turn a column into something np.save can write without pickling
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s.cat.codes.to_numpy(), "category", None
+    kind = pd.api.types.infer_dtype(s, skipna=True)
+    if s.dtype != object:
+        return s.to_numpy(), "numeric", None
+    if kind == "integer":
+        return s.to_numpy(dtype="int64"), "numeric", None
+    if kind in ("floating", "mixed-integer-float"):
+        return s.to_numpy(dtype="float64"), "numeric", None
+    mask = s.isnull().to_numpy()
+    if kind == "date":
+        return s.to_numpy(dtype="datetime64[D]"), "date", mask
+    if kind in ("string", "empty"):
+        return s.fillna("").to_numpy(dtype=str), "str", mask
+    raise TypeError("Can not store column " + str(s.name) + " of type " + kind)
+
+
+def save_frame(df, path):
+    os.makedirs(path, exist_ok=True)
+    cols = []
+    for i, name in enumerate(df.columns):
+        values, kind, mask = _to_array(df[name])
+        col = {"name": name, "file": "c%04d.npy" % i, "kind": kind}
+        if kind == "category":
+            col["categories"] = df[name].cat.categories.tolist()
+        np.save(pjoin(path, col["file"]), values, allow_pickle=False)
+        if mask is not None and mask.any():
+            col["mask"] = "m%04d.npy" % i
+            np.save(pjoin(path, col["mask"]), mask, allow_pickle=False)
+        cols.append(col)
+    with open(pjoin(path, "frame.json"), "w") as f:
+        json.dump({"rows": len(df), "columns": cols}, f)
+
+
+def save_array(a, path):
+    os.makedirs(path, exist_ok=True)
+    np.save(pjoin(path, "a.npy"), a, allow_pickle=False)
+    with open(pjoin(path, "frame.json"), "w") as f:
+        json.dump({"array": "a.npy", "shape": list(a.shape)}, f)
+
+
+def load_frame(path, mmap=True):
+    """
+    Load a data frame saved by save_frame(), or the array saved by save_array()
+    """
+    with open(pjoin(path, "frame.json")) as f:
+        meta = json.load(f)
+    if "array" in meta:
+        return np.load(pjoin(path, meta["array"]), mmap_mode="r" if mmap else None)
+    data = {}
+    for col in meta["columns"]:
+        values = np.load(pjoin(path, col["file"]), mmap_mode="r" if mmap else None)
+        if col["kind"] == "date":
+            values = pd.Series(values.astype("datetime64[D]").astype(object))
+        elif col["kind"] == "str":
+            values = pd.Series(values.astype(object))
+        elif col["kind"] == "category":
+            values = pd.Categorical.from_codes(values, categories=col["categories"])
+        if "mask" in col:
+            values = pd.Series(values)
+            values[np.load(pjoin(path, col["mask"]))] = np.nan
+        data[col["name"]] = values
+    return pd.DataFrame(data, index=pd.RangeIndex(meta["rows"]), copy=False)
+
+
+## ----------------Build and load the whole store ---------------------##
+def build_frames(data_path, curyr):
+    """
+    Run the csv loaders and return every data frame the dashboard needs at start up
+    """
+    fos_path = pjoin(data_path, "foschinook/")
+    bon_path = pjoin(data_path, "bonchinook/")
+    lakewash_path = pjoin(data_path, "lakewash/")
+    acartia_path = pjoin(data_path, "acartia/")
+    twm_path = pjoin(data_path, "twm/")
+    tagging_path = pjoin(data_path, "srkw_satellite_tagging/")
+
+    frames = {}
+    with span("frames.bonneville"):
+        frames["bonnev"] = load_bon(bon_path)
+    with span("frames.calendars"):
+        frames["cal"] = calendar_template(frames["bonnev"])
+        frames["calleap"] = calendar_template(frames["bonnev"], leap=True)
+    with span("frames.albion"):
+        albion, frames["albsum"] = load_albion(fos_path)
+        frames["albion"] = frames["calleap"].merge(albion, how="left", on=["m", "day"])
+    with span("frames.lake_washington"):
+        frames["wash"] = load_wash(lakewash_path)
+    with span("frames.sightings"):
+        frames["sightings"] = load_sightings(acartia_path, twm_path, regions=load_regions(regions_file(data_path)))
+    with span("frames.tracks"):
+        frames["tracks"] = load_tracks(tagging_path)
+    with span("frames.albion_peaks"):
+        frames["apeak"], frames["apeak95"] = apeak_df(curyr, fos_path, bon_path)
+    with span("frames.srkw_peaks"):
+        frames["srkw_cs_peak"], frames["srkw_cs_peak95"] = srkw_peak_df(curyr, twm_path, acartia_path,
+                                                                        sightings=frames["sightings"])
+    frames = {k: v.reset_index(drop=True) for k, v in frames.items()}
+    with span("frames.count_cube"):
+        cube = CountCube.build(frames["sightings"])
+    frames["count_cube"] = cube.counts
+    frames["count_cube_years"] = pd.DataFrame({"year": cube.years})
+    frames["count_cube_regions"] = pd.DataFrame({"region": cube.regions})
+    return frames
+
+
+def save_store(frames, store_path, version, curyr, sources=None, keep=2):
+    """
+    Write frames into a new version folder and then point manifest.json at it
+    Readers never see a half written version; older versions beyond `keep` are removed
+    """
+    version_path = pjoin(store_path, version)
+    tmp_path = version_path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    for name, df in frames.items():
+        if isinstance(df, np.ndarray):
+            save_array(df, pjoin(tmp_path, name))
+        else:
+            save_frame(df, pjoin(tmp_path, name))
+    shutil.rmtree(version_path, ignore_errors=True)
+    os.replace(tmp_path, version_path)
+
+    manifest = {
+        "format": STORE_FORMAT,
+        "version": version,
+        "curyr": curyr,
+        "built": datetime.now().isoformat(timespec="seconds"),
+        "frames": sorted(frames),
+        "sources": sources or {},
+    }
+    with open(pjoin(store_path, "manifest.json.tmp"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(pjoin(store_path, "manifest.json.tmp"), pjoin(store_path, "manifest.json"))
+
+    old = sorted(
+        (p for p in pathlib.Path(store_path).iterdir() if p.is_dir() and p.name != version),
+        key=lambda p: p.stat().st_mtime,
+    )
+    for p in old[: max(len(old) - (keep - 1), 0)]:
+        shutil.rmtree(p, ignore_errors=True)
+    return manifest
+
+
+def read_manifest(store_path):
+    try:
+        with open(pjoin(store_path, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_store(store_path, curyr=None, mmap=True):
+    """
+    Load every frame of the current store version
+    Returns (frames, manifest), or None when there is no usable store
+    (missing, older format, or built in a different year than curyr)
+    """
+    manifest = read_manifest(store_path)
+    if manifest is None or manifest.get("format") != STORE_FORMAT:
+        return None
+    if curyr is not None and manifest.get("curyr") != curyr:
+        return None
+    version_path = pjoin(store_path, manifest["version"])
+    try:
+        frames = {name: load_frame(pjoin(version_path, name), mmap=mmap)
+                  for name in manifest["frames"]}
+    except OSError:
+        return None
+    return frames, manifest
+
+
+def build_store(data_path, store_path, curyr, force=False):
+    """
+    Rebuild the store from the csv files unless it is already up to date
+    """
+    sources = hash_sources(data_path)
+    version = data_version(sources)
+    manifest = read_manifest(store_path)
+    if (not force and manifest is not None
+            and manifest.get("format") == STORE_FORMAT
+            and manifest.get("version") == version
+            and manifest.get("curyr") == curyr
+            and os.path.isdir(pjoin(store_path, version))):
+        return manifest
+    frames = build_frames(data_path, curyr)
+    return save_store(frames, store_path, version, curyr, sources=sources)
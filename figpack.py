@@ -0,0 +1,161 @@
+## Project Name: Orcasound Salmon
+### Program Name: figpack.py
+### Purpose: To shrink the figure json the dashboard callbacks send to the browser
+##### Date Created: Oct 18th 2026
+
+"""
+Rewrites of a figure dict (the output of json.loads(fig.to_json())):
+
+1. Traces whose x is a list of calendar labels ('Jan-1', 'Jan-2', ...) become a start
+   date plus a one day step (x0/dx) on a date axis, with the labels kept as tick and
+   hover format. Days without a label become gaps in y.
+2. Optionally, numeric arrays become plotly typed arrays ({"dtype": "i2", "bdata": <base64>}),
+   downcast to the smallest integer type that holds them, or float32.
+
+Typed arrays make the json 20-30% smaller but the base64 text compresses worse than the
+number lists it replaces, so behind gzip/brotli they are a few percent larger
+(python benchmark.py payload); they are off unless asked for.
+They need plotly.js 2.28 or newer in the browser (app.py serves the one bundled with the plotly package).
+"""
+
+import re
+import base64
+import calendar
+from datetime import date
+
+import numpy as np
+
+DAY_MS = 86400000
+CAL_LABEL = re.compile(r"^[A-Z][a-z]{2}-\d{1,2}$")
+MONTHS = {calendar.month_abbr[i]: i for i in range(1, 13)}
+NUMERIC_KEYS = ["x", "y", "z", "lat", "lon"]
+MARKER_KEYS = ["color", "size", "opacity"]
+MIN_LENGTH = 8  # shorter arrays are not worth encoding
+INT_TYPES = [("i1", np.int8), ("u1", np.uint8), ("i2", np.int16), ("u2", np.uint16),
+             ("i4", np.int32), ("u4", np.uint32)]
+
+
+## ----------------Typed arrays ---------------------##
+def typed_array(values):
+    """
+    Numeric list as a plotly typed array, or None when the list has anything but numbers and None
+    Integers go to the smallest integer type that holds them, everything else to float32
+    (None becomes NaN, a gap for plotly)
+    """
+    if len(values) < MIN_LENGTH:
+        return None
+    if any(isinstance(v, (str, bool, list, dict)) for v in values):
+        return None
+    try:
+        a = np.array([np.nan if v is None else v for v in values], dtype="float64")
+    except (TypeError, ValueError):
+        return None
+    if not np.isnan(a).any() and (a == np.round(a)).all():
+        for dtype, t in INT_TYPES:
+            info = np.iinfo(t)
+            if a.min() >= info.min and a.max() <= info.max:
+                return {"dtype": dtype, "bdata": base64.b64encode(a.astype(t).tobytes()).decode()}
+    a32 = a.astype("float32")
+    finite = np.isfinite(a)
+    if not np.allclose(a32[finite], a[finite], rtol=1e-6, atol=0):
+        return {"dtype": "f8", "bdata": base64.b64encode(a.tobytes()).decode()}
+    return {"dtype": "f4", "bdata": base64.b64encode(a32.tobytes()).decode()}
+
+
+def pack_arrays(trace):
+    for key in NUMERIC_KEYS:
+        if isinstance(trace.get(key), list):
+            packed = typed_array(trace[key])
+            if packed is not None:
+                trace[key] = packed
+    marker = trace.get("marker")
+    if isinstance(marker, dict):
+        for key in MARKER_KEYS:
+            if isinstance(marker.get(key), list):
+                packed = typed_array(marker[key])
+                if packed is not None:
+                    marker[key] = packed
+    return trace
+
+
+## ----------------Calendar x axes ---------------------##
+def label_day(label, year):
+    mon, day = label.split("-")
+    return (date(year, MONTHS[mon], int(day)) - date(year, 1, 1)).days
+
+
+def is_calendar(values):
+    return (isinstance(values, list) and len(values) >= MIN_LENGTH
+            and all(isinstance(v, str) and CAL_LABEL.match(v) and v[:3] in MONTHS for v in values))
+
+
+def axis_name(trace):
+    """
+    Layout key of the trace's x axis ('x2' -> 'xaxis2')
+    """
+    return "xaxis" + trace.get("xaxis", "x")[1:]
+
+
+def day_date(year, day):
+    return str(date.fromordinal(date(year, 1, 1).toordinal() + day))
+
+
+def calendar_trace(trace, year):
+    """
+    x0, dx and the y list with gaps of a trace with 'Mon-D' x labels, or None if it can not be rewritten
+    (other per-point arrays, repeated days, or skipped days on a line that does not connect gaps)
+    """
+    if not (is_calendar(trace.get("x")) and isinstance(trace.get("y"), list) and len(trace["y"]) == len(trace["x"])):
+        return None
+    if any(isinstance(v, list) and len(v) == len(trace["x"]) for k, v in trace.items() if k not in ("x", "y")):
+        return None
+    days = [label_day(x, year) for x in trace["x"]]
+    if len(set(days)) != len(days):
+        return None
+    first = min(days)
+    y = [None] * (max(days) - first + 1)
+    for d, v in zip(days, trace["y"]):
+        y[d - first] = v
+    if len(y) > len(days) and not trace.get("connectgaps"):
+        return None
+    return day_date(year, first), DAY_MS, y
+
+
+def calendar_traces(fig):
+    """
+    Rewrite 'Mon-D' x labels as x0/dx day steps on a date axis
+    An axis is only rewritten when every trace on it can be; it uses a leap year calendar
+    when any trace has a Feb-29 label, otherwise a non-leap one
+    """
+    per_axis = {}
+    for trace in fig.get("data", []):
+        per_axis.setdefault(axis_name(trace), []).append(trace)
+    for axis, traces in per_axis.items():
+        if not all(is_calendar(t.get("x")) for t in traces):
+            continue
+        year = 2020 if any("Feb-29" in t["x"] for t in traces) else 2021
+        steps = [calendar_trace(t, year) for t in traces]
+        if any(s is None for s in steps):
+            continue
+        for trace, (x0, dx, y) in zip(traces, steps):
+            trace["x0"], trace["dx"], trace["y"] = x0, dx, y
+            del trace["x"]
+        layout_axis = fig.setdefault("layout", {}).setdefault(axis, {})
+        layout_axis["type"] = "date"
+        layout_axis["tickformat"] = "%b-%-d"
+        layout_axis["hoverformat"] = "%b-%-d"
+        tickvals = layout_axis.get("tickvals")
+        if isinstance(tickvals, list) and all(isinstance(v, str) and CAL_LABEL.match(v) for v in tickvals):
+            layout_axis["tickvals"] = [day_date(year, label_day(v, year)) for v in tickvals]
+    return fig
+
+
+def pack_figure(fig, typed_arrays=False):
+    """
+    Smaller figure dict for the browser: calendar x axes, and typed arrays if asked for
+    """
+    calendar_traces(fig)
+    if typed_arrays:
+        for trace in fig.get("data", []):
+            pack_arrays(trace)
+    return fig
@@ -0,0 +1,112 @@
+## Project Name: Orcasound Salmon
+### Program Name: httpcache.py
+### Purpose: ETag and Cache-Control headers for the dash layout and dependencies, keyed on the data version
+##### Date Created: Oct 18th 2026
+
+"""
+The dashboard only changes when new data (or code) is deployed, so every response of a
+running app is fixed by the app version and the request itself:
+
+    layout, index and dependencies (GET)   ETag = hash(version, path)
+
+A request whose If-None-Match holds that ETag gets a 304 from before_request, without
+rendering the layout. flask-compress adds the encoding to the ETag of compressed responses
+("<hash>:br"), so the suffix is ignored when matching.
+Callbacks are POSTs, which browsers and shared caches neither revalidate nor cache, so they get
+no ETag; the data the browser fetches itself comes from /_orcamap/<version>/ URLs, cached for
+good by URL (see versioned() in app.py).
+"""
+
+import os
+import pathlib
+import hashlib
+
+from flask import request
+
+from datastore import file_hash, data_version
+
+GET_PATHS = ["", "_dash-layout", "_dash-dependencies"]
+
+
+def app_version(data_ver, app_path, data_path, day):
+    """
+    Version of everything a response depends on: the data store, the csv files the app reads
+    itself, the code and assets, and the day the app started (figures change with today's date)
+    """
+    files = sorted(pathlib.Path(app_path).glob("*.py"))
+    files += sorted(p for p in pathlib.Path(app_path, "assets").glob("*") if p.is_file())
+    hashes = {p.relative_to(app_path).as_posix(): file_hash(p) for p in files}
+    hashes["SRKW.csv"] = file_hash(pathlib.Path(data_path, "SRKW.csv"))
+    hashes["store"] = data_ver
+    hashes["day"] = day
+    return data_version(hashes)
+
+
+def cache_control(max_age):
+    if max_age <= 0:
+        return "no-cache"
+    return "public, max-age=%d" % max_age
+
+
+def request_etag(version, prefix="/"):
+    """
+    ETag of the response to the current request, or None when the response is not cacheable
+    """
+    path = request.path[len(prefix):] if request.path.startswith(prefix) else None
+    if request.method != "GET" or path not in GET_PATHS:
+        return None
+    h = hashlib.sha256(version.encode() + b"\n" + path.encode())
+    return '"' + h.hexdigest()[:32] + '"'
+
+
+def matching_tag(etag, if_none_match):
+    """
+    The tag of If-None-Match that is etag, with or without the encoding suffix flask-compress adds,
+    or None
+    """
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.removeprefix("W/").strip('"').split(":")[0] == etag.strip('"'):
+            return tag
+    return None
+
+
+def conditional_responses(server, version, prefix="/", max_age=None):
+    """
+    Add ETag and Cache-Control headers to the layout and dependencies responses of a dash app
+    and answer repeat requests with 304 Not Modified
+    version: the app version, or a function returning it when the data can change while the app runs
+    """
+    current = version if callable(version) else lambda: version
+    if max_age is None:
+        max_age = int(os.environ.get("HTTP_MAX_AGE", 300))
+    control = cache_control(max_age)
+
+    @server.before_request
+    def not_modified():
+        etag = request_etag(current(), prefix)
+        if etag is None:
+            return None
+        tag = matching_tag(etag, request.headers.get("If-None-Match"))
+        if tag is None:
+            return None
+        response = server.response_class(status=304)
+        response.headers["ETag"] = tag
+        response.headers["Cache-Control"] = control
+        return response
+
+    @server.after_request
+    def add_etag(response):
+        if response.status_code != 200 or "ETag" in response.headers:
+            return response
+        etag = request_etag(current(), prefix)
+        if etag is not None:
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = control
+        return response
+
+    return server
@@ -0,0 +1,19 @@
+## Project Name: Orcasound Salmon
+### Program Name: make_app_data.py
+### Purpose: To prebuild the dashboard data store read by app.py at start up
+##### Date Created: Oct 18th 2026
+
+import sys
+from os.path import join as pjoin
+import pathlib
+from datetime import date
+from datastore import build_store
+
+APP_PATH = str(pathlib.Path(__file__).parent.resolve())
+data_path=pjoin(APP_PATH, 'data')
+store_path=pjoin(APP_PATH, 'data/appstore')
+curyr=date.today().year
+
+if __name__ == '__main__':
+    manifest=build_store(data_path, store_path, curyr, force='--force' in sys.argv)
+    print('Data store version '+manifest['version']+' built '+manifest['built'])
@@ -2,15 +2,20 @@
 ### Program Name: make_peak_data.py
 ### Purpose: To create long format data of Chinook CPUE at Albion & SRKW for modeling
 ##### Date Created: Sep 17th 2023
+# Usage: python make_peak_data.py [--force]
 
 import os
+import sys
+import json
+import pathlib
 from os.path import join as pjoin
 from datetime import date
-from datetime import datetime as dt 
 import pandas as pd
-pd.options.mode.chained_assignment = None #suppress chained assignment 
+pd.options.mode.chained_assignment = None #suppress chained assignment
+from datastore import file_hash
+from regions import load_regions
 
-APP_PATH = os.path.abspath("")
+APP_PATH = str(pathlib.Path(__file__).parent.resolve())
 #Get dates
 today=date.today()
 todaystr=str(today)
@@ -26,56 +31,163 @@ bon_path=pjoin(APP_PATH,'data/bonchinook/')
 acartia_path=pjoin(APP_PATH, 'data/acartia/')
 twm_path=pjoin(APP_PATH, 'data/twm/')
 srkw_path=pjoin(APP_PATH, 'data/')
+# One csv per year of each long data set, rebuilt only when its source files change
+parts_path=pjoin(APP_PATH, 'data/peak_parts/')
+PARTS_FORMAT=2 # bump when a builder writes different columns or values, every part is rebuilt once
+legacy=load_regions()['legacy'] # North and south of puget sound entrance, see data/regions.json
 
+## ----------------Source files of a year ---------------------##
+def srkw_sources(year):
+    """
+    TWM files up to 2021, Acartia files from 2018
+    """
+    files=[]
+    if year<2022:
+        files.append(twm_path+"twm"+str(year)+".csv")
+    if year>=2018:
+        files.append(acartia_path+"srkw_"+str(year)+".csv")
+    return [f for f in files if os.path.exists(f)]
+
+def albion_sources(year):
+    f=fos_path+'fos'+str(year)+'.csv'
+    return [f] if os.path.exists(f) else []
+
+## ----------------Long data sets ---------------------##
 def srkw_long(years=[1991,]):
-    entry_lat=48.19437
-    allpres=pd.DataFrame()
+    """
+    Daily SRKW counts and presence flags in the Central Salish Sea, one row per year and day with sightings
+    Example data frame (index day_of_year)
+                SightDate  j k l year all_count AllSRpres Jpres Kpres Lpres
+    day_of_year
+    84          1990-03-25 0 0 1 1990 1         1         0     0     1
+    """
+    srkw=[]
     for year in years:
-        if year<2018:
-            srkw1=pd.read_csv(twm_path+"twm"+str(year)+".csv")
-            srkw=srkw1[srkw1['central_salish']==1][['SightDate','j','k','l']]
-        elif (year >=2018) and (year<2022):
-            srkw1=pd.read_csv(twm_path+"twm"+str(year)+".csv")
-            srkw1=srkw1[srkw1['central_salish']==1][['SightDate','j','k','l']]
-            srkw2=pd.read_csv(acartia_path+"srkw_"+str(year)+".csv")            
-            srkw2['central_salish']=srkw2['latitude'].apply(lambda x: 1 if x>entry_lat else 0)
-            srkw2['SightDate']=srkw2['created'].apply(lambda x: x[:10])
-            srkw2=srkw2[srkw2['central_salish']==1][['SightDate','J','K','L']]
-            srkw2.columns=['SightDate','j','k','l']
-            srkw=pd.concat([srkw1, srkw2])
-        else:
-            srkw2=pd.read_csv(acartia_path+"srkw_"+str(year)+".csv")            
-            srkw2['central_salish']=srkw2['latitude'].apply(lambda x: 1 if x>entry_lat else 0)
-            srkw2['SightDate']=srkw2['created'].apply(lambda x: x[:10])
-            srkw2=srkw2[srkw2['central_salish']==1][['SightDate','J','K','L']]
-            srkw2.columns=['SightDate','j','k','l']
-            srkw=srkw2
-        srkw['day_of_year']=srkw['SightDate'].apply(lambda x: pd.Period(x, freq='D').day_of_year)
-        srkw_flat=srkw.groupby('day_of_year').sum()
-        srkw_flat['year']=year
-        srkw_flat['all_count']=srkw_flat.apply(lambda x: x['j']+x['k']+x['l'], axis=1)
-        srkw_flat['AllSRpres']=srkw_flat.apply(lambda x: 1 if x['all_count']>0 else 0, axis=1)
-        srkw_flat['Jpres']=srkw_flat.apply(lambda x: 1 if x['j']>0 else 0, axis=1)
-        srkw_flat['Kpres']=srkw_flat.apply(lambda x: 1 if x['k']>0 else 0, axis=1)
-        srkw_flat['Lpres']=srkw_flat.apply(lambda x: 1 if x['l']>0 else 0, axis=1)
-        allpres=pd.concat([allpres, srkw_flat])
-    return allpres
-x=srkw_long(years=range(1990,2023))
-x.to_csv(srkw_path+"srkw_presence.csv")
+        for f in srkw_sources(year):
+            if pathlib.Path(f).name.startswith('twm'):
+                d=pd.read_csv(f, usecols=['SightDate','central_salish','j','k','l'])
+                d=d[d['central_salish']==1]
+            else:
+                d=pd.read_csv(f, usecols=['created','latitude','longitude','J','K','L'])
+                d=d[legacy.classify(d['longitude'], d['latitude'])=='central salish']
+                d['SightDate']=d['created'].str[:10]
+                d=d.rename(columns={'J':'j','K':'k','L':'l'})
+            d['year']=year
+            srkw.append(d[['year','SightDate','j','k','l']])
+    cols=['SightDate','j','k','l','year','all_count','AllSRpres','Jpres','Kpres','Lpres']
+    if len(srkw)==0:
+        return pd.DataFrame(columns=cols, index=pd.Index([], name='day_of_year'))
+    srkw=pd.concat(srkw, ignore_index=True)
+    srkw['day_of_year']=pd.to_datetime(srkw['SightDate'], format='%Y-%m-%d').dt.dayofyear
+    srkw_flat=srkw.groupby(['year','day_of_year'], sort=True).agg(
+        SightDate=('SightDate','first'), j=('j','sum'), k=('k','sum'), l=('l','sum'))
+    srkw_flat=srkw_flat.reset_index(level='year')
+    srkw_flat['all_count']=srkw_flat['j']+srkw_flat['k']+srkw_flat['l']
+    for col, count in [('AllSRpres','all_count'), ('Jpres','j'), ('Kpres','k'), ('Lpres','l')]:
+        srkw_flat[col]=(srkw_flat[count]>0).astype(int)
+    return srkw_flat[cols]
 
 def albion_long(years=[1991,]):
-    alldata=pd.DataFrame()
+    """
+    Daily test fishing at Albion, one row per year and fishing day
+    Example data frame (index is the row number within the year)
+      date       year month mon day calDay cpue catch sets effort
+    0 1980-06-03 1980 6     Jun 3   155    1.5  11    2    7350
+    """
+    alldata=[]
     for year in years:
-        albion=pd.read_csv(fos_path+'fos'+str(year)+'.csv',\
-        usecols=['day','mon','cpue1','catch1','sets1','effort1'])
-        albion['year']=year
-        albion['m']=albion['mon'].apply(lambda x: dt.strptime(x, '%b').month)
-        albion['date']=albion.apply(lambda x: dt(year, x['m'],x['day']), axis=1)
-        albion['day_of_year']=albion['date'].apply(lambda x: pd.Period(x, freq='D').day_of_year)
-        alldata=pd.concat([alldata, albion])
-    alldata.columns=['day','mon','catch','sets','effort','cpue','year','month','date','calDay']
-    alldata=alldata[['date','year','month','mon','day','calDay','cpue','catch','sets','effort']]
-    return alldata 
+        for f in albion_sources(year):
+            albion=pd.read_csv(f, usecols=['day','mon','cpue1','catch1','sets1','effort1'], thousands=',')
+            albion['year']=year
+            alldata.append(albion)
+    cols=['date','year','month','mon','day','calDay','cpue','catch','sets','effort']
+    if len(alldata)==0:
+        return pd.DataFrame(columns=cols)
+    alldata=pd.concat(alldata)
+    alldata['month']=pd.to_datetime(alldata['mon'], format='%b').dt.month
+    alldata['date']=pd.to_datetime(dict(year=alldata['year'], month=alldata['month'], day=alldata['day']))
+    alldata['calDay']=alldata['date'].dt.dayofyear
+    alldata=alldata.rename(columns={'catch1':'catch','sets1':'sets','effort1':'effort','cpue1':'cpue'})
+    return alldata[cols]
+
+## ----------------Year partitions ---------------------##
+# name: (builder, source files of a year, first year)
+DATASETS={
+    'srkw_presence':(srkw_long, srkw_sources, 1990),
+    'albion_long':(albion_long, albion_sources, 1980),
+}
+
+def read_manifest(name):
+    """
+    Source file hashes of every year partition, empty when the parts were written by another PARTS_FORMAT
+    """
+    try:
+        with open(pjoin(parts_path, name, 'manifest.json')) as f:
+            manifest=json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get('years', {}) if manifest.get('format')==PARTS_FORMAT else {}
+
+def write_manifest(name, manifest):
+    fn=pjoin(parts_path, name, 'manifest.json')
+    with open(fn+'.tmp', 'w') as f:
+        json.dump({'format':PARTS_FORMAT, 'years':manifest}, f, indent=1, sort_keys=True)
+    os.replace(fn+'.tmp', fn)
+
+def source_hashes(files):
+    return {pathlib.Path(f).relative_to(srkw_path).as_posix():file_hash(f) for f in files}
+
+def update_parts(name, years, force=False):
+    """
+    Rebuild the year partitions of a data set whose source files changed since the last run
+    Returns the years rebuilt
+    """
+    build, sources, first=DATASETS[name]
+    os.makedirs(pjoin(parts_path, name), exist_ok=True)
+    manifest={} if force else read_manifest(name)
+    hashes={str(y):source_hashes(sources(y)) for y in years}
+    stale=[y for y in years if manifest.get(str(y))!=hashes[str(y)]
+           or not os.path.exists(pjoin(parts_path, name, str(y)+'.csv'))]
+    data=build(years=stale) if stale else None
+    for y in stale:
+        fn=pjoin(parts_path, name, str(y)+'.csv')
+        part=data[data['year']==y]
+        if len(part)==0:
+            if os.path.exists(fn):
+                os.remove(fn)
+            manifest.pop(str(y), None)
+            continue
+        part.to_csv(fn+'.tmp')
+        os.replace(fn+'.tmp', fn)
+        manifest[str(y)]=hashes[str(y)]
+    for y in list(manifest):
+        if int(y) not in years:
+            manifest.pop(y)
+    write_manifest(name, manifest)
+    return stale
+
+def combine_parts(name, years, out):
+    """
+    Stack the year partitions into one csv (the header of the first one, the rows of all)
+    """
+    with open(out+'.tmp', 'w') as f:
+        header=False
+        for y in years:
+            fn=pjoin(parts_path, name, str(y)+'.csv')
+            if not os.path.exists(fn):
+                continue
+            with open(fn) as part:
+                head=part.readline()
+                if not header:
+                    f.write(head)
+                    header=True
+                f.write(part.read())
+    os.replace(out+'.tmp', out)
 
-y=albion_long(years=range(1980,2023))
-y.to_csv(srkw_path+"albion_long.csv")
\ No newline at end of file
+if __name__ == '__main__':
+    force='--force' in sys.argv
+    for name, (build, sources, first) in DATASETS.items():
+        years=list(range(first, curyr+1))
+        stale=update_parts(name, years, force=force)
+        combine_parts(name, years, srkw_path+name+'.csv')
+        print(name+': rebuilt '+(', '.join(str(y) for y in stale) if stale else 'nothing'))
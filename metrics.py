@@ -0,0 +1,204 @@
+## Project Name: Orcasound Salmon
+### Program Name: metrics.py
+### Purpose: Start up phase timings, callback latency and size histograms, and a /metrics endpoint
+##### Date Created: Oct 18th 2026
+
+"""
+Plain python counters rendered in the Prometheus text format (no client library needed):
+
+    with span("load_store"): ...            start up phase durations (seconds, summed per phase)
+    install(server, app_ver, callbacks, token)
+                                            times every dash callback request, serves /metrics
+                                            (app_ver may be a function, for data reloads)
+    watch_cache("orca_map", orca_map_figure) hit and miss counts of an lru_cache
+
+Every gunicorn worker keeps its own numbers, a scrape sees the worker that answered it
+(the pid label tells them apart).
+
+Callbacks are labelled by their output id only when it is one of the app's callbacks, anything else a
+client posts counts as "unknown", so the number of series stays fixed. With a token, /metrics answers
+only requests with Authorization: Bearer <token>; without one it is open and must not be exposed publicly.
+"""
+
+import os
+import hmac
+import time
+import resource
+import threading
+from contextlib import contextmanager
+
+from flask import request, g, abort
+
+PREFIX = "orcasalmon_"
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+SIZE_BUCKETS = [1024 * 4**i for i in range(9)]  # 1 KB to 64 MB
+
+_lock = threading.Lock()
+STARTUP = {}  # phase -> seconds
+CACHES = {}  # name -> function with cache_info()
+
+
+@contextmanager
+def span(phase):
+    """
+    Time a start up phase (runs of the same phase add up)
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            STARTUP[phase] = STARTUP.get(phase, 0) + time.perf_counter() - t0
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, labels):
+        self.name, self.help, self.buckets, self.labels = name, help, buckets, labels
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, *label_values):
+        with _lock:
+            s = self.series.setdefault(label_values, [0] * len(self.buckets) + [0, 0])
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+        with _lock:
+            series = {k: list(v) for k, v in self.series.items()}
+        for values, s in sorted(series.items()):
+            labels = dict(zip(self.labels, values))
+            for b, n in zip(self.buckets, s):
+                lines.append("%s_bucket%s %d" % (self.name, labelset(labels, le=b), n))
+            lines.append("%s_bucket%s %d" % (self.name, labelset(labels, le="+Inf"), s[-1]))
+            lines.append("%s_sum%s %s" % (self.name, labelset(labels), repr(float(s[-2]))))
+            lines.append("%s_count%s %d" % (self.name, labelset(labels), s[-1]))
+        return lines
+
+
+CALLBACK_SECONDS = Histogram(
+    PREFIX + "callback_seconds",
+    "Time to answer a dash callback request, by output and status",
+    LATENCY_BUCKETS,
+    ["callback", "status"],
+)
+CALLBACK_BYTES = Histogram(
+    PREFIX + "callback_response_bytes",
+    "Size of a dash callback response before compression",
+    SIZE_BUCKETS,
+    ["callback"],
+)
+
+
+def labelset(labels, **more):
+    """
+    {a="1",b="2"} for a dict of labels, nothing when there are none
+    """
+    labels = dict(labels, **more)
+    if not labels:
+        return ""
+    return "{" + ",".join('%s="%s"' % (k, escape(v)) for k, v in labels.items()) + "}"
+
+
+def escape(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def watch_cache(name, f):
+    """
+    Report the hits and misses of an lru_cache decorated function
+    """
+    CACHES[name] = f
+
+
+def rss_bytes():
+    """
+    Resident memory of this process now (from /proc), or None where there is no /proc
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def family(lines, name, help, samples, type="gauge"):
+    lines += ["# HELP %s %s" % (PREFIX + name, help), "# TYPE %s %s" % (PREFIX + name, type)]
+    for labels, value in samples:
+        lines.append("%s%s %s" % (PREFIX + name, labelset(labels), repr(float(value))))
+
+
+def render(version=None):
+    """
+    Every metric in the Prometheus text format
+    """
+    lines = []
+    pid = os.getpid()
+    family(lines, "info", "Data and code version of this worker", [({"version": version, "pid": pid}, 1)])
+    with _lock:
+        startup = dict(STARTUP)
+    family(lines, "startup_phase_seconds", "Time spent in each start up phase",
+          [({"phase": k}, v) for k, v in startup.items()])
+    infos = {name: f.cache_info() for name, f in CACHES.items()}
+    family(lines, "cache_hits_total", "Figure cache hits", [({"cache": k}, i.hits) for k, i in infos.items()],
+          type="counter")
+    family(lines, "cache_misses_total", "Figure cache misses", [({"cache": k}, i.misses) for k, i in infos.items()],
+          type="counter")
+    family(lines, "cache_entries", "Figures in the cache", [({"cache": k}, i.currsize) for k, i in infos.items()])
+    rss = rss_bytes()
+    if rss is not None:
+        family(lines, "process_resident_memory_bytes", "Resident memory of this worker", [({"pid": pid}, rss)])
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KB on linux
+    family(lines, "process_max_resident_memory_bytes", "Peak resident memory of this worker", [({"pid": pid}, maxrss)])
+    lines += CALLBACK_SECONDS.render()
+    lines += CALLBACK_BYTES.render()
+    return "\n".join(lines) + "\n"
+
+
+def authorized(token):
+    """
+    The request carries Authorization: Bearer <token> (compared in constant time)
+    """
+    return bool(token) and hmac.compare_digest(request.headers.get("Authorization", ""), "Bearer " + token)
+
+
+def install(server, version=None, prefix="/", path="/metrics", callbacks=(), token=None):
+    """
+    Time every dash callback request of server and serve the metrics at path
+    version: reported in the info metric, or a function returning it
+    callbacks: output ids used as labels (app.callback_map), or a function returning them
+    token: bearer token /metrics asks for, open to anyone without one
+    """
+    current = version if callable(version) else lambda: version
+    known = callbacks if callable(callbacks) else lambda: callbacks
+    callback_path = prefix + "_dash-update-component"
+
+    @server.before_request
+    def start_timer():
+        if request.path == callback_path:
+            g.metrics_t0 = time.perf_counter()
+
+    @server.after_request
+    def record(response):
+        t0 = g.pop("metrics_t0", None)
+        if t0 is None:
+            return response
+        body = request.get_json(silent=True) or {}
+        callback = body.get("output") if isinstance(body, dict) else None
+        if not isinstance(callback, str) or callback not in known():
+            callback = "unknown"
+        CALLBACK_SECONDS.observe(time.perf_counter() - t0, callback, response.status_code)
+        if response.status_code == 200 and not response.is_streamed:
+            CALLBACK_BYTES.observe(response.calculate_content_length() or 0, callback)
+        return response
+
+    @server.route(path)
+    def metrics():
+        if token and not authorized(token):
+            abort(403)
+        return server.response_class(render(current()), mimetype="text/plain; version=0.0.4")
+
+    return server
@@ -0,0 +1,151 @@
+## Project Name: Orcasound Salmon
+### Program Name: pipeline.py
+### Purpose: Content hashes of what each data update stage reads and writes, to skip unchanged stages and deploys
+##### Date Created: Oct 18th 2026
+
+"""
+data/pipeline.json keeps, for every stage of the data update, the content hashes of its inputs and outputs,
+and what the last deploy shipped:
+
+    {"stages": {"proc_acartia": {"inputs": {"dump": "<sha256>"}, "outputs": {"acartia/srkw_2026.csv": ...}}},
+     "deployed": {"data": "<data version>", "code": "<hash of the app files>"}}
+
+    pipe = Pipeline(data_path)
+    pipe.stage("fos", lambda: scrape_fos(...), outputs=["foschinook/fos2026.csv"])
+    pipe.stage("proc_acartia", lambda: proc_acartia(...), inputs={"dump": dump}, outputs=["acartia/srkw_*.csv"])
+    pipe.deploy_needed()      # data or app files differ from the last deploy
+
+    python pipeline.py --mark-deployed      # run by the deploy workflow once flyctl deploy succeeded
+
+Paths are relative to data_path and may be glob patterns; a dict {label: path} keys the hash by label
+instead, for files named by date such as the Acartia dump. A stage with inputs is skipped when neither
+its inputs nor its outputs changed since it last ran. A stage without inputs (a scraper, whose input is a
+web site) always runs; comparing its outputs with the last run tells whether it brought anything new.
+The manifest is written after every stage and holds no times, so a run that changed nothing leaves the
+file as it was.
+"""
+
+import os
+import sys
+import json
+import glob
+import hashlib
+import pathlib
+from os.path import join as pjoin
+
+from datastore import file_hash, hash_sources, data_version
+
+APP_PATH = str(pathlib.Path(__file__).parent.resolve())
+MANIFEST_FILE = "pipeline.json"
+# files of the deployed app besides the data store sources (relative to APP_PATH)
+APP_FILES = ["*.py", "assets/*", "requirements.txt", "Procfile", "fly.toml", "data/SRKW.csv"]
+
+
+def hash_files(base, paths):
+    """
+    Content hash of every existing file of paths (list of glob patterns or {label: path}) under base
+    """
+    if isinstance(paths, dict):
+        return {k: file_hash(pjoin(base, p)) for k, p in sorted(paths.items()) if os.path.isfile(pjoin(base, p))}
+    hashes = {}
+    for pattern in paths:
+        for f in sorted(glob.glob(pjoin(base, pattern))):
+            if os.path.isfile(f):
+                hashes[pathlib.Path(f).relative_to(base).as_posix()] = file_hash(f)
+    return hashes
+
+
+def app_code_version(app_path=APP_PATH):
+    h = hashlib.sha256()
+    for k, v in sorted(hash_files(app_path, APP_FILES).items()):
+        h.update((k + ":" + v + "\n").encode())
+    return h.hexdigest()[:16]
+
+
+class Pipeline:
+    def __init__(self, data_path, app_path=APP_PATH, force=False):
+        """
+        force: run every stage even when its inputs did not change
+        """
+        self.data_path = data_path
+        self.app_path = app_path
+        self.force = force
+        self.path = pjoin(data_path, MANIFEST_FILE)
+        self.manifest = self.read()
+        self.changed = []  # stages whose outputs changed in this run
+        self.skipped = []
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        manifest.setdefault("stages", {})
+        return manifest
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp, self.path)
+
+    def stage(self, name, run, inputs=None, outputs=()):
+        """
+        Run a stage unless its inputs and outputs are the same as after its last run
+        Returns True when the stage changed its outputs
+        """
+        last = self.manifest["stages"].get(name, {})
+        record = {}
+        if inputs is not None:
+            record["inputs"] = hash_files(self.data_path, inputs)
+            if (not self.force and last.get("inputs") == record["inputs"]
+                    and last.get("outputs") == hash_files(self.data_path, outputs)):
+                print(name + ": inputs unchanged, skipped")
+                self.skipped.append(name)
+                return False
+        run()
+        record["outputs"] = hash_files(self.data_path, outputs)
+        changed = record["outputs"] != last.get("outputs")
+        print(name + (": new output" if changed else ": output unchanged"))
+        if changed:
+            self.changed.append(name)
+        self.manifest["stages"][name] = record
+        self.save()
+        return changed
+
+    def release(self):
+        """
+        What a deploy now would ship: the data version of the store sources and a hash of the app files
+        """
+        return {"data": data_version(hash_sources(self.data_path)), "code": app_code_version(self.app_path)}
+
+    def deploy_needed(self):
+        return self.force or self.manifest.get("deployed") != self.release()
+
+    def mark_deployed(self):
+        """
+        Record the release of this checkout as deployed, only once the deploy went through
+        """
+        self.manifest["deployed"] = self.release()
+        self.save()
+        return self.manifest["deployed"]
+
+
+def github_output(**values):
+    """
+    Step outputs for the GitHub Actions workflow running this (nothing outside of Actions)
+    """
+    path = os.environ.get("GITHUB_OUTPUT")
+    if not path:
+        return
+    with open(path, "a") as f:
+        for k, v in values.items():
+            f.write("%s=%s\n" % (k, v))
+
+
+if __name__ == "__main__":
+    if "--mark-deployed" in sys.argv:
+        deployed = Pipeline(pjoin(APP_PATH, "data")).mark_deployed()
+        print("Marked deployed: data " + deployed["data"] + ", code " + deployed["code"])
@@ -0,0 +1,158 @@
+## Project Name: Orcasound Salmon
+### Program Name: regions.py
+### Purpose: Named sea regions from data/regions.json and a vectorized point-in-polygon classifier for sightings
+##### Date Created: Oct 18th 2026
+
+"""
+data/regions.json holds region sets, each a GeoJSON FeatureCollection of named polygons
+(lon/lat, holes allowed) plus the grid cell size in degrees used to classify points:
+
+    salish_sea   Puget Sound, Strait of Juan de Fuca, Haro Strait and San Juan Islands,
+                 Strait of Georgia, Outer Coast (rough outlines, water plus some shore)
+    legacy       the old latitude split at 48.19437: "central salish" north of it, "puget sound" south
+
+    sets = load_regions()
+    sightings["region"] = sets["salish_sea"].classify(lon, lat)   # Categorical, "Other" outside every polygon
+
+A point belongs to the first polygon of the set that contains it. A point on a horizontal edge belongs to
+the polygon below it, so the legacy set gives exactly latitude<=48.19437 for "puget sound".
+
+Classifying is vectorized: every grid cell no polygon edge passes through gets its region once, from its
+centre, and a point in such a cell takes that region by lookup; only points in cells an edge crosses are
+tested against the polygons (even-odd rule, points x edges in chunks).
+"""
+
+import json
+import pathlib
+from os.path import join as pjoin
+
+import numpy as np
+import pandas as pd
+
+REGIONS_FILE = pjoin(str(pathlib.Path(__file__).parent.resolve()), "data", "regions.json")
+OTHER = "Other"
+CHUNK = 1 << 20  # points x edges tested at once
+
+
+class RegionSet:
+    def __init__(self, names, polygons, cell=0.05):
+        """
+        names: region names, in the order they are matched
+        polygons: for each region a list of rings (arrays of lon, lat rows), the first one the outline
+        """
+        self.names = list(names)
+        self.categories = self.names + [OTHER]
+        self.cell = cell
+        # every edge of every ring: start and end points and the region it belongs to
+        edges = []
+        for i, rings in enumerate(polygons):
+            for ring in rings:
+                ring = np.asarray(ring, dtype=float)
+                if not np.array_equal(ring[0], ring[-1]):
+                    ring = np.vstack([ring, ring[:1]])
+                edges.append(np.column_stack([ring[:-1], ring[1:], np.full(len(ring) - 1, i)]))
+        edges = np.vstack(edges) if edges else np.zeros((0, 5))
+        self.x0, self.y0, self.x1, self.y1 = edges[:, :4].T
+        self.owner = edges[:, 4].astype(int)
+        self._grid()
+
+    @classmethod
+    def from_geojson(cls, collection):
+        names, polygons = [], []
+        for f in collection["features"]:
+            geom = f["geometry"]
+            rings = geom["coordinates"] if geom["type"] == "Polygon" else \
+                [r for p in geom["coordinates"] for r in p]  # MultiPolygon: every ring, even-odd
+            names.append(f["properties"]["name"])
+            polygons.append(rings)
+        return cls(names, polygons, cell=collection.get("cell", 0.05))
+
+    def _grid(self):
+        """
+        Region of every cell of a grid over the polygons, -1 where an edge passes through the cell
+        """
+        if len(self.x0) == 0:
+            self.west = self.south = 0.0
+            self.codes = np.full((0, 0), len(self.names), dtype="int16")
+            return
+        c = self.cell
+        self.west = np.floor(min(self.x0.min(), self.x1.min()) / c) * c - c
+        self.south = np.floor(min(self.y0.min(), self.y1.min()) / c) * c - c
+        nx = int(np.ceil((max(self.x0.max(), self.x1.max()) - self.west) / c)) + 2
+        ny = int(np.ceil((max(self.y0.max(), self.y1.max()) - self.south) / c)) + 2
+        # cut edges into pieces shorter than a cell, a piece can then only touch the cells its corners are in
+        steps = np.maximum(np.ceil(np.hypot(self.x1 - self.x0, self.y1 - self.y0) / c).astype(int), 1)
+        e = np.repeat(np.arange(len(steps)), steps)
+        t0 = (np.arange(len(e)) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[e]
+        t1 = t0 + 1 / steps[e]
+        px0, px1 = self.x0[e] + t0 * (self.x1[e] - self.x0[e]), self.x0[e] + t1 * (self.x1[e] - self.x0[e])
+        py0, py1 = self.y0[e] + t0 * (self.y1[e] - self.y0[e]), self.y0[e] + t1 * (self.y1[e] - self.y0[e])
+        boundary = np.zeros((ny, nx), dtype=bool)
+        for ix in self._cell_index(np.minimum(px0, px1), self.west, nx), self._cell_index(np.maximum(px0, px1), self.west, nx):
+            for iy in self._cell_index(np.minimum(py0, py1), self.south, ny), self._cell_index(np.maximum(py0, py1), self.south, ny):
+                boundary[iy, ix] = True
+        iy, ix = np.nonzero(~boundary)
+        self.codes = np.full((ny, nx), -1, dtype="int16")
+        self.codes[iy, ix] = self._exact(self.west + (ix + 0.5) * c, self.south + (iy + 0.5) * c)
+
+    def _cell_index(self, v, start, n):
+        return np.clip(np.floor((v - start) / self.cell).astype(int), 0, n - 1)
+
+    def _exact(self, x, y):
+        """
+        Region code of every point by the even-odd rule against the edges of each polygon in turn
+        """
+        code = np.full(len(x), len(self.names), dtype="int16")
+        todo = np.arange(len(x))
+        for i in range(len(self.names)):
+            if len(todo) == 0:
+                break
+            mine = self.owner == i
+            x0, y0, x1, y1 = self.x0[mine], self.y0[mine], self.x1[mine], self.y1[mine]
+            # same edge pair used both ways: a point on y == y0 counts as above, so a point on a
+            # horizontal edge lands in the polygon below it
+            inside = np.zeros(len(todo), dtype=bool)
+            step = max(CHUNK // max(len(x0), 1), 1)
+            for s in range(0, len(todo), step):
+                px, py = x[todo[s:s + step], None], y[todo[s:s + step], None]
+                cross = (y0 >= py) != (y1 >= py)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    xi = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+                inside[s:s + step] = (cross & (px < xi)).sum(axis=1) % 2 == 1
+            code[todo[inside]] = i
+            todo = todo[~inside]
+        return code
+
+    def codes_of(self, lon, lat):
+        """
+        Region code of every point (index into categories, the last one is Other)
+        """
+        x = np.asarray(lon, dtype=float)
+        y = np.asarray(lat, dtype=float)
+        code = np.full(len(x), len(self.names), dtype="int16")
+        ny, nx = self.codes.shape
+        ix = np.floor((x - self.west) / self.cell)
+        iy = np.floor((y - self.south) / self.cell)
+        on = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)  # False for NaN
+        cell = np.full(len(x), -1, dtype="int16")
+        cell[on] = self.codes[iy[on].astype(int), ix[on].astype(int)]
+        pure = on & (cell >= 0)
+        code[pure] = cell[pure]
+        edge = np.nonzero(on & (cell < 0))[0]
+        code[edge] = self._exact(x[edge], y[edge])
+        return code
+
+    def classify(self, lon, lat):
+        """
+        Region of every point as a Categorical of names + Other (one byte per point)
+        """
+        return pd.Categorical.from_codes(self.codes_of(lon, lat), categories=self.categories)
+
+
+def load_regions(path=REGIONS_FILE):
+    """
+    Every region set of a regions.json file, {set name: RegionSet}
+    """
+    with open(path) as f:
+        doc = json.load(f)
+    return {name: RegionSet.from_geojson(collection) for name, collection in doc.items()}
@@ -1,106 +1,562 @@
 import os
+import re
+import json
+import filecmp
+import codecs
+import queue
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from selenium import webdriver
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 from datetime import date
 from datetime import datetime
-from time import sleep
 import pandas as pd
 pd.options.mode.chained_assignment = None  # suppress chained assignment
 
-def scrape_fos(yrs, spe="CHINOOK SALMON", fos_path="./data/foschinook/"):
-    # Set up chrome driver
+FOS_URL = "https://www-ops2.pac.dfo-mpo.gc.ca/fos2_Internet/Testfish/rptcsbdparm.cfm?stat=CPTFM&fsub_id=242"
+BON_URL = "https://www.cbr.washington.edu/dart/query/adult_daily"
+BON_CSV_URL = "https://www.cbr.washington.edu/dart/cs/php/rpt/adult_daily.php"
+BON_COLUMNS = ["Project", "Date", "Chin"]  # columns load_bon() reads
+WAIT_TIMEOUT = 60  # seconds to wait for a page element or a download
+HTTP_TIMEOUT = 60  # seconds to wait for a server to answer
+FOS_COLUMNS = ["day", "mon", "year", "netlen", "catch1", "sets1", "effort1", "cpue1",
+               "catch2", "sets2", "effort2", "cpue2"]
+FOS_FLOATS = ["cpue1", "cpue2"]  # every other number column is a count
+
+
+def chrome_driver():
+    """
+    Headless chrome set up the same way for every scraper
+    """
     options = webdriver.ChromeOptions()
     options.add_argument("--headless")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
     options.add_argument("--ignore-certificate-errors")
-    driver = webdriver.Chrome(options=options)
-    # landing page of fos data
-    url = "https://www-ops2.pac.dfo-mpo.gc.ca/fos2_Internet/Testfish/rptcsbdparm.cfm?stat=CPTFM&fsub_id=242"
-    driver.get(url)
-    sleep(3)
-    # select year and species and generate report
-    driver.find_element("id", "lboYears").send_keys(yrs)
-    driver.find_element("id", "lboSpecies").send_keys(spe)
-    driver.find_element("name", "cmdRunReport").click()
-    sleep(1)
-    window_after = driver.window_handles[1]  # Switch to the newly opened window
-    driver.switch_to.window(window_after)
-    # scrape data from the report table
-    table = driver.find_elements(By.XPATH, ".//tr")
-    # process scrapped data and convert to pandas df
-    tabls0 = list(map(lambda x: x.text.split(sep=" "), table))
-    tabls = [t for t in tabls0 if ((len(t) == 12) & (t[0] != "Printed"))]
-    dat = pd.DataFrame(
-        tabls,
-        columns=[
-            "day",
-            "mon",
-            "year",
-            "netlen",
-            "catch1",
-            "sets1",
-            "effort1",
-            "cpue1",
-            "catch2",
-            "sets2",
-            "effort2",
-            "cpue2",
-        ],
+    return webdriver.Chrome(options=options)
+
+
+class DriverPool:
+    """
+    At most `size` browsers shared by the scraping threads
+    Browsers are started on first use and kept open until close()
+    A browser that failed a scrape is quit and replaced by a fresh one next time
+    """
+
+    def __init__(self, size=4, make_driver=chrome_driver):
+        self.size = size
+        self.make_driver = make_driver
+        self.idle = queue.Queue()
+        self.slots = threading.Semaphore(size)
+        self.lock = threading.Lock()
+        self.drivers = []
+
+    @contextmanager
+    def driver(self):
+        self.slots.acquire()
+        try:
+            try:
+                driver = self.idle.get_nowait()
+            except queue.Empty:
+                driver = self.make_driver()
+                with self.lock:
+                    self.drivers.append(driver)
+            try:
+                yield driver
+            except BaseException:
+                self.discard(driver)
+                raise
+            self.idle.put(driver)
+        finally:
+            self.slots.release()
+
+    def discard(self, driver):
+        with self.lock:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.lock:
+            drivers, self.drivers = self.drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        self.idle = queue.Queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def wait_for(driver, condition, timeout=WAIT_TIMEOUT):
+    return WebDriverWait(driver, timeout, poll_frequency=0.2).until(condition)
+
+
+def page_loaded(driver):
+    return driver.execute_script("return document.readyState") == "complete"
+
+
+def replace_csv(dat, path):
+    """
+    Write a data frame next to path and rename it into place, so readers never see half a file
+    A file that already has the same content is left alone (same modification time)
+    """
+    tmp = path + ".tmp"
+    dat.to_csv(tmp, index=False)
+    if os.path.exists(path) and filecmp.cmp(tmp, path, shallow=False):
+        os.remove(tmp)
+        return
+    os.replace(tmp, path)
+
+
+class TableParser(HTMLParser):
+    """
+    Text of every cell of every table row of an html page, as a list of rows of cell strings
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.row = None
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self.end_row()
+            self.row = []
+        elif tag in ("td", "th"):
+            self.end_cell()
+            if self.row is None:
+                self.row = []
+            self.cell = []
+        elif tag == "br" and self.cell is not None:
+            self.cell.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th"):
+            self.end_cell()
+        elif tag in ("tr", "table"):
+            self.end_row()
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+    def end_cell(self):
+        if self.cell is not None:
+            self.row.append(" ".join("".join(self.cell).split()))
+            self.cell = None
+
+    def end_row(self):
+        self.end_cell()
+        if self.row:
+            self.rows.append(self.row)
+        self.row = None
+
+    def close(self):
+        super().close()
+        self.end_row()
+
+
+FOS_DAY = re.compile(r"^\d{1,2}$")
+FOS_MONTH = re.compile(r"^[A-Za-z]{3}$")
+FOS_YEAR = re.compile(r"^\d{4}$")
+
+
+def parse_fos_report(html):
+    """
+    Daily rows of an FOS test fishery report page as typed FOS_COLUMNS (day, year and counts as
+    Int64, cpue as float, "15,400" read as 15400, an empty cell as missing)
+    A row is a daily row when it starts with a day, month and year (in one cell or three); a daily row
+    with the wrong number of values raises ValueError instead of being left out
+    """
+    parser = TableParser()
+    parser.feed(html)
+    parser.close()
+    rows = []
+    for cells in parser.rows:
+        # the date may be one cell ("21 Apr 2024") or three, a blank cell keeps its place
+        values = [v for c in cells for v in (c.split() or [""])]
+        if len(values) < 3 or not (FOS_DAY.match(values[0]) and FOS_MONTH.match(values[1])
+                                   and FOS_YEAR.match(values[2])):
+            continue
+        if len(values) != len(FOS_COLUMNS):
+            raise ValueError("FOS report row with %d values instead of %d: %s"
+                             % (len(values), len(FOS_COLUMNS), " | ".join(cells)))
+        rows.append(values)
+    dat = pd.DataFrame(rows, columns=FOS_COLUMNS)
+    for col in FOS_COLUMNS:
+        if col == "mon":
+            continue
+        numbers = pd.to_numeric(dat[col].str.replace(",", "", regex=False).replace("", None), errors="raise")
+        dat[col] = numbers.astype("float64" if col in FOS_FLOATS else "Int64")
+    return dat
+
+
+def scrape_fos(yrs, spe="CHINOOK SALMON", fos_path="./data/foschinook/", driver=None, url=FOS_URL):
+    # Set up chrome driver, unless one is lent by a DriverPool
+    own_driver = driver is None
+    if own_driver:
+        driver = chrome_driver()
+    try:
+        # landing page of fos data
+        driver.get(url)
+        wait_for(driver, EC.element_to_be_clickable(("id", "cmdRunReport")))
+        # select year and species and generate report
+        driver.find_element("id", "lboYears").send_keys(yrs)
+        driver.find_element("id", "lboSpecies").send_keys(spe)
+        main_window = driver.current_window_handle
+        driver.find_element("name", "cmdRunReport").click()
+        wait_for(driver, EC.number_of_windows_to_be(2))
+        window_after = [w for w in driver.window_handles if w != main_window][0]
+        driver.switch_to.window(window_after)  # Switch to the newly opened window
+        wait_for(driver, page_loaded)
+        # the whole report in one round trip, parsed here instead of reading every row from the browser
+        dat = parse_fos_report(driver.page_source)
+        # archive data to csv
+        replace_csv(dat, fos_path + "fos" + yrs + ".csv")
+        # close the report so the driver can be reused
+        driver.close()
+        driver.switch_to.window(main_window)
+    finally:
+        if own_driver:
+            driver.quit()
+
+
+def downloaded(download_path, prefix):
+    """
+    Path of a finished download starting with prefix, or False while chrome is still writing
+    """
+    files = os.listdir(download_path)
+    if any(f.endswith(".crdownload") for f in files):
+        return False
+    done = [f for f in files if f.startswith(prefix)]
+    return os.path.join(download_path, done[0]) if done else False
+
+
+def scrape_bon(yrs, bon_path="./data/bonchinook/", driver=None, url=BON_URL):
+    os.makedirs(bon_path, exist_ok=True)
+    # Every call downloads into its own folder, so several years can run at the same time
+    download_path = tempfile.mkdtemp(prefix=".download", dir=os.path.abspath(bon_path))
+    # Set up chrome driver, unless one is lent by a DriverPool
+    own_driver = driver is None
+    if own_driver:
+        driver = chrome_driver()
+    try:
+        driver.execute_cdp_cmd(
+            "Browser.setDownloadBehavior",
+            {"behavior": "allow", "downloadPath": download_path},
+        )
+        # landing page of Columbia Basin Research
+        driver.get(url)
+        wait_for(driver, EC.element_to_be_clickable(("id", "daily")))
+        # select year and generate report
+        site = "BON"
+        driver.find_element("id", "daily").click()
+        try:
+            driver.find_element("id", "outputFormat2").click()
+        except:
+            element = driver.find_element("id", "outputFormat2")
+            driver.execute_script("arguments[0].click();", element)
+
+        driver.find_element("id", "year-select").send_keys(yrs)
+        driver.find_element("id", "proj-select").send_keys(site)
+        if driver.find_element("id", "calendar").is_selected() == False:
+            print("click the calendar element")
+            driver.find_element("id", "calendar").submit()
+        if driver.find_element("id", "run1").is_selected() == False:
+            print("click the run1 element")
+            driver.find_element("id", "run1").submit()
+        driver.find_element(By.XPATH, ".//input[@type='submit']").submit()
+        filename = wait_for(driver, lambda d: downloaded(download_path, "adultdaily"))
+        os.replace(filename, os.path.join(bon_path, "bon" + yrs + ".csv"))
+    finally:
+        if own_driver:
+            driver.quit()
+        shutil.rmtree(download_path, ignore_errors=True)
+
+
+def http_session(retries=3, pool_size=8, backoff=1):
+    """
+    requests session that keeps connections open and retries busy or failing servers
+    backoff: seconds of the first wait between retries, doubled for every next one
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
     )
-    # archive data to csv
-    dat.to_csv(fos_path + "fos" + yrs + ".csv", index=False)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
-def scrape_bon(yrs, bon_path="./data/bonchinook/"):
-    if os.path.exists(bon_path) == False:
-        os.makedirs(bon_path)
-    base_path = os.path.abspath("")
-    download_path = os.path.join(base_path, bon_path[2:-1])
-    os.chdir(download_path)
-    # Set up chrome driver
-    options = webdriver.ChromeOptions()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--ignore-certificate-errors")
-    prefs = {"download.default_directory": download_path}
-    options.add_experimental_option("prefs", prefs)
-    driver = webdriver.Chrome(options=options)
-    # landing page of Columbia Basin Research
-    url = "https://www.cbr.washington.edu/dart/query/adult_daily"
-    driver.get(url)
-    sleep(6)
-    # select year and generate report
-    site = "BON"
-    driver.find_element("id", "daily").click()
+def bon_query(yrs, project="BON"):
+    """
+    Query string of the DART adult_daily csv report, same choices scrape_bon() makes on the form
+    """
+    return {
+        "sc": "1",
+        "outputFormat": "csv",
+        "year": yrs,
+        "proj": project,
+        "span": "no",
+        "startdate": "1/1",
+        "enddate": "12/31",
+        "run": "",
+    }
+
+
+def check_bon_header(head, yrs):
+    columns = head.split(b"\n")[0].decode("utf-8", "replace").strip().split(",")
+    if columns[:2] != BON_COLUMNS[:2] or BON_COLUMNS[2] not in columns:
+        raise ValueError("Unexpected DART csv header for " + yrs + ": " + ",".join(columns)[:200])
+
+
+def fetch_bon(yrs, bon_path="./data/bonchinook/", session=None, url=BON_CSV_URL, project="BON"):
+    """
+    Download bon<YEAR>.csv from DART over plain HTTP
+    The response is streamed to a temp file and only renamed into place once the
+    header checks out, so a failed download never replaces a good file
+    """
+    os.makedirs(bon_path, exist_ok=True)
+    if session is None:
+        session = http_session()
+    path = os.path.join(bon_path, "bon" + yrs + ".csv")
+    tmp = path + ".tmp"
     try:
-        driver.find_element("id", "outputFormat2").click()
-    except:
-        element = driver.find_element("id", "outputFormat2")
-        driver.execute_script("arguments[0].click();", element)
-
-    driver.find_element("id", "year-select").send_keys(yrs)
-    driver.find_element("id", "proj-select").send_keys(site)
-    if driver.find_element("id", "calendar").is_selected() == False:
-        print("click the calendar element")
-        driver.find_element("id", "calendar").submit()
-    if driver.find_element("id", "run1").is_selected() == False:
-        print("click the run1 element")
-        driver.find_element("id", "run1").submit()
-    driver.find_element(By.XPATH, ".//input[@type='submit']").submit()
-    sleep(3)
-    dlf = [x for x in os.listdir(download_path) if x[:10] == "adultdaily"]
-    filename = dlf[0]
-    os.rename(
-        os.path.join(download_path, filename),
-        os.path.join(download_path, "bon" + yrs + ".csv"),
+        with session.get(url, params=bon_query(yrs, project), stream=True, timeout=HTTP_TIMEOUT) as r:
+            r.raise_for_status()
+            with open(tmp, "wb") as f:
+                header = b""
+                for chunk in r.iter_content(chunk_size=1 << 16):
+                    if header is None:
+                        f.write(chunk)
+                        continue
+                    header += chunk
+                    if b"\n" in header or len(header) > 1 << 16:
+                        check_bon_header(header, yrs)
+                        f.write(header)
+                        header = None
+                if header is not None:
+                    check_bon_header(header, yrs)
+                    f.write(header)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+def get_bon(yrs, bon_path="./data/bonchinook/", session=None, driver=None, csv_url=BON_CSV_URL, form_url=BON_URL):
+    """
+    Bonneville csv for one year: direct HTTP first, the browser only if that fails
+    """
+    try:
+        return fetch_bon(yrs, bon_path, session=session, url=csv_url)
+    except (requests.RequestException, ValueError) as e:
+        print("DART http fetch failed for " + yrs + " (" + str(e) + "), using the browser")
+        scrape_bon(yrs, bon_path, driver=driver, url=form_url)
+        return os.path.join(bon_path, "bon" + yrs + ".csv")
+
+
+def scrape_years(scrape, yrs, workers=4, pool=None, **kwargs):
+    """
+    Run scrape_fos or scrape_bon for many years on a pool of `workers` browsers
+    e.g. scrape_years(scrape_bon, range(1939, 2025), workers=8, bon_path=bon_path)
+    Returns {year: exception} for the years that failed
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = DriverPool(workers)
+
+    def run(y):
+        with pool.driver() as driver:
+            scrape(str(y), driver=driver, **kwargs)
+
+    failed = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = {ex.submit(run, y): y for y in yrs}
+            for f in as_completed(futures):
+                if f.exception() is not None:
+                    failed[futures[f]] = f.exception()
+    finally:
+        if own_pool:
+            pool.close()
+    return failed
+
+
+ACARTIA_URL = "https://acartia.io/api/v1/sightings/"
+WATERMARK_FILE = "acartia_watermark.json"
+ACARTIA_COLUMNS = [
+    "type",
+    "created",
+    "latitude",
+    "longitude",
+    "no_sighted",
+    "data_source_id",
+    "data_source_comments",
+]
+
+
+def read_watermark(acartia_path):
+    """
+    Last Acartia record already processed: {"created": ..., "entry_ids": [...]}
+    entry_ids are the records at exactly that created time, so ties are not dropped or repeated
+    Returns None before the first run
+    """
+    try:
+        with open(acartia_path + WATERMARK_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_watermark(acartia_path, acartia, watermark=None):
+    """
+    Move the watermark to the newest record in acartia (never backwards)
+    """
+    created = parse_created(acartia["created"])
+    if created.notnull().any():
+        latest = created.max()
+        ids = acartia.loc[created == latest, "entry_id"].astype(str).tolist()
+        if watermark is not None:
+            old = pd.Timestamp(watermark["created"])
+            if old > latest:
+                return watermark
+            if old == latest:
+                ids = sorted(set(ids) | set(watermark["entry_ids"]))
+        watermark = {"created": str(latest), "entry_ids": ids}
+    if watermark is not None:
+        tmp = acartia_path + WATERMARK_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(watermark, f, indent=1)
+        os.replace(tmp, acartia_path + WATERMARK_FILE)
+    return watermark
+
+
+def parse_created(created):
+    return pd.to_datetime(
+        created.map(cleandates, na_action="ignore"), format="mixed", errors="coerce"
     )
-    os.chdir(base_path)
 
 
-def scrape_acartia(acartia_path="./data/acartia/"):
+def newer_than(acartia, watermark):
+    """
+    Mask of the records created after the watermark
+    """
+    created = parse_created(acartia["created"])
+    wm = pd.Timestamp(watermark["created"])
+    seen = acartia["entry_id"].astype(str).isin(watermark["entry_ids"])
+    return (created > wm) | ((created == wm) & ~seen)
+
+
+JSON_SPACE = re.compile(r"[ \t\r\n]*")
+
+
+def iter_json_array(chunks, decoder=json.JSONDecoder()):
+    """
+    Items of a JSON array read from an iterable of byte chunks, one at a time
+    Only the item being decoded and the unread part of the last chunk are held in memory
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf, pos, done = "", 0, False
+    started = False
+
+    def more():
+        nonlocal buf, pos, done
+        chunk = next(chunks, None)
+        if chunk is None:
+            done = True
+            buf = buf[pos:] + utf8.decode(b"", final=True)
+        else:
+            buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+
+    while True:
+        pos = JSON_SPACE.match(buf, pos).end()
+        if pos == len(buf):
+            if done:
+                raise ValueError("JSON array ends early")
+            more()
+            continue
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("Expected a JSON array, got " + repr(buf[pos : pos + 40]))
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if done:
+                raise
+            more()  # the item goes on in the next chunk
+            continue
+        after = JSON_SPACE.match(buf, end).end()
+        if after == len(buf) or buf[after] not in ",]":
+            if done:
+                raise ValueError("Expected , or ] after a JSON array item at " + repr(buf[after : after + 40]))
+            more()  # a number cut by the chunk (1 of 1.5), decode it again with the next chunk
+            continue
+        pos = after + 1 if buf[after] == "," else after
+        yield item
+
+
+def iter_acartia(url=ACARTIA_URL, token=None, session=None, chunk_size=1 << 16):
+    """
+    Acartia records projected to ACARTIA_COLUMNS and entry_id while the response streams in
+    Follows the Link: rel="next" header, should the API page its results
+    """
+    if session is None:
+        session = http_session()
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = "Bearer " + token
+    fields = ACARTIA_COLUMNS + ["entry_id"]
+    while url:
+        with session.get(url, headers=headers, stream=True, timeout=HTTP_TIMEOUT) as r:
+            r.raise_for_status()
+            for record in iter_json_array(r.iter_content(chunk_size=chunk_size)):
+                yield {k: record.get(k) for k in fields}
+            url = r.links.get("next", {}).get("url")
+            if url:
+                url = urljoin(r.url, url)  # the link may be relative to the page
+
+
+def scrape_acartia(acartia_path="./data/acartia/", url=ACARTIA_URL, session=None, batch_rows=5000):
+    """
+    Save the Acartia sightings not processed yet (newer than the watermark, or all of
+    them on the first run) to acartia_<today>.csv for proc_acartia()
+    The response is parsed as it streams in and written in batches of batch_rows records,
+    so memory stays flat however long the Acartia history gets. Rows are in API order and
+    may repeat a record, proc_acartia() sorts them by created and drops the repeats.
+    """
     today=date.today()
     todaystr=str(today)
 
@@ -110,52 +566,32 @@ def scrape_acartia(acartia_path="./data/acartia/"):
     except:
         atoken = os.environ["ACARTIA_TOKEN"] #For deployment
 
-    # Acartia webpages
-    url = "https://acartia.io/api/v1/sightings/"
-    response = requests.get(
-        url,
-        headers={
-            "Authorization": "Bearer " + atoken,
-            "Content-Type": "application/json",
-        },
-    )
-    acartia = pd.DataFrame(
-        response.json(),
-        columns=[
-            "type",
-            "created",
-            "profile",
-            "trusted",
-            "entry_id",
-            "latitude",
-            "longitude",
-            "photo_url",
-            "signature",
-            "ssemmi_id",
-            "no_sighted",
-            "submitter_did",
-            "data_source_id",
-            "data_source_name",
-            "ssemmi_date_added",
-            "data_source_entity",
-            "data_source_witness",
-            "data_source_comments",
-        ],
-    )
-    acartia = acartia[
-        [
-            "type",
-            "created",
-            "latitude",
-            "longitude",
-            "no_sighted",
-            "data_source_id",
-            "data_source_comments",
-        ]
-    ]
-    acartia = acartia.drop_duplicates()
-    acartia = acartia.sort_values(by=["created"])
-    acartia.to_csv(acartia_path + "acartia_" + todaystr + ".csv", index=False)
+    watermark = read_watermark(acartia_path)
+    path = acartia_path + "acartia_" + todaystr + ".csv"
+    tmp = path + ".tmp"
+    batch = []
+    header = True
+
+    def flush():
+        nonlocal header, batch
+        acartia = pd.DataFrame(batch, columns=ACARTIA_COLUMNS + ["entry_id"])
+        batch = []
+        if watermark is not None:
+            acartia = acartia[newer_than(acartia, watermark)]
+        acartia.to_csv(tmp, mode="w" if header else "a", header=header, index=False)
+        header = False
+
+    try:
+        for record in iter_acartia(url, atoken.strip(), session=session):
+            batch.append(record)
+            if len(batch) >= batch_rows:
+                flush()
+        flush()
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
 
 def cleandates(s):
   if s.count('T')>0:
@@ -165,12 +601,119 @@ def cleandates(s):
   return s
 
 
+# Keys to look up in Acartia comments
+SRKW_KEYS = ['SRKW', 'srkw', 'southern resident', 'Southern Resident', 'Southern resident', 'southern Resident']
+JPOD_KEYS = ['J pod', 'Jpod', 'J ppd', 'J-pod', 'Js', 
+        'j pod', 'jpod', 'j ppd', 'j-pod',  
+        'j+k', 'k+j', 'j & k', 'k & j', 'j and k', 'k and j','jk pods', 'kj pods',
+        'J+K', 'K+J', 'J & K', 'K & J', 'J and K', 'K and J','JK pods', 'KJ pods',
+        'j+l', 'l+j', 'j & l', 'l & j', 'j and l', 'l and j', 'jl pods', 'lj pods',
+        'J+L', 'L+J', 'J & L', 'L & J', 'J and L', 'L and J', 'JL pods', 'LJ pods',
+        'j, k, l pod', 'j, k, and l pod','jkl', 
+        'J, K, L pod', 'J, K, and L pod','JKL', 
+        'j27', 'j38', 'j35','j40',
+        'J27', 'J38', 'J35','J40',
+        ]
+KPOD_KEYS = ['K pod', 'Kpod', 'K-pod', 'Ks',
+        'k pod', 'kpod', 'k-pod', 
+        'j+k', 'k+j', 'j & k', 'k & j', 'j and k', 'k and j', 'jk pods', 'kj pods',
+        'J+K', 'K+J', 'J & K', 'K & J', 'J and K', 'K and J', 'JK pods', 'KJ pods',
+        'k+l', 'l+k', 'k & l','l & k', 'k and l', 'l and k', 'lk pods', 'kl pods',
+        'K+L', 'L+K', 'K & L','L & K', 'K and L', 'L and K', 'LK pods', 'KL pods',
+        'j, k, l pod', 'j, k, and l pod','jkl', 
+        'J, K, L pod', 'J, K, and L pod','JKL', 
+        'k37', 'K37',
+]
+LPOD_KEYS = ['L pod', 'Lpod', 'L-pod', 'Ls',
+        'j+l', 'l+j', 'j & l', 'l & j', 'j and l', 'l and j', 'jl pods', 'lj pods',
+        'J+L', 'L+J', 'J & L', 'L & J', 'J and L', 'L and J', 'JL pods', 'LJ pods',
+        'k+l', 'l+k', 'k & l','l & k', 'k and l', 'l and k', 'lk pods', 'kl pods',
+        'K+L', 'L+K', 'K & L','L & K', 'K and L', 'L and K', 'LK pods', 'KL pods',
+        'j, k, l pod', 'j, k, and l pod','jkl', 
+        'J, K, L pod', 'J, K, and L pod','JKL', 
+        'l12','l54','l-12','l82','l85','l87', 
+        'L12','L54','L-12','L82','L85','L87',
+]
+BIGGS_KEYS = ['Bigg','bigg', 'Transient', 'transient', 'Ts',
+            't99', 't137','t46','t10','t2c','t49',
+            'T99','T137','T36','T10','T2C','T49',
+            ]
+
+
+def _any_key(keys):
+    """
+    One compiled alternation of all keys: matches wherever any(k in text for k in keys) is true
+    """
+    return re.compile("|".join(re.escape(k) for k in keys))
+
+
+SRKW_PATTERN = _any_key(SRKW_KEYS)
+JPOD_PATTERN = _any_key(JPOD_KEYS)
+KPOD_PATTERN = _any_key(KPOD_KEYS)
+LPOD_PATTERN = _any_key(LPOD_KEYS)
+BIGGS_PATTERN = _any_key(BIGGS_KEYS)
+
+
+def classify_comments(comments, types):
+    """
+    Label Acartia sightings by pod, ecotype and travel direction from their comments
+    Each label is one vectorized regex pass over the comments
+    Returns a data frame of 0/1 columns (J, K, L, srkw, biggs, south, ...) aligned with comments
+    """
+    text = comments.astype(str)
+    low = text.str.lower()
+
+    def has(s, pat):
+        return s.str.contains(pat, regex=not isinstance(pat, str))
+
+    lab = pd.DataFrame(index=comments.index)
+    # Pods
+    lab["J"] = has(text, JPOD_PATTERN)
+    lab["K"] = has(text, KPOD_PATTERN)
+    lab["L"] = has(text, LPOD_PATTERN)
+    # Southern Residents
+    lab["sum_jkl"] = lab["J"].astype(int) + lab["K"].astype(int) + lab["L"].astype(int)
+    lab["srkw_generic"] = has(low, SRKW_PATTERN)
+    lab["srkw_type"] = types.astype(object).str.contains("Southern Resident", regex=False, na=False).astype(bool)
+    lab["srkw"] = lab["J"] | lab["K"] | lab["L"] | lab["srkw_generic"] | lab["srkw_type"]
+    # Biggs
+    lab["biggs"] = has(low, BIGGS_PATTERN) | has(text, "Ts")
+    lab["sum_srkw_biggs"] = lab["srkw"].astype(int) + lab["biggs"].astype(int)
+    # Direction
+    lab["south"] = has(low, "southbound") | has(low, "heading south")
+    lab["southeast"] = has(low, "southeast") | has(text, "SE")
+    lab["southwest"] = has(low, "southwest") | has(text, "SW")
+    lab["north"] = has(low, "northbound") | has(low, "heading north")
+    lab["northeast"] = has(low, "northeast") | has(text, "NE")
+    lab["northwest"] = has(low, "northwest") | has(text, "NW")
+    lab["east"] = (has(low, "eastbound") & ~has(low, "southeastbound")) | has(low, "heading east")
+    lab["west"] = (has(low, "westbound") & ~has(low, "northwestbound")) | has(low, "heading west")
+    lab = lab.astype("int64")
+    lab["dir_sum"] = lab[["south", "southeast", "southwest", "north", "northeast", "northwest", "east", "west"]].sum(axis=1)
+    return lab
+
+
 def proc_acartia(acartia_path):
+    """
+    Classify the records saved by scrape_acartia() and write srkw_<year>.csv
+    On the first run (no watermark yet) every year from 2018 is rewritten, after that the
+    new records are appended to the years they fall in and only those files are rewritten
+    """
     today=date.today()
     todaystr=str(today)
     curyr=today.year
+    watermark=read_watermark(acartia_path)
 
     acartia=pd.read_csv(acartia_path+'acartia_'+todaystr+'.csv')
+    if 'entry_id' not in acartia.columns: # dumps from before the watermark
+        acartia['entry_id']=None
+    # a record the API repeated is kept once: by entry_id, or by content when it has none
+    keyed=acartia['entry_id'].notnull()
+    acartia=pd.concat([acartia[keyed].drop_duplicates(subset=['entry_id']),
+                       acartia[~keyed].drop_duplicates(subset=ACARTIA_COLUMNS)]).sort_index()
+    acartia=acartia.sort_values(by=['created'], kind='stable') # scrape_acartia() keeps the API order
+    new_records=acartia[['created','entry_id']]
+    acartia=acartia[ACARTIA_COLUMNS]
     acartia=acartia[~acartia['created'].isnull()]
     acartia['created']=acartia['created'].apply(lambda x: cleandates(x))
     acartia['m']=pd.DatetimeIndex(acartia['created']).month
@@ -181,103 +724,19 @@ def proc_acartia(acartia_path):
     acartia['date_ymd']=acartia[['year','m','day']].apply(lambda x: '-'.join(x.values.astype(str)), axis="columns")
     acartia['time']=pd.DatetimeIndex(acartia['created']).time
 
-    # Define keys to look up
-    srkw_keys=['SRKW', 'srkw', 'southern resident', 'Southern Resident', 'Southern resident', 'southern Resident']
-    jpod_keys=['J pod', 'Jpod', 'J ppd', 'J-pod', 'Js', 
-            'j pod', 'jpod', 'j ppd', 'j-pod',  
-            'j+k', 'k+j', 'j & k', 'k & j', 'j and k', 'k and j','jk pods', 'kj pods',
-            'J+K', 'K+J', 'J & K', 'K & J', 'J and K', 'K and J','JK pods', 'KJ pods',
-            'j+l', 'l+j', 'j & l', 'l & j', 'j and l', 'l and j', 'jl pods', 'lj pods',
-            'J+L', 'L+J', 'J & L', 'L & J', 'J and L', 'L and J', 'JL pods', 'LJ pods',
-            'j, k, l pod', 'j, k, and l pod','jkl', 
-            'J, K, L pod', 'J, K, and L pod','JKL', 
-            'j27', 'j38', 'j35','j40',
-            'J27', 'J38', 'J35','J40',
-            ]
-    kpod_keys=['K pod', 'Kpod', 'K-pod', 'Ks',
-            'k pod', 'kpod', 'k-pod', 
-            'j+k', 'k+j', 'j & k', 'k & j', 'j and k', 'k and j', 'jk pods', 'kj pods',
-            'J+K', 'K+J', 'J & K', 'K & J', 'J and K', 'K and J', 'JK pods', 'KJ pods',
-            'k+l', 'l+k', 'k & l','l & k', 'k and l', 'l and k', 'lk pods', 'kl pods',
-            'K+L', 'L+K', 'K & L','L & K', 'K and L', 'L and K', 'LK pods', 'KL pods',
-            'j, k, l pod', 'j, k, and l pod','jkl', 
-            'J, K, L pod', 'J, K, and L pod','JKL', 
-            'k37', 'K37',
-    ]
-    lpod_keys=['L pod', 'Lpod', 'L-pod', 'Ls',
-            'j+l', 'l+j', 'j & l', 'l & j', 'j and l', 'l and j', 'jl pods', 'lj pods',
-            'J+L', 'L+J', 'J & L', 'L & J', 'J and L', 'L and J', 'JL pods', 'LJ pods',
-            'k+l', 'l+k', 'k & l','l & k', 'k and l', 'l and k', 'lk pods', 'kl pods',
-            'K+L', 'L+K', 'K & L','L & K', 'K and L', 'L and K', 'LK pods', 'KL pods',
-            'j, k, l pod', 'j, k, and l pod','jkl', 
-            'J, K, L pod', 'J, K, and L pod','JKL', 
-            'l12','l54','l-12','l82','l85','l87', 
-            'L12','L54','L-12','L82','L85','L87',
-    ]
-    biggs_keys=['Bigg','bigg', 'Transient', 'transient', 'Ts',
-                't99', 't137','t46','t10','t2c','t49',
-                'T99','T137','T36','T10','T2C','T49',
-                ]
-
-    # J pod
-    acartia['J']=acartia['data_source_comments'].apply(lambda x: 1 if any([k for k in jpod_keys if k in str(x)])
-    else 0)
-    # K pod
-    acartia['K']=acartia['data_source_comments'].apply(lambda x: 1 if any([k for k in kpod_keys if k in str(x)])
-    else 0)
-    # L pod
-    acartia['L']=acartia['data_source_comments'].apply(lambda x: 1 if any([k for k in lpod_keys if k in str(x)])
-    else 0)
-
-    # Southern Residents
-    acartia['sum_jkl']=acartia['J']+acartia['K']+acartia['L']
-    acartia['srkw_generic']=acartia['data_source_comments'].apply(lambda x: 1 if any([k for k in srkw_keys if k in str(x).lower()])
-    else 0)
-    acartia['srkw_type']=acartia['type'].apply(lambda x: 1 if isinstance(x, str) and ('Southern Resident') in x else 0)
-    acartia['srkw']=acartia[['J', 'K', 'L', 'srkw_generic', 'srkw_type']].values.max(axis=1)
-
-    # Biggs
-    acartia['biggs']=acartia['data_source_comments'].apply(lambda x: 1 if any([k for k in biggs_keys if k in str(x).lower()]) or ('Ts') in str(x) else 0)
-
-    acartia['sum_srkw_biggs']=acartia['srkw']+acartia['biggs']
-
-    # direction 
-    acartia['south']=acartia['data_source_comments'].apply(lambda x: 1 if ('southbound') in str(x).lower()
-    or ('heading south' in str(x).lower())
-    else 0)
-
-    acartia['southeast']=acartia['data_source_comments'].apply(lambda x: 1 if ('southeast') in str(x).lower()
-    or ('SE' in str(x))
-    else 0)
-
-    acartia['southwest']=acartia['data_source_comments'].apply(lambda x: 1 if ('southwest') in str(x).lower()
-    or ('SW' in str(x))
-    else 0)
-
-    acartia['north']=acartia['data_source_comments'].apply(lambda x: 1 if ('northbound') in str(x).lower()
-    or ('heading north' in str(x).lower())
-    else 0)
-
-    acartia['northeast']=acartia['data_source_comments'].apply(lambda x: 1 if ('northeast') in str(x).lower()
-    or ('NE' in str(x))
-    else 0)
-
-    acartia['northwest']=acartia['data_source_comments'].apply(lambda x: 1 if ('northwest') in str(x).lower()
-    or ('NW' in str(x))
-    else 0)
-
-    acartia['east']=acartia['data_source_comments'].apply(lambda x: 1 if (('eastbound') in str(x).lower() and ('southeastbound') not in str(x).lower())
-    or ('heading east' in str(x).lower())
-    else 0)
-
-    acartia['west']=acartia['data_source_comments'].apply(lambda x: 1 if (('westbound') in str(x).lower() and ('northwestbound' not in str(x).lower()))
-    or ('heading west' in str(x).lower())
-    else 0)
-
-    acartia['dir_sum']=acartia['south']+acartia['southeast']+acartia['southwest']+acartia['north']+acartia['northeast']+acartia['northwest']+acartia['east']+acartia['west']
+    acartia=pd.concat([acartia, classify_comments(acartia['data_source_comments'], acartia['type'])], axis=1)
 
-    for y in range(2018,curyr+1):
+    if watermark is None:
+        years=range(2018,curyr+1)
+    else:
+        years=sorted(y for y in acartia.loc[acartia['srkw']==1, 'year'].unique() if y>=2018)
+    for y in years:
         act=acartia[acartia['year']==y]
         act=act[act['srkw']==1]
+        fn=acartia_path+'srkw_'+str(y)+'.csv'
+        if watermark is not None and os.path.exists(fn):
+            act=pd.concat([pd.read_csv(fn), act.astype({'time':str})], ignore_index=True)
+            act=act.sort_values(by=['created'], kind='stable')
         act=act.drop_duplicates()
-        act.to_csv(acartia_path+'srkw_'+str(y)+'.csv', index=False)
+        act.to_csv(fn, index=False)
+    write_watermark(acartia_path, new_records, watermark)
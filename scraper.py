@@ -3,13 +3,18 @@
 # Author: Zoe Liu
 # Date: Oct 12th 2022
 # Updated: Dec 8th 2024
+# Usage: python scraper.py [--force]
+# Every stage is recorded in data/pipeline.json (see pipeline.py): stages whose inputs did not change
+# are skipped, and deploy_needed tells the workflow whether the app has anything new to deploy
 
 #### 1 Setup
 # 1.1 Import libraries
+import sys
 from datetime import date
 import pandas as pd
 pd.options.mode.chained_assignment = None #suppress chained assignment
-from scrapefunc import (scrape_fos, scrape_bon,scrape_acartia, proc_acartia)
+from scrapefunc import (scrape_fos, get_bon, http_session, scrape_years, scrape_acartia, proc_acartia)
+from pipeline import Pipeline, github_output
 
 # 1.2 Get today's date
 today=date.today()
@@ -24,34 +29,51 @@ byl=[y for y in range(1939, curyr+1)] #year list for Bonneville Dam
 fos_path='./data/foschinook/'
 bon_path='./data/bonchinook/'
 acartia_path='./data/acartia/'
+data_path='./data/'
+pipe=Pipeline(data_path, force='--force' in sys.argv)
 
 ##### 2 Scap web data
 # 2.1 Scrape Chinook data by year
 
 # Use the following line to download the current year
-scrape_fos(yrs=str(curyr),spe='CHINOOK SALMON')
+pipe.stage('fos', lambda: scrape_fos(yrs=str(curyr),spe='CHINOOK SALMON'),
+           outputs=['foschinook/fos'+str(curyr)+'.csv'])
 
 # Use the following lines to download all fos chinook data
+# (one browser per worker, years run in parallel)
 # Note: commented out after running it once
 '''
-for y in ayl:
-  scrape_fos(yrs=str(y),spe='CHINOOK SALMON', fos_path=fos_path)
+failed=scrape_years(scrape_fos, ayl, workers=4, spe='CHINOOK SALMON', fos_path=fos_path)
+print('Failed years:', sorted(failed))
 '''
 
 # 2.2 Scrape Bonneville Dam Chinook Daily count
 # Use the following line to download the current year
-scrape_bon(yrs=str(curyr), bon_path=bon_path)
+# (straight csv download from DART, falls back to the browser if that fails)
+pipe.stage('bon', lambda: get_bon(yrs=str(curyr), bon_path=bon_path),
+           outputs=['bonchinook/bon'+str(curyr)+'.csv'])
 
-# Use the following lines to download all fos chinook data
+# Use the following lines to download all Bonneville chinook data
 #Note: commented out after running it once
 '''
+session=http_session()
 for y in byl:
-  scrape_bon(yrs=str(y), bon_path=bon_path)
+  get_bon(yrs=str(y), bon_path=bon_path, session=session)
 '''
 
 # 2.3 Scrape Acartia orca data
 # Run the following code to scrape Acartia data
-scrape_acartia(acartia_path=acartia_path)
+# (the dump is named by date, its hash is kept under 'dump' so an empty week matches the last one)
+dump={'dump':'acartia/acartia_'+todaystr+'.csv'}
+pipe.stage('acartia', lambda: scrape_acartia(acartia_path=acartia_path), outputs=dump)
+
+# Processing Acartia Data (skipped when the dump has no new records)
+pipe.stage('proc_acartia', lambda: proc_acartia(acartia_path), inputs=dump,
+           outputs=['acartia/srkw_*.csv', 'acartia/acartia_watermark.json'])
 
-# Processing Acartia Data
-proc_acartia(acartia_path)
\ No newline at end of file
+##### 3 Deploy only when the app data or code changed since the last deploy
+# the deploy workflow records what it shipped (python pipeline.py --mark-deployed) once flyctl deploy succeeded,
+# so a failed deploy is tried again next week
+deploy_needed=pipe.deploy_needed()
+print('Deploy needed:', deploy_needed, '(changed: '+(', '.join(pipe.changed) or 'nothing')+')')
+github_output(deploy_needed=str(deploy_needed).lower())
@@ -0,0 +1,179 @@
+## Project Name: Orcasound Salmon
+### Program Name: synthdata.py
+### Purpose: To write synthetic FOS, DART, Lake Washington, Acartia and TWM files for benchmarks
+##### Date Created: Oct 18th 2026
+# Usage: python synthdata.py <path> [years] [rows] [comment_length]
+
+"""
+Files come out in the same layout and format as the scraped ones under data/, so the loaders,
+proc_acartia() and the app read them unchanged:
+
+    foschinook/fos<year>.csv    1980 to this year, one row per test fishing day
+    bonchinook/bon<year>.csv    1939 to this year, daily DART counts with the DART notes below
+    lakewash/<year>.csv         2024 to last year
+    acartia/acartia_<today>.csv raw Acartia records (srkw_<year>.csv made from it by proc_acartia)
+    twm/twm<year>.csv           the last `years` years of TWM, up to 2021
+    SRKW.csv                    population by pod
+
+The salmon year ranges are fixed by the loaders; `years` scales the sighting years,
+`rows` the sightings per year and `comment_length` the words in an Acartia comment.
+"""
+
+import os
+import sys
+import shutil
+from os.path import join as pjoin
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+WORDS=['orcas','whales','seen','from','the','ferry','near','Lime','Kiln','point','foraging','milling',
+       'spread','out','close','to','shore','several','males','calves','breaching','tail','slapping',
+       'reported','by','observers','at','Haro','Strait','Rosario','Admiralty','Inlet','passage']
+POD_WORDS=['J pod','Js','J-pod','K pod','Ks','L pod','Ls','L-pod','SRKW','Southern Residents',"Bigg's",'Ts','transients']
+HEADINGS=['southbound','northbound','heading east','westbound','SE','NW','heading south','']
+SOURCES=['[Orca Network]','[WSSJI]','[Whale Alert]','[Cascadia Trusted Observers]']
+DART_NOTES=['Notes:','Data Courtesy of U.S. Army Corps of Engineers.',
+            '"DART Data Citation. Columbia River DART, Columbia Basin Research, University of Washington."']
+LAT=(47.0, 49.0) # Puget Sound and the San Juan Islands
+LON=(-124.5, -122.2)
+
+## ----------------Salmon ---------------------##
+def season(year, rng, start=(4,21), end=(10,20)):
+    """
+    Days of a fishing or counting season, with the run peaking around mid summer
+    """
+    days=pd.date_range(date(year,*start), date(year,*end))
+    days=days[days.date<=date.today()]
+    peak=200+rng.normal(0, 10)
+    run=np.exp(-((days.dayofyear-peak)/25)**2)
+    return days, run
+
+def fos_year(year, rng):
+    days, run=season(year, rng)
+    effort=rng.integers(5000, 25000, len(days))
+    catch=rng.poisson(20*run)
+    return pd.DataFrame({
+        'day':days.strftime('%d'),'mon':days.strftime('%b'),'year':year,'netlen':200,
+        'catch1':catch,'sets1':2,'effort1':[f'{e:,}' for e in effort],
+        'cpue1':np.round(catch/effort*1000, 2),'catch2':0,'sets2':0,'effort2':0,'cpue2':0})
+
+def bon_year(year, rng):
+    days=pd.date_range(date(year,1,1), min(date(year,12,31), date.today()))
+    run=np.exp(-((days.dayofyear-120)/20)**2)+0.6*np.exp(-((days.dayofyear-250)/15)**2)
+    chin=rng.poisson(3000*run).astype(float)
+    chin[(days.month<3) | (days.month>11)]=np.nan # no counting in winter
+    return pd.DataFrame({'Project':'Bonneville','Date':days.strftime('%Y-%m-%d'),'Chinook Run':'',
+                         'Chin':chin,'JChin':'','Stlhd':rng.poisson(50, len(days))})
+
+def write_bon(d, fn):
+    d.to_csv(fn, index=False)
+    with open(fn, 'a') as f:
+        f.write('\n'.join(DART_NOTES)+'\n')
+
+def wash_year(year, rng):
+    days, run=season(year, rng, start=(6,30), end=(10,2))
+    count=rng.poisson(400*run)
+    return pd.DataFrame({'Date':[f'{d.month}/{d.day}' for d in days],'Daily Count':count,
+                         'Running Total':count.cumsum()})
+
+def srkw_population(years, rng):
+    n=len(years)
+    j, k, l=(np.clip(np.round(m+np.cumsum(rng.normal(0, 1, n))), 10, 100).astype(int) for m in (20, 18, 40))
+    births=rng.poisson(3, n)
+    deaths=rng.poisson(3, n)
+    return pd.DataFrame({'year':years,'J':j,'K':k,'L':l,'JKL':j+k+l,'birth':births,'death':deaths,'death_neg':-deaths})
+
+## ----------------Sightings ---------------------##
+def sighting_times(year, n, rng):
+    """
+    n sighting times in a year, most of them in summer, sorted
+    """
+    last=366 if year%4==0 else 365
+    if year==date.today().year:
+        last=min(last, date.today().timetuple().tm_yday)
+    doy=np.sort(np.clip(rng.normal(200, 50, n), 1, last).astype(int))
+    return pd.Timestamp(year,1,1)+pd.to_timedelta(doy-1, 'D')+pd.to_timedelta(rng.integers(0, 86400, n), 's')
+
+def comment(rng, length):
+    words=list(rng.choice(WORDS, max(length-3, 1)))
+    words.insert(int(rng.integers(0, len(words)+1)), rng.choice(POD_WORDS))
+    return ' '.join([rng.choice(SOURCES)]+words+[rng.choice(HEADINGS)]).strip()
+
+def acartia_records(years, rows, comment_length, rng):
+    """
+    Raw Acartia records as scrape_acartia() saves them, `rows` per year
+    """
+    recs=[]
+    for y in years:
+        t=sighting_times(y, rows, rng)
+        recs.append(pd.DataFrame({
+            'type':rng.choice(['Southern Resident Orca','Killer Whale (Orca)','Orca'], rows),
+            'created':t.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'latitude':np.round(rng.uniform(*LAT, rows), 5),
+            'longitude':np.round(rng.uniform(*LON, rows), 5),
+            'no_sighted':rng.integers(1, 30, rows),
+            'data_source_id':rng.integers(100000, 999999, rows),
+            'data_source_comments':[comment(rng, comment_length) for i in range(rows)]}))
+    recs=pd.concat(recs, ignore_index=True)
+    recs['entry_id']=[f'{i:08x}' for i in range(len(recs))]
+    return recs
+
+def twm_year(year, rows, rng):
+    t=sighting_times(year, rows, rng)
+    lat=rng.uniform(*LAT, rows)
+    return pd.DataFrame({'SightDate':t.strftime('%Y-%m-%d'),'Time1':t.strftime('%H:%M'),'Month':t.month,
+                         'latitude':lat,'longitude':rng.uniform(*LON, rows),
+                         'j':rng.integers(0, 2, rows),'k':rng.integers(0, 2, rows),'l':rng.integers(0, 2, rows),
+                         'puget_sound':(lat<=48.19437).astype(int),'central_salish':(lat>48.19437).astype(int)})
+
+## ----------------Whole data folder ---------------------##
+def make_data(path, years=10, rows=1500, comment_length=20, seed=0, base=None):
+    """
+    Write a data folder for the app at path
+    base: copy this data folder first (the bundled data/) and only add the files it does not have
+    Returns path
+    """
+    from scrapefunc import proc_acartia, read_watermark, write_watermark
+    rng=np.random.default_rng(seed)
+    curyr=date.today().year
+    if base is not None:
+        shutil.copytree(base, path, dirs_exist_ok=True, ignore=shutil.ignore_patterns('appstore'))
+    for d in ['foschinook','bonchinook','lakewash','acartia','twm']:
+        os.makedirs(pjoin(path, d), exist_ok=True)
+    def missing(fn):
+        return not os.path.exists(fn)
+    for y in range(1980, curyr+1):
+        fn=pjoin(path, 'foschinook', 'fos'+str(y)+'.csv')
+        if missing(fn):
+            fos_year(y, rng).to_csv(fn, index=False)
+    for y in range(1939, curyr+1):
+        fn=pjoin(path, 'bonchinook', 'bon'+str(y)+'.csv')
+        if missing(fn):
+            write_bon(bon_year(y, rng), fn)
+    for y in range(2024, curyr):
+        fn=pjoin(path, 'lakewash', str(y)+'.csv')
+        if missing(fn):
+            wash_year(y, rng).to_csv(fn, index=False)
+    acartia_path=pjoin(path, 'acartia/')
+    acartia_years=[y for y in range(max(2018, curyr-years+1), curyr+1) if missing(acartia_path+'srkw_'+str(y)+'.csv')]
+    if acartia_years:
+        acartia_records(acartia_years, rows, comment_length, rng).to_csv(
+            acartia_path+'acartia_'+str(date.today())+'.csv', index=False)
+        if read_watermark(acartia_path) is None:
+            # with a watermark proc_acartia() only writes the years in the records, not every year from 2018
+            write_watermark(acartia_path, pd.DataFrame({'created':['2000-01-01'],'entry_id':['']}))
+        proc_acartia(acartia_path)
+    for y in range(max(1976, 2021-years+1), 2022):
+        fn=pjoin(path, 'twm', 'twm'+str(y)+'.csv')
+        if missing(fn):
+            twm_year(y, rows, rng).to_csv(fn, index=False)
+    fn=pjoin(path, 'SRKW.csv')
+    if missing(fn):
+        srkw_population(list(range(1976, curyr)), rng).to_csv(fn, index=False)
+    return path
+
+if __name__ == '__main__':
+    args=[int(a) for a in sys.argv[2:]]
+    print(make_data(sys.argv[1], *args))
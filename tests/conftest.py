@@ -0,0 +1,92 @@
+## Project Name: Orcasound Salmon
+### Program Name: tests/conftest.py
+### Purpose: Shared test set up: the modules of the repository root are importable, and a local web server
+##### Date Created: Oct 18th 2026
+
+import sys
+import pathlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+
+REPO = pathlib.Path(__file__).resolve().parent.parent
+DATA = REPO / "data"
+sys.path.insert(0, str(REPO))
+
+
+class LocalServer:
+    """
+    http.server on a free local port answering GET with respond(path, query) -> (status, headers, body)
+    Every request is kept in requests as (path, query)
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                server.requests.append((url.path, query))
+                status, headers, body = server.respond(url.path, query)
+                if isinstance(body, str):
+                    body = body.encode()
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%d" % self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def serve():
+    """
+    serve(respond) starts a LocalServer, stopped after the test
+    """
+    servers = []
+
+    def start(respond):
+        servers.append(LocalServer(respond))
+        return servers[-1]
+
+    yield start
+    for s in servers:
+        s.close()
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """
+    app.py with CLIENT_MAPS=1, serving the bundled data plus synthetic files for what it lacks
+    (the current year, TWM), as benchmark.py suite does; imported once per test session
+    """
+    import synthdata
+
+    data_path = str(tmp_path_factory.mktemp("appdata")) + "/"
+    synthdata.make_data(data_path, years=2, rows=200, comment_length=5, base=str(DATA))
+    mp = pytest.MonkeyPatch()
+    mp.setenv("DATA_PATH", data_path)
+    mp.setenv("CLIENT_MAPS", "1")
+    mp.setenv("DATA_RELOAD_INTERVAL", "0")
+    mp.setenv("DATA_RELOAD_TOKEN", "secret")
+    import app
+
+    yield app
+    mp.undo()
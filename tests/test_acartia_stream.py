@@ -0,0 +1,97 @@
+## Project Name: Orcasound Salmon
+### Program Name: tests/test_acartia_stream.py
+### Purpose: The streaming Acartia download: JSON arrays cut into small chunks, paged responses, repeated records
+##### Date Created: Oct 18th 2026
+
+import json
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import scrapefunc
+from scrapefunc import iter_json_array, iter_acartia, ACARTIA_COLUMNS
+
+
+def record(i, created="2024-07-0%dT10:00:00.000Z", **kw):
+    r = {
+        "type": "Orca",
+        "created": created % (i % 9 + 1) if "%" in created else created,
+        "latitude": 48.5 + i / 1000,
+        "longitude": -123.1,
+        "no_sighted": i,
+        "data_source_id": "test",
+        "data_source_comments": "J pod heading north, Ørca ✓ \"quoted\" {not json}",
+        "entry_id": "e%d" % i,
+        "ssemmi_id": "dropped",
+    }
+    r.update(kw)
+    return r
+
+
+RECORDS = [record(i) for i in range(12)] + [record(12, no_sighted=1.5e-3), {"nested": [1, {"a": []}]}]
+
+
+def chunked(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 1 << 16])
+def test_json_array_in_chunks(size):
+    data = json.dumps(RECORDS, ensure_ascii=False, indent=1).encode("utf-8")
+    assert list(iter_json_array(chunked(data, size))) == RECORDS
+
+
+@pytest.mark.parametrize("text", ["[]", " [ ] ", "[1,2.5,-3e2]", '["a","]"]'])
+def test_json_array_small(text):
+    for size in (1, 2, len(text)):
+        assert list(iter_json_array(chunked(text.encode(), size))) == json.loads(text)
+
+
+@pytest.mark.parametrize("text", ['{"a": 1}', "[1, 2", "[1 2]", '[{"a": 1}'])
+def test_json_array_broken(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(chunked(text.encode(), 3)))
+
+
+def pages(server_records, per_page):
+    """
+    respond() of a server giving server_records per_page at a time, linking the next page
+    """
+
+    def respond(path, query):
+        page = int(query.get("page", 1))
+        body = json.dumps(server_records[(page - 1) * per_page : page * per_page])
+        headers = {"Content-Type": "application/json"}
+        if page * per_page < len(server_records):
+            headers["Link"] = '<%s?page=%d>; rel="next"' % (path, page + 1)
+        return 200, headers, body
+
+    return respond
+
+
+def test_link_next_chain(serve):
+    records = [record(i) for i in range(10)]
+    server = serve(pages(records, 4))
+    got = list(iter_acartia(server.url + "/api/v1/sightings/", token="t", chunk_size=5))
+    assert got == [{k: r[k] for k in ACARTIA_COLUMNS + ["entry_id"]} for r in records]
+    assert [q.get("page") for p, q in server.requests] == [None, "2", "3"]
+
+
+def test_repeats_written_then_dropped(serve, tmp_path, monkeypatch):
+    # the API repeats e3 (edited in between) on the second page and a record without an entry_id on the third
+    records = [record(i) for i in range(8)]
+    records.insert(5, record(3, data_source_comments="J pod, edited"))
+    records += [record(20, entry_id=None), record(20, entry_id=None)]
+    server = serve(pages(records, 4))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ACARTIA_TOKEN", "t")
+    acartia_path = str(tmp_path) + "/"
+    scrapefunc.scrape_acartia(acartia_path, url=server.url + "/", batch_rows=3)
+    dump = pd.read_csv(tmp_path / ("acartia_%s.csv" % date.today()))
+    assert len(dump) == len(records)  # written as streamed, in API order
+
+    scrapefunc.proc_acartia(acartia_path)
+    srkw = pd.read_csv(tmp_path / "srkw_2024.csv")
+    assert sorted(srkw["no_sighted"]) == list(range(8)) + [20]
+    assert "edited" not in srkw.loc[srkw["no_sighted"] == 3, "data_source_comments"].item()
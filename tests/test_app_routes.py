@@ -0,0 +1,62 @@
+## Project Name: Orcasound Salmon
+### Program Name: tests/test_app_routes.py
+### Purpose: The versioned /_orcamap data routes only cache real versions and years
+##### Date Created: Oct 18th 2026
+
+import pytest
+
+
+@pytest.fixture
+def client(app_module):
+    app_module.track_traces.cache_clear()
+    return app_module.server.test_client()
+
+
+@pytest.mark.parametrize("year", [1989, 99999, 0])
+def test_years_outside_the_map(client, year):
+    assert client.get("/_orcamap/v/sightings/%d.json" % year).status_code == 404
+    assert client.get("/_orcamap/v/tracks/J%%20pod/%d.json" % year).status_code == 404
+
+
+def test_tracks_cached_under_the_resolved_version(app_module, client):
+    version = app_module.plane.current.app_version
+    ok = client.get("/_orcamap/%s/tracks/J%%20pod/2015.json" % version)
+    assert ok.status_code == 200
+    assert "immutable" in ok.headers["Cache-Control"]
+    for junk in ["junk", "x" * 40, "0", version + "0"]:
+        r = client.get("/_orcamap/%s/tracks/J%%20pod/2015.json" % junk)
+        assert r.status_code == 200 and r.json == ok.json
+        assert r.headers["Cache-Control"] == "no-cache"
+    info = app_module.track_traces.cache_info()
+    assert info.currsize == 1 and info.misses == 1
+
+
+def test_unknown_version_gets_current_data_uncached(app_module, client):
+    version = app_module.plane.current.app_version
+    ok = client.get("/_orcamap/%s/lines/J%%20pod.json" % version)
+    assert "immutable" in ok.headers["Cache-Control"]
+    r = client.get("/_orcamap/junk/lines/J%20pod.json")
+    assert r.json == ok.json and r.headers["Cache-Control"] == "no-cache"
+
+
+def test_unknown_pod(client):
+    assert client.get("/_orcamap/v/lines/M%20pod.json").status_code == 404
+    assert client.get("/_orcamap/v/tracks/M%20pod/2015.json").status_code == 404
+
+
+def test_layout_per_page_load(app_module, client):
+    first, second = app_module.serve_layout(), app_module.serve_layout()
+    assert first is not second and first is not app_module.page_layout
+    assert first["orca-map-config"] is not second["orca-map-config"]
+    assert first["orca-map-config"].data["version"] == app_module.plane.current.app_version
+    # the shared layout never holds a config
+    with pytest.raises(KeyError):
+        app_module.page_layout["orca-map-config"]
+    r = client.get("/_dash-layout")
+    assert r.status_code == 200 and b"orca-map-config" in r.data
+
+
+def test_reload_token(client):
+    assert client.post("/_data/reload").status_code == 403
+    assert client.post("/_data/reload", headers={"Authorization": "Bearer secre"}).status_code == 403
+    assert client.post("/_data/reload", headers={"Authorization": "Bearer secret"}).status_code == 200
@@ -0,0 +1,71 @@
+## Project Name: Orcasound Salmon
+### Program Name: tests/test_bon_fetch.py
+### Purpose: fetch_bon / get_bon against a local server playing DART's csv report
+##### Date Created: Oct 18th 2026
+
+import os
+
+import pytest
+
+import scrapefunc
+from conftest import DATA
+
+RECORDED = (DATA / "bonchinook" / "bon2024.csv").read_bytes()
+OLD = b"Project,Date,Chinook Run,Chin\nBonneville,2024-01-01,,\n"
+
+
+@pytest.fixture
+def bon_path(tmp_path):
+    (tmp_path / "bon2024.csv").write_bytes(OLD)
+    return tmp_path
+
+
+@pytest.fixture
+def fallback(monkeypatch):
+    calls = []
+    monkeypatch.setattr(scrapefunc, "scrape_bon", lambda yrs, bon_path, driver=None, url=None: calls.append(yrs))
+    return calls
+
+
+def get(server, bon_path, retries=2):
+    session = scrapefunc.http_session(retries=retries, backoff=0)
+    return scrapefunc.get_bon("2024", str(bon_path), session=session, csv_url=server.url + "/adult_daily.php")
+
+
+def test_good_file(serve, bon_path, fallback):
+    server = serve(lambda path, query: (200, {"Content-Type": "text/csv"}, RECORDED))
+    path = get(server, bon_path)
+    assert path == os.path.join(str(bon_path), "bon2024.csv")
+    assert (bon_path / "bon2024.csv").read_bytes() == RECORDED
+    assert server.requests[0][1]["year"] == "2024"
+    assert server.requests[0][1]["outputFormat"] == "csv"
+    assert os.listdir(bon_path) == ["bon2024.csv"]
+    assert fallback == []
+
+
+def test_wrong_header(serve, bon_path, fallback):
+    page = "<html><body>DART is down for maintenance</body></html>\n" + "x" * 100000
+    server = serve(lambda path, query: (200, {"Content-Type": "text/html"}, page))
+    get(server, bon_path)
+    assert (bon_path / "bon2024.csv").read_bytes() == OLD
+    assert os.listdir(bon_path) == ["bon2024.csv"]
+    assert len(server.requests) == 1
+    assert fallback == ["2024"]
+
+
+def test_server_error(serve, bon_path, fallback):
+    server = serve(lambda path, query: (503, {}, "busy"))
+    get(server, bon_path, retries=2)
+    assert len(server.requests) == 3  # first try and two retries
+    assert (bon_path / "bon2024.csv").read_bytes() == OLD
+    assert os.listdir(bon_path) == ["bon2024.csv"]
+    assert fallback == ["2024"]
+
+
+def test_recovers_after_error(serve, bon_path, fallback):
+    answers = [(503, {}, "busy"), (200, {}, RECORDED)]
+    server = serve(lambda path, query: answers.pop(0))
+    get(server, bon_path, retries=2)
+    assert len(server.requests) == 2
+    assert (bon_path / "bon2024.csv").read_bytes() == RECORDED
+    assert fallback == []
@@ -0,0 +1,62 @@
+## Project Name: Orcasound Salmon
+### Program Name: tests/test_classify.py
+### Purpose: classify_comments gives the same labels as the per-row lambdas it replaced in proc_acartia
+##### Date Created: Oct 18th 2026
+
+import pathlib
+
+import pandas as pd
+import pytest
+
+from scrapefunc import classify_comments, SRKW_KEYS, JPOD_KEYS, KPOD_KEYS, LPOD_KEYS, BIGGS_KEYS
+
+DATA = pathlib.Path(__file__).resolve().parent.parent / "data" / "acartia"
+FILES = sorted(DATA.glob("srkw_*.csv"))
+LABELS = ["J", "K", "L", "sum_jkl", "srkw_generic", "srkw_type", "srkw", "biggs", "sum_srkw_biggs",
+          "south", "southeast", "southwest", "north", "northeast", "northwest", "east", "west", "dir_sum"]
+
+
+def lambda_labels(acartia):
+    """
+    The labels as proc_acartia computed them before classify_comments (one apply per label)
+    """
+    acartia = acartia.copy()
+    c = acartia['data_source_comments']
+    acartia['J'] = c.apply(lambda x: 1 if any([k for k in JPOD_KEYS if k in str(x)]) else 0)
+    acartia['K'] = c.apply(lambda x: 1 if any([k for k in KPOD_KEYS if k in str(x)]) else 0)
+    acartia['L'] = c.apply(lambda x: 1 if any([k for k in LPOD_KEYS if k in str(x)]) else 0)
+    acartia['sum_jkl'] = acartia['J'] + acartia['K'] + acartia['L']
+    acartia['srkw_generic'] = c.apply(lambda x: 1 if any([k for k in SRKW_KEYS if k in str(x).lower()]) else 0)
+    acartia['srkw_type'] = acartia['type'].apply(lambda x: 1 if isinstance(x, str) and ('Southern Resident') in x else 0)
+    acartia['srkw'] = acartia[['J', 'K', 'L', 'srkw_generic', 'srkw_type']].values.max(axis=1)
+    acartia['biggs'] = c.apply(lambda x: 1 if any([k for k in BIGGS_KEYS if k in str(x).lower()]) or ('Ts') in str(x) else 0)
+    acartia['sum_srkw_biggs'] = acartia['srkw'] + acartia['biggs']
+    acartia['south'] = c.apply(lambda x: 1 if ('southbound') in str(x).lower() or ('heading south' in str(x).lower()) else 0)
+    acartia['southeast'] = c.apply(lambda x: 1 if ('southeast') in str(x).lower() or ('SE' in str(x)) else 0)
+    acartia['southwest'] = c.apply(lambda x: 1 if ('southwest') in str(x).lower() or ('SW' in str(x)) else 0)
+    acartia['north'] = c.apply(lambda x: 1 if ('northbound') in str(x).lower() or ('heading north' in str(x).lower()) else 0)
+    acartia['northeast'] = c.apply(lambda x: 1 if ('northeast') in str(x).lower() or ('NE' in str(x)) else 0)
+    acartia['northwest'] = c.apply(lambda x: 1 if ('northwest') in str(x).lower() or ('NW' in str(x)) else 0)
+    acartia['east'] = c.apply(lambda x: 1 if (('eastbound') in str(x).lower() and ('southeastbound') not in str(x).lower())
+                              or ('heading east' in str(x).lower()) else 0)
+    acartia['west'] = c.apply(lambda x: 1 if (('westbound') in str(x).lower() and ('northwestbound' not in str(x).lower()))
+                              or ('heading west' in str(x).lower()) else 0)
+    acartia['dir_sum'] = acartia[['south', 'southeast', 'southwest', 'north', 'northeast', 'northwest', 'east', 'west']].sum(axis=1)
+    return acartia[LABELS]
+
+
+@pytest.mark.parametrize("path", FILES, ids=[f.name for f in FILES])
+def test_same_labels_as_lambdas(path):
+    acartia = pd.read_csv(path, usecols=['type', 'data_source_comments'])
+    expected = lambda_labels(acartia)
+    got = classify_comments(acartia['data_source_comments'], acartia['type'])
+    pd.testing.assert_frame_equal(got[LABELS], expected, check_dtype=False)
+
+
+def test_edge_rows():
+    acartia = pd.DataFrame({
+        'type': ['Southern Resident Killer Whale', None, 'Bigg\'s', float('nan'), 'Humpback'],
+        'data_source_comments': [None, 'J+K heading SE, southeastbound', 'Ts westbound', 3.5, 'northwestbound L87'],
+    })
+    got = classify_comments(acartia['data_source_comments'], acartia['type'])
+    pd.testing.assert_frame_equal(got[LABELS], lambda_labels(acartia), check_dtype=False)
@@ -0,0 +1,73 @@
+## Project Name: Orcasound Salmon
+### Program Name: tests/test_count_cube.py
+### Purpose: CountCube and LagCorr by legacy split and by the sea regions of data/regions.json
+##### Date Created: Oct 18th 2026
+
+import calendar
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from apputils import load_sightings, region_mask, CountCube, LagCorr
+from conftest import DATA
+
+
+@pytest.fixture(scope="module")
+def sightings():
+    return load_sightings(str(DATA / "acartia") + "/", None)
+
+
+@pytest.fixture(scope="module")
+def cube(sightings):
+    return CountCube.build(sightings)
+
+
+def daily_from_rows(sightings, year, mask):
+    days = sightings.loc[mask & (sightings["year"] == year).to_numpy() & (sightings["srkw"] == 1).to_numpy(), "day_of_year"]
+    ndays = 366 if calendar.isleap(year) else 365
+    return np.bincount(days.to_numpy(dtype=int) - 1, minlength=ndays)[:ndays]
+
+
+def test_regions_axis(cube, sightings):
+    sea = [r for r in sightings["region"].cat.categories if r != "Other"]
+    assert cube.regions == ["central salish", "puget sound"] + sea
+    assert cube.counts.shape[3] == len(cube.regions)
+
+
+@pytest.mark.parametrize("region", ["central salish", "puget sound", "Puget Sound", "Haro Strait and San Juan Islands",
+                                    "Strait of Juan de Fuca"])
+def test_daily_by_region(cube, sightings, region):
+    mask = region_mask(sightings, region)
+    for year in range(2018, 2026):
+        assert np.array_equal(cube.daily(year, "All pods", region), daily_from_rows(sightings, year, mask))
+
+
+def test_no_region_is_the_legacy_area(cube):
+    for year in range(2018, 2026):
+        both = cube.daily(year, "J pod", "central salish") + cube.daily(year, "J pod", "puget sound")
+        assert np.array_equal(cube.daily(year, "J pod"), both)
+    assert np.array_equal(cube.yearly("All pods"), cube.yearly("All pods", "central salish") + cube.yearly("All pods", "puget sound"))
+
+
+def test_legacy_and_sea_puget_sound_differ(cube):
+    assert cube.yearly(region="puget sound").sum() != cube.yearly(region="Puget Sound").sum()
+
+
+def test_unknown_region(cube):
+    with pytest.raises(ValueError):
+        cube.daily(2024, "All pods", "Hood Canal")
+
+
+def test_lag_corr_by_sea_region(cube):
+    days = pd.date_range("2024-01-01", "2024-12-31")
+    wide = pd.DataFrame({"m": days.month, "day": days.day, "cpue2024": np.sin(np.arange(len(days)) / 20.0),
+                         "chin2024": np.cos(np.arange(len(days)) / 20.0)})
+    lag = LagCorr(wide, wide, cube, range(2018, 2026))
+    haro = lag.matrix("srkw", "All pods", "Haro Strait and San Juan Islands")
+    counts = cube.yearly(region="Haro Strait and San Juan Islands")
+    feb29 = sum(counts[i, 59] for i, y in enumerate(cube.years) if calendar.isleap(y))
+    assert np.nansum(haro) == counts.sum() - feb29  # the 365 day calendar drops Feb-29
+    r, n, pooled = lag.corr("albion", "srkw", region="Haro Strait and San Juan Islands")
+    assert list(r.index) == [2024]
+    assert pooled.notnull().any()
@@ -0,0 +1,63 @@
+## Project Name: Orcasound Salmon
+### Program Name: tests/test_fos_report.py
+### Purpose: parse_fos_report on a saved page_source of the FOS test fishery report
+##### Date Created: Oct 18th 2026
+
+import pathlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scrapefunc import parse_fos_report, FOS_COLUMNS
+
+PAGE = (pathlib.Path(__file__).parent / "fixtures" / "fos_report.html").read_text()
+NA = pd.NA
+
+
+def expected():
+    rows = [
+        [21, "Apr", 2024, 200, 3, 2, 60, 0.025, NA, NA, NA, np.nan],
+        [22, "Apr", 2024, 200, 0, 2, 60, 0.0, 1, 1, 30, 0.0333],
+        [23, "Apr", 2024, 200, 3, 2, 15400, 0.19, NA, NA, NA, np.nan],
+        [7, "May", 2024, 200, 12, 2, 60, 0.1, 4, 1, 30, 0.1333],
+    ]
+    dat = pd.DataFrame(rows, columns=FOS_COLUMNS)
+    for col in FOS_COLUMNS:
+        if col != "mon":
+            dat[col] = dat[col].astype("float64" if col.startswith("cpue") else "Int64")
+    return dat
+
+
+def test_saved_report():
+    pd.testing.assert_frame_equal(parse_fos_report(PAGE), expected())
+
+
+def test_thousands_separator():
+    dat = parse_fos_report(PAGE)
+    assert dat.loc[dat["day"] == 23, "effort1"].item() == 15400
+
+
+def test_csv_round_trip(tmp_path):
+    # what scrape_fos writes, read back the way read_years and albion_long read it
+    parse_fos_report(PAGE).to_csv(tmp_path / "fos2024.csv", index=False)
+    back = pd.read_csv(tmp_path / "fos2024.csv", thousands=",")
+    assert back["effort1"].tolist() == [60, 60, 15400, 60]
+
+
+def test_no_table():
+    dat = parse_fos_report("<html><body><p>No data for the selected year</p></body></html>")
+    assert list(dat.columns) == FOS_COLUMNS and dat.empty
+
+
+def test_malformed_row():
+    broken = PAGE.replace("<td>0</td><td>2</td><td>60</td><td>0</td>", "<td>0</td><td>2</td><td>60</td>", 1)
+    assert broken != PAGE
+    with pytest.raises(ValueError, match="row with 11 values instead of 12: 22 \\| Apr"):
+        parse_fos_report(broken)
+
+
+def test_text_in_a_number_cell():
+    broken = PAGE.replace("<td>15,400</td>", "<td>n/a</td>")
+    with pytest.raises(ValueError):
+        parse_fos_report(broken)
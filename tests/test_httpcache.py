@@ -0,0 +1,50 @@
+## Project Name: Orcasound Salmon
+### Program Name: tests/test_httpcache.py
+### Purpose: ETags and 304s for the layout and dependencies, none for callback POSTs
+##### Date Created: Oct 18th 2026
+
+import flask
+import pytest
+
+from httpcache import conditional_responses
+
+
+@pytest.fixture
+def client():
+    server = flask.Flask(__name__)
+    calls = []
+
+    @server.route("/_dash-layout")
+    def layout():
+        calls.append("layout")
+        return flask.jsonify({"props": {}})
+
+    @server.route("/_dash-update-component", methods=["POST"])
+    def update():
+        calls.append("callback")
+        return flask.jsonify({"response": {}})
+
+    conditional_responses(server, lambda: "v1", max_age=60)
+    c = server.test_client()
+    c.calls = calls
+    return c
+
+
+def test_layout_revalidates(client):
+    r = client.get("/_dash-layout")
+    etag = r.headers["ETag"]
+    assert r.headers["Cache-Control"] == "public, max-age=60"
+    again = client.get("/_dash-layout", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["ETag"] == etag
+    # compressed responses carry the encoding in the tag
+    assert client.get("/_dash-layout", headers={"If-None-Match": etag[:-1] + ':br"'}).status_code == 304
+    assert client.calls == ["layout"]
+
+
+def test_callbacks_are_not_tagged(client):
+    body = {"output": "graph.figure", "inputs": []}
+    r = client.post("/_dash-update-component", json=body)
+    assert "ETag" not in r.headers and "Cache-Control" not in r.headers
+    again = client.post("/_dash-update-component", json=body, headers={"If-None-Match": "*"})
+    assert again.status_code == 200
+    assert client.calls == ["callback", "callback"]
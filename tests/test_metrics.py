@@ -0,0 +1,52 @@
+## Project Name: Orcasound Salmon
+### Program Name: tests/test_metrics.py
+### Purpose: Callback labels of the metrics stay within the app's callbacks, and /metrics honours its token
+##### Date Created: Oct 18th 2026
+
+import flask
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def client(monkeypatch):
+    for h in (metrics.CALLBACK_SECONDS, metrics.CALLBACK_BYTES):
+        monkeypatch.setattr(h, "series", {})
+    server = flask.Flask(__name__)
+    metrics.install(server, "v1", callbacks=lambda: {"graph.figure": None}, token="secret")
+
+    @server.route("/_dash-update-component", methods=["POST"])
+    def update():
+        return flask.jsonify({"response": {}})
+
+    return server.test_client()
+
+
+def labels(h):
+    return {k[0] for k in h.series}
+
+
+def test_unknown_outputs_share_one_label(client):
+    client.post("/_dash-update-component", json={"output": "graph.figure"})
+    for i in range(50):
+        client.post("/_dash-update-component", json={"output": "made-up-%d.figure" % i})
+    client.post("/_dash-update-component", json=["not", "a", "dict"])
+    client.post("/_dash-update-component", json={"output": {"id": "x"}})
+    client.post("/_dash-update-component", data="not json")
+    assert labels(metrics.CALLBACK_SECONDS) == {"graph.figure", "unknown"}
+    assert labels(metrics.CALLBACK_BYTES) == {"graph.figure", "unknown"}
+
+
+def test_metrics_token(client):
+    assert client.get("/metrics").status_code == 403
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    r = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert r.status_code == 200
+    assert b'orcasalmon_info{version="v1"' in r.data
+
+
+def test_metrics_open_without_token():
+    server = flask.Flask(__name__)
+    metrics.install(server, "v1")
+    assert server.test_client().get("/metrics").status_code == 200
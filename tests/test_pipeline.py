@@ -0,0 +1,69 @@
+## Project Name: Orcasound Salmon
+### Program Name: tests/test_pipeline.py
+### Purpose: Stage skipping and deploy tracking of the data update manifest
+##### Date Created: Oct 18th 2026
+
+import subprocess
+import sys
+
+from pipeline import Pipeline, MANIFEST_FILE
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def make_app(tmp_path):
+    app = tmp_path / "app"
+    write(app / "app.py", "print('app')\n")
+    write(app / "data" / "foschinook" / "fos2026.csv", "day,mon\n1,Jul\n")
+    return app
+
+
+def test_stage_skipped_when_inputs_and_outputs_unchanged(tmp_path):
+    app = make_app(tmp_path)
+    data = str(app / "data")
+    write(app / "data" / "acartia" / "dump.csv", "created\n2026-07-01\n")
+    runs = []
+
+    def proc():
+        runs.append(1)
+        write(app / "data" / "acartia" / "srkw_2026.csv", "n\n%d\n" % len(runs))
+
+    inputs, outputs = {"dump": "acartia/dump.csv"}, ["acartia/srkw_*.csv"]
+    assert Pipeline(data, str(app)).stage("proc", proc, inputs=inputs, outputs=outputs)
+    assert not Pipeline(data, str(app)).stage("proc", proc, inputs=inputs, outputs=outputs)
+    assert len(runs) == 1
+    write(app / "data" / "acartia" / "dump.csv", "created\n2026-07-02\n")
+    assert Pipeline(data, str(app)).stage("proc", proc, inputs=inputs, outputs=outputs)
+    assert len(runs) == 2
+
+
+def test_deploy_needed_until_marked(tmp_path):
+    app = make_app(tmp_path)
+    data = str(app / "data")
+    pipe = Pipeline(data, str(app))
+    assert pipe.deploy_needed()
+    # the update run only reports, a deploy that failed leaves the deploy needed on the next run
+    assert Pipeline(data, str(app)).deploy_needed()
+    Pipeline(data, str(app)).mark_deployed()
+    assert not Pipeline(data, str(app)).deploy_needed()
+    write(app / "data" / "foschinook" / "fos2026.csv", "day,mon\n1,Jul\n2,Jul\n")
+    assert Pipeline(data, str(app)).deploy_needed()
+    Pipeline(data, str(app)).mark_deployed()
+    write(app / "app.py", "print('new app')\n")
+    assert Pipeline(data, str(app)).deploy_needed()
+
+
+def test_mark_deployed_command(tmp_path):
+    import pipeline
+
+    app = tmp_path / "app"
+    app.mkdir()
+    (app / "pipeline.py").write_text(open(pipeline.__file__).read())
+    write(app / "data" / "foschinook" / "fos2026.csv", "day,mon\n1,Jul\n")
+    subprocess.run([sys.executable, str(app / "pipeline.py"), "--mark-deployed"], check=True,
+                   env={"PYTHONPATH": str(pipeline.APP_PATH)}, cwd=str(tmp_path))
+    assert (app / "data" / MANIFEST_FILE).exists()
+    assert not Pipeline(str(app / "data"), str(app)).deploy_needed()
@@ -0,0 +1,267 @@
+## Project Name: Orcasound Salmon
+### Program Name: tests/test_scrape_years.py
+### Purpose: scrape_years on a DriverPool against local copies of the DFO and DART pages
+##### Date Created: Oct 18th 2026
+
+"""
+There is no chrome on the test machines, so the pool is handed FakeBrowser, which does what the scrapers
+ask of a webdriver on plain html: find elements by id, name or one xpath, type into and click them, submit
+the page's form into a new window (FOS, target="_blank") or as a download (DART, Content-Disposition).
+Downloads are written as <name>.crdownload and renamed a moment later, the way chrome hands them over.
+"""
+
+import os
+import re
+import time
+import threading
+from html.parser import HTMLParser
+from urllib.parse import urlencode, urljoin
+
+import pandas as pd
+import pytest
+import requests
+from selenium.common.exceptions import NoSuchElementException
+
+import scrapefunc
+
+FOS_YEARS = range(2001, 2009)
+BAD_YEAR = 2005
+BON_YEARS = range(2016, 2022)
+
+FOS_FORM = """<html><body><form action="/fos/report" target="_blank">
+<select id="lboYears" name="year"><option>2024</option></select>
+<select id="lboSpecies" name="species"><option>CHINOOK SALMON</option></select>
+<input type="submit" id="cmdRunReport" name="cmdRunReport" value="Run Report">
+</form></body></html>"""
+
+DART_FORM = """<html><body><form action="/dart/report">
+<input type="radio" id="daily" name="span" value="no">
+<input type="radio" id="outputFormat2" name="outputFormat" value="csv">
+<select id="year-select" name="year"></select>
+<select id="proj-select" name="proj"></select>
+<input type="radio" id="calendar" name="startdate" value="1/1" checked>
+<input type="radio" id="run1" name="run" value="" checked>
+<input type="submit" value="Submit">
+</form></body></html>"""
+
+
+def fos_report(year):
+    rows = "".join(
+        "<tr><td>%d Jul %s</td><td>8</td><td>1,%d00</td><td>3</td><td>60</td><td>%d.5</td>"
+        "<td>0</td><td></td><td></td><td></td></tr>" % (day, year, day, day)
+        for day in range(1, 4)
+    )
+    if int(year) == BAD_YEAR:
+        rows += "<tr><td>4 Jul %s</td><td>8</td><td>12</td></tr>" % year
+    return "<html><body><table><tr><th>Date</th><th>Net</th></tr>%s</table></body></html>" % rows
+
+
+def dart_report(year):
+    return "Project,Date,Chinook Run,Chin\n" + "".join(
+        "Bonneville,%s-06-%02d,,%d\n" % (year, day, day * 10) for day in range(1, 4)
+    )
+
+
+def respond(path, query):
+    if path == "/fos/":
+        return 200, {"Content-Type": "text/html"}, FOS_FORM
+    if path == "/fos/report":
+        return 200, {"Content-Type": "text/html"}, fos_report(query["year"])
+    if path == "/dart/":
+        return 200, {"Content-Type": "text/html"}, DART_FORM
+    if path == "/dart/report" and query.get("outputFormat") == "csv" and query.get("proj") == "BON":
+        headers = {"Content-Type": "text/csv", "Content-Disposition": 'attachment; filename="adultdaily_1.csv"'}
+        return 200, headers, dart_report(query["year"])
+    return 404, {}, "not found"
+
+
+class PageParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.elements = []
+        self.form = {}
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {k: "" if v is None else v for k, v in attrs}
+        if tag == "form":
+            self.form = attrs
+        elif tag in ("input", "select"):
+            self.elements.append((tag, attrs))
+
+
+class FakeElement:
+    def __init__(self, window, tag, attrs):
+        self.window = window
+        self.tag = tag
+        self.attrs = attrs
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+    def is_selected(self):
+        return "checked" in self.attrs
+
+    def send_keys(self, keys):
+        self.window["values"][self.attrs["name"]] = keys
+
+    def click(self):
+        if self.attrs.get("type") == "submit":
+            return self.submit()
+        if self.attrs.get("type") == "radio":
+            self.window["values"][self.attrs["name"]] = self.attrs.get("value", "")
+
+    def submit(self):
+        self.window["browser"].submit(self.window)
+
+
+class SwitchTo:
+    def __init__(self, browser):
+        self.browser = browser
+
+    def window(self, handle):
+        self.browser.current_window_handle = handle
+
+
+class FakeBrowser:
+    created = []
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.windows = {}
+        self.count = 0
+        self.current_window_handle = self.open_window()
+        self.switch_to = SwitchTo(self)
+        self.download_path = None
+        self.quit_called = False
+        self.years = []
+        FakeBrowser.created.append(self)
+
+    @property
+    def window_handles(self):
+        return list(self.windows)
+
+    @property
+    def page_source(self):
+        return self.windows[self.current_window_handle]["html"]
+
+    def open_window(self):
+        self.count += 1
+        handle = "w%d" % self.count
+        self.windows[handle] = {"browser": self, "url": None, "html": "", "elements": [], "form": {}, "values": {}}
+        return handle
+
+    def load(self, handle, url):
+        r = self.session.get(url, timeout=10)
+        window = self.windows[handle]
+        window["url"], window["values"] = url, {}
+        if "attachment" in r.headers.get("Content-Disposition", ""):
+            self.download(re.search(r'filename="([^"]+)"', r.headers["Content-Disposition"]).group(1), r.content)
+            return
+        parser = PageParser()
+        parser.feed(r.text)
+        window["html"], window["elements"], window["form"] = r.text, parser.elements, parser.form
+        for tag, attrs in parser.elements:
+            if "checked" in attrs:
+                window["values"][attrs["name"]] = attrs.get("value", "")
+
+    def download(self, name, content):
+        part = os.path.join(self.download_path, name + ".crdownload")
+        with open(part, "wb") as f:
+            f.write(content)
+        threading.Timer(0.3, os.replace, (part, os.path.join(self.download_path, name))).start()
+
+    def get(self, url):
+        self.load(self.current_window_handle, url)
+
+    def submit(self, window):
+        self.years.append(window["values"].get("year"))
+        url = urljoin(window["url"], window["form"]["action"]) + "?" + urlencode(window["values"])
+        if window["form"].get("target") == "_blank":
+            self.load(self.open_window(), url)
+        else:
+            self.load(self.current_window_handle, url)
+
+    def find_element(self, by, value):
+        if by == "xpath":
+            tag, attr, wanted = re.match(r"\.//(\w+)\[@(\w+)='([^']*)'\]", value).groups()
+            match = lambda t, a: t == tag and a.get(attr) == wanted
+        else:
+            match = lambda t, a: a.get(by) == value
+        window = self.windows[self.current_window_handle]
+        for tag, attrs in window["elements"]:
+            if match(tag, attrs):
+                return FakeElement(window, tag, attrs)
+        raise NoSuchElementException(by + "=" + value)
+
+    def execute_script(self, script, *args):
+        if "readyState" in script:
+            return "complete"
+        args[0].click()
+
+    def execute_cdp_cmd(self, cmd, params):
+        assert cmd == "Browser.setDownloadBehavior"
+        self.download_path = params["downloadPath"]
+
+    def close(self):
+        del self.windows[self.current_window_handle]
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def browsers():
+    FakeBrowser.created = []
+    return FakeBrowser.created
+
+
+def test_fos_years_with_a_broken_page(serve, tmp_path, browsers):
+    server = serve(respond)
+    pool = scrapefunc.DriverPool(3, make_driver=FakeBrowser)
+    failed = scrapefunc.scrape_years(scrapefunc.scrape_fos, FOS_YEARS, workers=3, pool=pool,
+                                     spe="CHINOOK SALMON", fos_path=str(tmp_path) + "/", url=server.url + "/fos/")
+    assert list(failed) == [BAD_YEAR]
+    assert isinstance(failed[BAD_YEAR], ValueError)
+    for y in FOS_YEARS:
+        if y != BAD_YEAR:
+            dat = pd.read_csv(tmp_path / ("fos%d.csv" % y))
+            assert dat["year"].tolist() == [y] * 3
+            assert dat["catch1"].tolist() == [1100, 1200, 1300]
+    assert not (tmp_path / ("fos%d.csv" % BAD_YEAR)).exists()
+    # the browser that failed was quit and left the pool, a fresh one took its place
+    broken = [b for b in browsers if str(BAD_YEAR) in b.years]
+    assert len(broken) == 1 and broken[0].quit_called
+    assert broken[0] not in pool.drivers
+    assert len(browsers) <= 4
+    assert all(not b.quit_called for b in pool.drivers)
+    # every browser kept in the pool is back on its form page
+    assert all(list(b.windows) == [b.current_window_handle] for b in pool.drivers)
+    pool.close()
+    assert all(b.quit_called for b in browsers)
+
+
+def test_bon_years_download(serve, tmp_path, browsers):
+    server = serve(respond)
+    started = time.time()
+    failed = scrapefunc.scrape_years(scrapefunc.scrape_bon, BON_YEARS, workers=3,
+                                     pool=scrapefunc.DriverPool(3, make_driver=FakeBrowser),
+                                     bon_path=str(tmp_path) + "/", url=server.url + "/dart/")
+    assert failed == {}
+    for y in BON_YEARS:
+        assert (tmp_path / ("bon%d.csv" % y)).read_text() == dart_report(y)
+    # only the csv files are left, the download folders are removed
+    assert sorted(os.listdir(tmp_path)) == ["bon%d.csv" % y for y in BON_YEARS]
+    # each download waited for its .crdownload to be renamed, three at a time
+    assert time.time() - started >= 0.3 * len(BON_YEARS) / 3
+    assert len(browsers) <= 3
+
+
+def test_downloaded(tmp_path):
+    assert scrapefunc.downloaded(str(tmp_path), "adultdaily") is False
+    (tmp_path / "adultdaily_1.csv.crdownload").write_text("Project")
+    assert scrapefunc.downloaded(str(tmp_path), "adultdaily") is False
+    os.replace(tmp_path / "adultdaily_1.csv.crdownload", tmp_path / "adultdaily_1.csv")
+    assert scrapefunc.downloaded(str(tmp_path), "adultdaily") == str(tmp_path / "adultdaily_1.csv")
@@ -0,0 +1,100 @@
+## Project Name: Orcasound Salmon
+### Program Name: tests/test_watermark.py
+### Purpose: Incremental Acartia updates: watermark ties, appended year files, untouched years left alone
+##### Date Created: Oct 18th 2026
+
+import os
+import json
+
+import pandas as pd
+import pytest
+
+import scrapefunc
+from scrapefunc import read_watermark, write_watermark, newer_than
+
+TIE = "2024-07-03T10:00:00.000Z"
+OLD_MTIME = 1_600_000_000
+
+
+def record(n, created, entry_id=None):
+    return {
+        "type": "Orca",
+        "created": created,
+        "latitude": 48.5,
+        "longitude": -123.1,
+        "no_sighted": n,
+        "data_source_id": "test",
+        "data_source_comments": "J pod heading north",
+        "entry_id": entry_id or "e%d" % n,
+    }
+
+
+def test_newer_than_tie():
+    wm = {"created": "2024-07-03 10:00:00", "entry_ids": ["e1"]}
+    d = pd.DataFrame([record(0, "2024-07-02T10:00:00Z"), record(1, TIE), record(2, TIE), record(3, "2024-07-04T10:00:00Z")])
+    assert newer_than(d, wm).tolist() == [False, False, True, True]
+
+
+def test_write_watermark(tmp_path):
+    path = str(tmp_path) + "/"
+    assert read_watermark(path) is None
+    wm = write_watermark(path, pd.DataFrame([record(1, TIE), record(0, "2024-07-01T00:00:00Z")]))
+    assert wm == {"created": "2024-07-03 10:00:00", "entry_ids": ["e1"]}
+    # a tie adds its ids, an older batch leaves the watermark where it is
+    wm = write_watermark(path, pd.DataFrame([record(2, TIE)]), wm)
+    assert wm["entry_ids"] == ["e1", "e2"]
+    assert write_watermark(path, pd.DataFrame([record(3, "2024-06-01T00:00:00Z")]), wm) == wm
+    assert read_watermark(path) == wm
+
+
+@pytest.fixture
+def acartia(serve, tmp_path, monkeypatch):
+    """
+    run(records): one scrape_acartia + proc_acartia pass with the API serving records
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ACARTIA_TOKEN", "t")
+    served = []
+    server = serve(lambda path, query: (200, {"Content-Type": "application/json"}, json.dumps(served)))
+    path = str(tmp_path) + "/"
+
+    def run(records):
+        served[:] = records
+        scrapefunc.scrape_acartia(path, url=server.url + "/", batch_rows=2)
+        scrapefunc.proc_acartia(path)
+
+    return run, tmp_path
+
+
+def counts(tmp_path, year):
+    return sorted(pd.read_csv(tmp_path / ("srkw_%d.csv" % year))["no_sighted"])
+
+
+def test_two_batches_sharing_a_created_time(acartia):
+    run, tmp_path = acartia
+    first = [record(1, "2023-08-01T09:00:00Z"), record(2, TIE), record(3, TIE), record(4, "2024-07-01T09:00:00Z")]
+    run(first)
+    assert counts(tmp_path, 2023) == [1]
+    assert counts(tmp_path, 2024) == [2, 3, 4]
+    assert read_watermark(str(tmp_path) + "/") == {"created": "2024-07-03 10:00:00", "entry_ids": ["e2", "e3"]}
+    years = sorted(tmp_path.glob("srkw_*.csv"))
+    for f in years:
+        os.utime(f, (OLD_MTIME, OLD_MTIME))
+
+    # e5 was created at the same second as e2 and e3 but only reached the API after the first run
+    second = first + [record(5, TIE), record(6, "2024-07-05T09:00:00Z")]
+    run(second)
+    assert counts(tmp_path, 2023) == [1]
+    assert counts(tmp_path, 2024) == [2, 3, 4, 5, 6]
+    assert read_watermark(str(tmp_path) + "/") == {"created": "2024-07-05 09:00:00", "entry_ids": ["e6"]}
+    dump = pd.read_csv(tmp_path / ("acartia_%s.csv" % scrapefunc.date.today()))
+    assert sorted(dump["entry_id"]) == ["e5", "e6"]
+    # only the year with new records was written again
+    assert [f.name for f in years if f.stat().st_mtime != OLD_MTIME] == ["srkw_2024.csv"]
+
+    # nothing new: no year file is written, the watermark stays
+    os.utime(tmp_path / "srkw_2024.csv", (OLD_MTIME, OLD_MTIME))
+    run(second)
+    assert all(f.stat().st_mtime == OLD_MTIME for f in years)
+    assert counts(tmp_path, 2024) == [2, 3, 4, 5, 6]
+    assert read_watermark(str(tmp_path) + "/")["created"] == "2024-07-05 09:00:00"
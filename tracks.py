@@ -0,0 +1,180 @@
+## Project Name: Orcasound Salmon
+### Program Name: tracks.py
+### Purpose: Satellite tag tracks of Southern Resident orcas, indexed by animal and time and simplified for the map
+##### Date Created: Oct 18th 2026
+
+"""
+data/srkw_satellite_tagging/*.csv are Argos fixes of tagged orcas (NOAA NWFSC, 2012-2016), 54 columns of
+which the map needs six:
+
+    load_tracks(path)       animal, popid, pod, time, latitude, longitude, lc and rank columns,
+                            sorted by animal and time (the frame the data store keeps)
+    tracks = Tracks(frame)  row range of every animal, fix times as int64 seconds
+    tracks.window(a, start, end)           rows of animal a between two times, by binary search
+    tracks.track(a, start, end, 200)       the same rows thinned to at most 200 fixes
+
+lc is the Argos location class as a quality code, 0 (LB) to 5 (L3), see LOCATION_CLASSES.
+rank is how far each fix is from the line through the fixes kept before it in a Douglas-Peucker
+simplification of the whole track (the two ends are inf). Keeping the fixes of the highest rank gives the
+Douglas-Peucker track of that size, so a track of any length is thinned by a partition on rank instead
+of running the simplification again, and a tag with 5,000 fixes costs the map the same as one with 200.
+"""
+
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+TRACK_COLUMNS = {
+    "Animal": "animal",
+    "Popid": "popid",
+    "Thetime": "time",
+    "Lat P": "latitude",
+    "Lon P": "longitude",
+    "Lc94": "lc",
+}
+LOCATION_CLASSES = ["LB", "LA", "L0", "L1", "L2", "L3"]  # worst to best, the index is the lc code
+COLUMNS = ["animal", "popid", "pod", "time", "latitude", "longitude", "lc", "rank"]
+
+
+def load_tracks(path):
+    """
+    Fixes of every csv file in path as one typed frame, sorted by animal and time
+    Example data frame
+    animal   popid pod time                latitude longitude lc rank
+    OoTag050 L84   L   2015-03-16 14:34:59 45.338   -124.042  4  inf
+    """
+    files = sorted(pathlib.Path(path).glob("*.csv")) if path else []
+    if not files:
+        return empty_tracks()
+    d = pd.concat([pd.read_csv(f, usecols=list(TRACK_COLUMNS)) for f in files], ignore_index=True)
+    d = d.rename(columns=TRACK_COLUMNS)
+    d["time"] = pd.to_datetime(d["time"], format="%d%b%y:%H:%M:%S")
+    d["lc"] = d["lc"].map({c: i for i, c in enumerate(LOCATION_CLASSES)}).fillna(0).astype("int8")
+    d = d.dropna(subset=["latitude", "longitude"])
+    d["popid"] = d["popid"].str.replace(" ", "")
+    d["pod"] = pd.Categorical(d["popid"].str[0], categories=["J", "K", "L"])
+    d["animal"] = d["animal"].astype("category")
+    d["popid"] = d["popid"].astype("category")
+    d["latitude"] = d["latitude"].astype("float32")
+    d["longitude"] = d["longitude"].astype("float32")
+    d = d.sort_values(["animal", "time"], kind="stable").reset_index(drop=True)
+    rank = np.empty(len(d), dtype="float32")
+    for lo, hi in _ranges(d["animal"].cat.codes.to_numpy()):
+        rank[lo:hi] = dp_rank(d["longitude"].to_numpy()[lo:hi], d["latitude"].to_numpy()[lo:hi])
+    d["rank"] = rank
+    return d[COLUMNS]
+
+
+def empty_tracks():
+    return pd.DataFrame(
+        {
+            "animal": pd.Categorical([]),
+            "popid": pd.Categorical([]),
+            "pod": pd.Categorical([], categories=["J", "K", "L"]),
+            "time": pd.Series([], dtype="datetime64[ns]"),
+            "latitude": pd.Series([], dtype="float32"),
+            "longitude": pd.Series([], dtype="float32"),
+            "lc": pd.Series([], dtype="int8"),
+            "rank": pd.Series([], dtype="float32"),
+        }
+    )
+
+
+def _ranges(codes):
+    """
+    (first, end) row of every run of equal codes in a sorted code array
+    """
+    starts = np.flatnonzero(np.diff(codes, prepend=-1) != 0) if len(codes) else np.zeros(0, dtype=int)
+    return zip(starts, np.append(starts[1:], len(codes)))
+
+
+def dp_rank(lon, lat):
+    """
+    Douglas-Peucker rank of every point of a line: the distance (degrees of latitude) at which the
+    simplification keeps it, never more than the rank of the point that split its segment off
+    """
+    n = len(lon)
+    rank = np.full(n, np.inf, dtype="float64")
+    if n < 3:
+        return rank
+    y = np.asarray(lat, dtype="float64")
+    x = np.asarray(lon, dtype="float64") * np.cos(np.radians(np.nanmean(y)))  # near equal distances locally
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        a, b, cap = stack.pop()
+        if b - a < 2:
+            continue
+        dist = _segment_distance(x[a + 1 : b], y[a + 1 : b], x[a], y[a], x[b], y[b])
+        i = a + 1 + int(np.argmax(dist))
+        rank[i] = min(dist[i - a - 1], cap)
+        stack += [(a, i, rank[i]), (i, b, rank[i])]
+    return rank
+
+
+def _segment_distance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length = dx * dx + dy * dy
+    t = np.zeros(len(px)) if length == 0 else np.clip(((px - ax) * dx + (py - ay) * dy) / length, 0, 1)
+    return np.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+class Tracks:
+    def __init__(self, frame):
+        """
+        frame: output of load_tracks (or the same frame from the data store)
+        """
+        self.frame = frame
+        self.animals = list(frame["animal"].cat.categories)
+        codes = frame["animal"].cat.codes.to_numpy()
+        self.start = np.searchsorted(codes, np.arange(len(self.animals)), side="left")
+        self.end = np.searchsorted(codes, np.arange(len(self.animals)), side="right")
+        self.t = frame["time"].to_numpy().astype("datetime64[s]").astype("int64")
+        self.lc = frame["lc"].to_numpy()
+        self.rank = frame["rank"].to_numpy()
+        first = frame.groupby("animal", observed=False).first()
+        self.popid = first["popid"].astype(str).tolist()
+        self.pod = first["pod"].astype(str).tolist()
+
+    def window(self, animal, start=None, end=None):
+        """
+        Rows of an animal (its index in animals) with start <= time < end, as a slice
+        start, end: anything pd.Timestamp takes, None for no limit
+        """
+        lo, hi = self.start[animal], self.end[animal]
+        t = self.t[lo:hi]
+        if start is not None:
+            lo += np.searchsorted(t, _seconds(start), side="left")
+        if end is not None:
+            hi = self.start[animal] + np.searchsorted(t, _seconds(end), side="left")
+        return slice(lo, max(lo, hi))
+
+    def track(self, animal, start=None, end=None, max_points=200, min_lc=0):
+        """
+        Rows of an animal's track in a time window, at most max_points of them, in time order
+        Fixes below location class min_lc are left out, the first and last fix of the window are kept
+        """
+        rows = self.window(animal, start, end)
+        idx = np.arange(rows.start, rows.stop)
+        idx = idx[self.lc[idx] >= min_lc]
+        if len(idx) <= max_points:
+            return idx
+        rank = self.rank[idx].astype("float64")
+        rank[[0, -1]] = np.inf
+        keep = np.argpartition(-rank, max_points - 1)[:max_points]
+        return idx[np.sort(keep)]
+
+    def in_window(self, start=None, end=None, pod=None):
+        """
+        Animals (indexes into animals) with fixes between start and end, of one pod ("J", "K", "L") or all
+        """
+        found = []
+        for a in range(len(self.animals)):
+            rows = self.window(a, start, end)
+            if (pod is None or self.pod[a] == pod) and rows.stop > rows.start:
+                found.append(a)
+        return found
+
+
+def _seconds(when):
+    return pd.Timestamp(when).to_datetime64().astype("datetime64[s]").astype("int64")